@@ -0,0 +1,166 @@
+import sys
+import os
+import argparse
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from crm_core import (EXPORT_COLUMNS, SAMPLE_TEMPLATES, CUSTOMER_CATEGORIES,
+                      CONTACT_METHODS, STORED_DATE_FORMAT, TEXT_DTYPE, export_frame)
+
+
+# Synthetic customers and products in the shape of the import templates
+# (SAMPLE_TEMPLATES), for the benchmarks in run.py. Everything is built
+# column-wise from a seeded generator, so a given seed and row count always
+# produce the same data. Emails and phones are unique per row; part of the
+# customers have Arabic names with a Latin transliteration for their email
+# and social handles.
+#
+#   python benchmarks/generate.py --rows 100000 --out data/
+
+
+# (Arabic, Latin) pairs, so both spellings of a name stay together
+ARABIC_FIRST_NAMES = [
+    ('محمد', 'mohamed'), ('أحمد', 'ahmed'), ('علي', 'ali'), ('عمر', 'omar'),
+    ('يوسف', 'youssef'), ('خالد', 'khaled'), ('مصطفى', 'mostafa'), ('حسن', 'hassan'),
+    ('فاطمة', 'fatma'), ('مريم', 'mariam'), ('نور', 'nour'), ('سارة', 'sara'),
+    ('آية', 'aya'), ('هدى', 'hoda'), ('ليلى', 'laila'), ('منى', 'mona')
+]
+ARABIC_LAST_NAMES = [
+    ('الشريف', 'elsherif'), ('المصري', 'elmasry'), ('حسين', 'hussein'),
+    ('إبراهيم', 'ibrahim'), ('عبد الله', 'abdallah'), ('السيد', 'elsayed'),
+    ('النجار', 'elnaggar'), ('الحسيني', 'elhusseiny'), ('فاروق', 'farouk'),
+    ('منصور', 'mansour'), ('سالم', 'salem'), ('القحطاني', 'alqahtani')
+]
+FIRST_NAMES = ['John', 'Jane', 'Michael', 'Sarah', 'David', 'Emma', 'James', 'Olivia',
+               'Robert', 'Sophia', 'William', 'Mia', 'Daniel', 'Lucas', 'Anna', 'Noah']
+LAST_NAMES = ['Doe', 'Smith', 'Johnson', 'Brown', 'Garcia', 'Miller', 'Davis',
+              'Wilson', 'Taylor', 'Clark', 'Lewis', 'Walker']
+# (city, country, calling code)
+LOCATIONS = [
+    ('New York', 'USA', '1'), ('Los Angeles', 'USA', '1'), ('London', 'UK', '44'),
+    ('Cairo', 'Egypt', '20'), ('Alexandria', 'Egypt', '20'), ('Giza', 'Egypt', '20'),
+    ('Riyadh', 'Saudi Arabia', '966'), ('Jeddah', 'Saudi Arabia', '966'),
+    ('Dubai', 'UAE', '971'), ('Amman', 'Jordan', '962'), ('Casablanca', 'Morocco', '212')
+]
+EMAIL_DOMAINS = ['example.com', 'mail.com', 'company.org', 'shop.net']
+COMPANY_SUFFIXES = ['Corp', 'Ltd', 'Group', 'Trading', 'Holdings']
+POSITIONS = ['Manager', 'Director', 'Owner', 'Sales Lead', 'Buyer', 'Engineer']
+STREETS = ['Main St', 'Oak Ave', 'Nile St', 'King Fahd Rd', 'Tahrir Sq', 'Park Lane']
+CUSTOMER_NOTES = ['VIP Customer', 'Regular Customer', 'عميل مميز', 'Prefers mornings', '']
+
+PRODUCT_CATEGORIES = [f'Category {letter}' for letter in 'ABCDEFGHIJKLMNOPQRST']
+PRODUCT_SUPPLIERS = [f'Supplier {number}' for number in range(1, 51)]
+PRODUCT_STATUSES = ['Active', 'Inactive']
+
+REGISTRATION_SPAN_DAYS = 3 * 365
+
+
+def text(values):
+    return pd.Series(values, dtype=TEXT_DTYPE)
+
+
+def pick(rng, choices, rows):
+    return np.asarray(choices, dtype=object)[rng.integers(0, len(choices), rows)]
+
+
+# Blank out about (1 - share) of the values, as optional fields are in
+# real data
+def sometimes(rng, values, share):
+    return values.where(pd.Series(rng.random(len(values)) < share, index=values.index))
+
+
+def generate_customers(rows, seed=0, arabic_share=0.3):
+    rng = np.random.default_rng(seed)
+    number = text(np.arange(1, rows + 1).astype(str))
+    arabic = rng.random(rows) < arabic_share
+
+    first = rng.integers(0, len(ARABIC_FIRST_NAMES), rows)
+    last = rng.integers(0, len(ARABIC_LAST_NAMES), rows)
+    arabic_name = text(np.array([f for f, _ in ARABIC_FIRST_NAMES], dtype=object)[first]) \
+        + ' ' + text(np.array([n for n, _ in ARABIC_LAST_NAMES], dtype=object)[last])
+    arabic_handle = text(np.array([f for _, f in ARABIC_FIRST_NAMES], dtype=object)[first]) \
+        + '.' + text(np.array([n for _, n in ARABIC_LAST_NAMES], dtype=object)[last])
+    first_name = text(pick(rng, FIRST_NAMES, rows))
+    last_name = text(pick(rng, LAST_NAMES, rows))
+    latin_name = first_name + ' ' + last_name
+    latin_handle = first_name.str.lower() + '.' + last_name.str.lower()
+    name = latin_name.where(~arabic, arabic_name)
+    handle = latin_handle.where(~arabic, arabic_handle)
+
+    location = rng.integers(0, len(LOCATIONS), rows)
+    city, country, code = (np.array([loc[i] for loc in LOCATIONS], dtype=object)[location]
+                           for i in range(3))
+    # Unique subscriber numbers: a fixed 9-digit block per row
+    subscriber = text((500000000 + np.arange(rows)).astype(str))
+    alternative = text((700000000 + rng.permutation(rows)).astype(str))
+
+    registered = (pd.Timestamp('2025-01-01')
+                  - pd.to_timedelta(rng.integers(0, REGISTRATION_SPAN_DAYS * 86400, rows),
+                                    unit='s'))
+
+    columns = {
+        'name': name,
+        'email': handle + number + '@' + text(pick(rng, EMAIL_DOMAINS, rows)),
+        'phone': '+' + text(code) + subscriber,
+        'alternative_phone': sometimes(rng, '+' + text(code) + alternative, 0.3),
+        'category': text(pick(rng, CUSTOMER_CATEGORIES, rows)),
+        'facebook': sometimes(rng, 'fb.com/' + handle + number, 0.5),
+        'instagram': sometimes(rng, '@' + handle.str.replace('.', '_', regex=False), 0.4),
+        'twitter': sometimes(rng, '@' + handle.str.replace('.', '', regex=False), 0.2),
+        'linkedin': sometimes(rng, 'linkedin.com/' + handle + number, 0.3),
+        'preferred_contact': text(pick(rng, CONTACT_METHODS, rows)),
+        'company': sometimes(rng, text(pick(rng, LAST_NAMES, rows)) + ' '
+                             + text(pick(rng, COMPANY_SUFFIXES, rows)), 0.6),
+        'position': sometimes(rng, text(pick(rng, POSITIONS, rows)), 0.5),
+        'address': text(rng.integers(1, 999, rows).astype(str)) + ' '
+                   + text(pick(rng, STREETS, rows)),
+        'city': text(city),
+        'country': text(country),
+        'notes': text(pick(rng, CUSTOMER_NOTES, rows)),
+        'registration_date': text(registered.strftime(STORED_DATE_FORMAT))
+    }
+    assert set(columns) >= set(SAMPLE_TEMPLATES['customers'])
+    return pd.DataFrame(columns)[[c for c in EXPORT_COLUMNS['customers'] if c in columns]]
+
+
+def generate_products(rows, seed=0, arabic_share=0.3):
+    rng = np.random.default_rng(seed + 1)
+    number = text(np.arange(1, rows + 1).astype(str))
+    arabic = rng.random(rows) < arabic_share
+    columns = {
+        'product_id': 'PRD' + number.str.zfill(6),
+        'name': ('Product ' + number).where(~arabic, 'منتج ' + number),
+        'category': text(pick(rng, PRODUCT_CATEGORIES, rows)),
+        'price': np.round(rng.lognormal(4, 1, rows), 2),
+        'stock': rng.integers(0, 500, rows),
+        'description': 'Product ' + number + ' description',
+        'supplier': text(pick(rng, PRODUCT_SUPPLIERS, rows)),
+        'status': np.where(rng.random(rows) < 0.9, *PRODUCT_STATUSES).astype(object)
+    }
+    assert list(columns) == list(SAMPLE_TEMPLATES['products'])
+    return pd.DataFrame(columns)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write synthetic CRM import files")
+    parser.add_argument('--rows', type=int, default=100000, help="customer rows")
+    parser.add_argument('--product-rows', type=int, help="default: rows / 10")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--format', choices=['csv', 'xlsx', 'jsonl', 'parquet'],
+                        default='csv', help="any format crm import reads")
+    parser.add_argument('--out', default='.')
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.out, exist_ok=True)
+    product_rows = args.product_rows if args.product_rows is not None else max(args.rows // 10, 1)
+    for table, frame in (('customers', generate_customers(args.rows, args.seed)),
+                         ('products', generate_products(product_rows, args.seed))):
+        file_name = os.path.join(args.out, f"{table}_{len(frame)}.{args.format}")
+        export_frame(frame, file_name, table, args.format)
+        print(f"{file_name}: {len(frame)} rows")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
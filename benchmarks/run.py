@@ -0,0 +1,262 @@
+import sys
+import os
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+import pandas as pd
+from crm_core import (CRMData, SearchIndex, SEARCH_FIELDS, DEFAULT_DATA_FILE, memory_usage,
+                      export_frame)
+from generate import generate_customers, generate_products
+
+
+# Times the CRM hot paths on synthetic data and writes the results as JSON,
+# optionally comparing them with an earlier run:
+#
+#   python benchmarks/run.py --sizes 10000 100000 --output results.json
+#   python benchmarks/run.py --compare results.json
+#   python benchmarks/run.py --import-format parquet
+#
+# For every size a fresh store is filled by importing generated files (in
+# any format generate.py writes, CSV by default), then
+# saved, compacted, reloaded, exported, searched and shown in a table model.
+# Each phase records wall time and the peak resident memory of the process
+# while it ran. The table phases need PyQt5 and run on the offscreen
+# platform; they are skipped when it is not installed.
+
+
+DEFAULT_SIZES = [10000, 100000]
+# Later phases work on what these produce, so they run even when --phases
+# leaves them out; they are just not reported then
+SETUP_PHASES = {'import_customers', 'import_products', 'compact', 'load', 'search_build',
+                'table_refresh'}
+SEARCH_QUERIES = ['john', 'mohamed elsherif', 'محمد', '+20500001', 'example.com', 'cairo vip']
+# Single-product movements, as a POS feed sends them
+STOCK_MOVEMENTS = 10000
+# A phase counts as slower only past both the relative threshold and this
+# many seconds, so sub-millisecond noise is not reported
+REGRESSION_FLOOR_SECONDS = 0.05
+RSS_SAMPLE_SECONDS = 0.005
+# The formats generate.py writes; each one imports back
+IMPORT_FORMATS = ['csv', 'xlsx', 'jsonl', 'parquet']
+
+
+def current_rss():
+    return memory_usage()[0]
+
+
+# Polls the resident set size on a background thread while a phase runs
+class PeakMemory:
+    def __enter__(self):
+        self.peak = current_rss()
+        self.stop = threading.Event()
+        if self.peak is not None:
+            self.thread = threading.Thread(target=self.sample, daemon=True)
+            self.thread.start()
+        return self
+
+    def sample(self):
+        while not self.stop.wait(RSS_SAMPLE_SECONDS):
+            self.peak = max(self.peak, current_rss())
+
+    def __exit__(self, *exc):
+        self.stop.set()
+        if self.peak is not None:
+            self.thread.join()
+            self.peak = max(self.peak, current_rss())
+
+
+class Benchmark:
+    def __init__(self, phases=None):
+        self.phases = phases
+        self.results = []
+
+    def measure(self, size, phase, fn, rows=None):
+        if self.phases and phase not in self.phases:
+            return fn() if phase in SETUP_PHASES else None
+        with PeakMemory() as memory:
+            started = time.perf_counter()
+            result = fn()
+            seconds = time.perf_counter() - started
+        entry = {'size': size, 'phase': phase, 'seconds': round(seconds, 6),
+                 'peak_rss_mb': None if memory.peak is None else round(memory.peak / 2**20, 1)}
+        if rows:
+            entry['rows_per_second'] = round(rows / seconds) if seconds else None
+        self.results.append(entry)
+        print(f"{size:>9,} {phase:<16} {seconds:9.3f} s"
+              + (f" {entry['peak_rss_mb']:9.1f} MB" if memory.peak is not None else ""))
+        return result
+
+
+def table_view():
+    # None when PyQt5 is missing; the table phases are skipped then
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    try:
+        from PyQt5.QtWidgets import QApplication, QTableView
+        from crm_system import DataFrameTableModel
+    except ImportError:
+        return None
+    app = QApplication.instance() or QApplication([])
+    view = QTableView()
+    view.setModel(DataFrameTableModel(view))
+    view.resize(1200, 800)
+    return app, view
+
+
+def run_size(bench, size, work_dir, store_ext, view, import_format='csv'):
+    directory = os.path.join(work_dir, str(size))
+    os.makedirs(directory)
+    customers_file = os.path.join(directory, 'customers.' + import_format)
+    products_file = os.path.join(directory, 'products.' + import_format)
+    export_frame(generate_customers(size), customers_file, 'customers', import_format)
+    export_frame(generate_products(max(size // 10, 1)), products_file, 'products',
+                 import_format)
+    data_file = os.path.join(directory, 'crm_data' + store_ext)
+
+    data = CRMData(data_file)
+    data.load()
+    bench.measure(size, 'import_customers',
+                  lambda: data.import_file('customers', customers_file), rows=size)
+    bench.measure(size, 'import_products',
+                  lambda: data.import_file('products', products_file), rows=size // 10)
+    bench.measure(size, 'save', data.flush)
+    bench.measure(size, 'compact', data.compact)
+    data.close()
+
+    data = CRMData(data_file)
+    bench.measure(size, 'load', data.load, rows=size)
+    bench.measure(size, 'export_csv',
+                  lambda: data.export_table('customers', os.path.join(directory, 'out.csv')),
+                  rows=size)
+    bench.measure(size, 'export_xlsx',
+                  lambda: data.export_table('customers', os.path.join(directory, 'out.xlsx')),
+                  rows=size)
+
+    customers = data.customers
+    index = SearchIndex()
+    bench.measure(size, 'search_build',
+                  lambda: index.build(customers[[f for f in SEARCH_FIELDS
+                                                 if f in customers.columns]]),
+                  rows=size)
+    bench.measure(size, 'search_query',
+                  lambda: [index.search(query) for query in SEARCH_QUERIES])
+
+    product_ids = data.products['product_id'].tolist()
+
+    def move_stock():
+        for i in range(STOCK_MOVEMENTS):
+            data.move_stock([(product_ids[i * 7919 % len(product_ids)],
+                              'sale' if i % 3 else 'receipt', 1 + i % 5)],
+                            allow_negative=True)
+
+    bench.measure(size, 'stock_movements', move_stock, rows=STOCK_MOVEMENTS)
+    bench.measure(size, 'low_stock', lambda: data.low_stock())
+
+    if view is not None:
+        app, table = view
+
+        def refresh():
+            # What update_customers_table does
+            table.model().set_frame(customers)
+            table.resizeColumnsToContents()
+            app.processEvents()
+
+        bench.measure(size, 'table_refresh', refresh, rows=size)
+        bench.measure(size, 'table_sort',
+                      lambda: table.model().sort(0), rows=size)
+        bench.measure(size, 'table_filter',
+                      lambda: table.model().set_row_filter(index.search('cairo')))
+    data.close()
+
+
+def environment():
+    info = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__
+    }
+    try:
+        import pyarrow
+        info['pyarrow'] = pyarrow.__version__
+    except ImportError:
+        pass
+    try:
+        info['commit'] = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        pass
+    return info
+
+
+# Print the phases that got slower than in baseline; returns their number
+def compare(results, baseline, threshold):
+    previous = {(r['size'], r['phase']): r['seconds'] for r in baseline['results']}
+    regressions = 0
+    print(f"\n{'size':>9} {'phase':<16} {'before':>9} {'after':>9} {'change':>8}")
+    for result in results:
+        before = previous.get((result['size'], result['phase']))
+        if before is None:
+            continue
+        after = result['seconds']
+        change = (after - before) / before if before else 0.0
+        slower = change > threshold and after - before > REGRESSION_FLOOR_SECONDS
+        regressions += slower
+        print(f"{result['size']:>9,} {result['phase']:<16} {before:9.3f} {after:9.3f} "
+              f"{change:+8.1%}" + ("  SLOWER" if slower else ""))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the CRM hot paths")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help="customer rows per run, e.g. 10000 100000 1000000")
+    parser.add_argument('--phases', nargs='+', help="only run these phases")
+    parser.add_argument('--store', default=os.path.splitext(DEFAULT_DATA_FILE)[1],
+                        choices=['.arrow', '.json', '.db'], help="store backend")
+    parser.add_argument('--import-format', choices=IMPORT_FORMATS, default='csv',
+                        help="format of the generated files the store is filled from")
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--compare', metavar='BASELINE.json',
+                        help="compare with an earlier --output file")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="relative slowdown reported as a regression (default 0.2)")
+    parser.add_argument('--no-gui', action='store_true', help="skip the table phases")
+    args = parser.parse_args(argv)
+
+    bench = Benchmark(args.phases)
+    view = None if args.no_gui else table_view()
+    work_dir = tempfile.mkdtemp(prefix='crm_bench_')
+    try:
+        for size in args.sizes:
+            run_size(bench, size, work_dir, args.store, view, args.import_format)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {'created': datetime.now().isoformat(timespec='seconds'),
+              'store': args.store, 'import_format': args.import_format,
+              'environment': environment(),
+              'results': bench.results}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            if compare(bench.results, json.load(f), args.threshold):
+                return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
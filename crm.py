@@ -0,0 +1,319 @@
+import sys
+import os
+import csv
+import json
+import argparse
+import pandas as pd
+from crm_core import (CRMData, convert_store, perf, IMPORT_MODES,
+                      EXPORT_FORMATS, ANALYTICS_PRODUCT_GROUPS, DEFAULT_DATA_FILE,
+                      DEDUP_THRESHOLD, find_duplicate_customers, TEMPLATE_TYPES,
+                      TemplateCache, default_template_dir, StockError,
+                      LOW_STOCK_THRESHOLD)
+
+
+# Command line front end over crm_core; nothing here touches PyQt5, so it
+# runs headless in batch jobs, e.g.
+#
+#   python crm.py --data crm_data.arrow import customers customers.csv
+#   python crm.py import customers regions/ extra.xlsx
+#   python crm.py export products products.parquet
+#   python crm.py stats --json
+#   python crm.py dedup --report duplicates.csv
+#   python crm.py template customers_update update.xlsx --language ar
+#   pos-export | python crm.py stock -
+#   python crm.py low-stock --below 5
+#   python crm.py convert crm_data.arrow backup.json
+
+
+STATS_TOP_GROUPS = 10
+STOCK_FLUSH_EVERY = 1000
+
+
+def positive_int(text):
+    try:
+        value = int(text)
+    except ValueError:
+        value = 0
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"expected a positive whole number, got {text!r}")
+    return value
+
+
+def run_import(data, args):
+    if len(args.files) > 1 or os.path.isdir(args.files[0]) or args.workers is not None:
+        return run_import_batch(data, args)
+    file_name = args.files[0]
+    try:
+        summary, rejected = data.import_file(args.table, file_name, args.mode)
+    except ValueError as e:
+        # Missing columns, an unsupported file type or an unreadable file,
+        # e.g. a binary file named .csv
+        print(f"error: {file_name}: {e}", file=sys.stderr)
+        return 1
+    except OSError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    data.flush()
+    print(f"{file_name}: {summary['inserted']} inserted, {summary['updated']} updated, "
+          f"{summary['skipped']} skipped, {len(rejected)} rejected")
+    if len(rejected) and args.errors:
+        rejected.to_csv(args.errors, index=False, encoding='utf-8-sig')
+        print(f"rejected rows written to {args.errors}")
+    return 0
+
+
+def run_import_batch(data, args):
+    try:
+        summary, rejected, results = data.import_batch(args.table, args.files, args.mode,
+                                                       args.workers)
+    except OSError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    data.flush()
+    for result in results:
+        source = result['file'] + (f" [{result['sheet']}]" if result['sheet'] else "")
+        if result['error']:
+            print(f"skipped {source}: {result['error']}", file=sys.stderr)
+        else:
+            print(f"{source}: {result['parsed']} rows")
+    print(f"{len(results)} sources: {summary['inserted']} inserted, "
+          f"{summary['updated']} updated, {summary['skipped']} skipped, "
+          f"{len(rejected)} rejected")
+    if len(rejected) and args.errors:
+        rejected.to_csv(args.errors, index=False, encoding='utf-8-sig')
+        print(f"rejected rows written to {args.errors}")
+    return 0
+
+
+def run_export(data, args):
+    data.export_table(args.table, args.file, args.format)
+    print(f"{args.file}: {data.table_rows(args.table)} rows")
+    return 0
+
+
+def collect_stats(data):
+    analytics = data.analytics
+    return {
+        'customers': analytics.customer_count,
+        'products': analytics.product_count,
+        'stock_value': analytics.stock_value(),
+        'customer_groups': {
+            name: {str(label): int(count) for label, count in
+                   counts.sort_values(ascending=False).head(STATS_TOP_GROUPS).items()}
+            for name, counts in analytics.customer_groups.items()},
+        'stock': {
+            name: {str(label): float(value) for label, value in
+                   analytics.stock[name]['value'].sort_values(ascending=False)
+                   .head(STATS_TOP_GROUPS).items()}
+            for name in ANALYTICS_PRODUCT_GROUPS}
+    }
+
+
+def run_stats(data, args):
+    stats = collect_stats(data)
+    if args.json:
+        print(json.dumps(stats, ensure_ascii=False, indent=2))
+        return 0
+    print(f"Customers: {stats['customers']:,}")
+    print(f"Products: {stats['products']:,}")
+    print(f"Stock value: {stats['stock_value']:,.2f}")
+    for name, counts in stats['customer_groups'].items():
+        print(f"\nCustomers by {name}:")
+        for label, count in counts.items():
+            print(f"  {label}: {count:,}")
+    for name, values in stats['stock'].items():
+        print(f"\nStock value by {name}:")
+        for label, value in values.items():
+            print(f"  {label}: {value:,.2f}")
+    return 0
+
+
+def run_compact(data, args):
+    data.compact()
+    print(f"{data.data_file}: compacted")
+    return 0
+
+
+def run_dedup(data, args):
+    customers = data.customers
+    clusters = find_duplicate_customers(customers, args.threshold, args.workers)
+    print(f"{len(clusters)} clusters, "
+          f"{sum(len(positions) - 1 for positions, _ in clusters)} duplicate customers")
+    if args.report and clusters:
+        report = pd.concat([customers.iloc[positions].assign(cluster=number, score=score)
+                            for number, (positions, score) in enumerate(clusters, 1)])
+        report = report[['cluster', 'score'] + list(customers.columns)]
+        report.to_csv(args.report, index=False, encoding='utf-8-sig')
+        print(f"clusters written to {args.report}")
+    if args.merge:
+        try:
+            removed = data.merge_duplicates([positions for positions, _ in clusters])
+        except ValueError as e:
+            print(f"error: {e}", file=sys.stderr)
+            return 1
+        data.flush()
+        print(f"{removed} customers merged")
+    return 0
+
+
+def run_template(args):
+    TemplateCache(default_template_dir(args.data)).export(args.type, args.file, args.language)
+    print(f"{args.file}: {args.type} template")
+    return 0
+
+
+def run_stock(data, args):
+    # A CSV feed of product_id,kind,quantity lines (kind defaults to sale),
+    # read as it arrives, so a POS can pipe its sales in. Every line is a
+    # transaction of its own: a rejected line is reported and skipped.
+    stream = (sys.stdin if args.feed == '-'
+              else open(args.feed, 'r', newline='', encoding='utf-8-sig'))
+    applied = rejected = 0
+    try:
+        with perf.timed('stock_feed', feed=args.feed) as record:
+            for line, row in enumerate(csv.DictReader(stream), 2):
+                try:
+                    data.move_stock([(row.get('product_id'), row.get('kind') or 'sale',
+                                      row.get('quantity'))], args.allow_negative)
+                except StockError as e:
+                    rejected += 1
+                    print(f"line {line}: {e}", file=sys.stderr)
+                    continue
+                applied += 1
+                if applied % args.flush_every == 0:
+                    data.flush()
+            data.flush()
+            record.update(applied=applied, rejected=rejected)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    print(f"{applied} movements applied, {rejected} rejected; "
+          f"stock value {data.analytics.stock_value():,.2f}")
+    return 0
+
+
+def run_low_stock(data, args):
+    products = data.low_stock(args.below, args.limit)
+    if not len(products):
+        print(f"no products with {args.below} units or fewer")
+        return 0
+    columns = [c for c in ['product_id', 'name', 'category', 'supplier', 'stock']
+               if c in products.columns]
+    print(products[columns].to_string(index=False))
+    return 0
+
+
+def run_convert(args):
+    try:
+        customers, products = convert_store(args.source, args.target)
+    except (FileNotFoundError, FileExistsError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    print(f"{args.target}: {customers} customers, {products} products")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='crm', description="CRM data tools")
+    parser.add_argument('--data', default=os.environ.get('CRM_DATA_FILE', DEFAULT_DATA_FILE),
+                        help=f"data store (default: $CRM_DATA_FILE or {DEFAULT_DATA_FILE})")
+    parser.add_argument('--perf-log', metavar='FILE',
+                        help="append timings of each step to FILE as JSON lines")
+    parser.add_argument('--profile', metavar='OPERATION',
+                        help="run the first OPERATION (load, import, merge, export, "
+                             "save, compact, ...) under cProfile and keep the stats")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser(
+        'import', help="import customers or products from files; several files, "
+                       "folders or multi-sheet workbooks are parsed in parallel. "
+                       "National phone numbers (leading 0) are rejected unless "
+                       "$CRM_PHONE_COUNTRY_CODE is set")
+    command.add_argument('table', choices=['customers', 'products'])
+    command.add_argument('files', nargs='+', metavar='FILE')
+    command.add_argument('--workers', type=positive_int,
+                         help="processes parsing a batch (default: one per CPU)")
+    command.add_argument('--mode', choices=IMPORT_MODES, default='upsert',
+                         help="how customers or products matching existing ones "
+                              "are merged")
+    command.add_argument('--errors', metavar='REPORT.csv',
+                         help="write the rejected rows to this file")
+    command.set_defaults(run=run_import)
+
+    command = commands.add_parser('export', help="export a table to a file")
+    command.add_argument('table', choices=['customers', 'products'])
+    command.add_argument('file')
+    command.add_argument('--format', choices=sorted(set(EXPORT_FORMATS.values())),
+                         help="default: from the file extension")
+    command.set_defaults(run=run_export)
+
+    command = commands.add_parser('stats', help="print counts and top groups")
+    command.add_argument('--json', action='store_true')
+    command.set_defaults(run=run_stats)
+
+    command = commands.add_parser('dedup', help="find near-duplicate customers")
+    command.add_argument('--threshold', type=float, default=DEDUP_THRESHOLD,
+                         help=f"lowest pair score counted as a duplicate "
+                              f"(default {DEDUP_THRESHOLD})")
+    command.add_argument('--workers', type=positive_int,
+                         help="processes comparing names (default: one per CPU)")
+    command.add_argument('--report', metavar='CLUSTERS.csv',
+                         help="write the clustered customers to this file")
+    command.add_argument('--merge', action='store_true',
+                         help="merge every cluster into its first customer")
+    command.set_defaults(run=run_dedup)
+
+    command = commands.add_parser(
+        'stock', help="apply stock movements from a CSV feed with product_id, kind "
+                      "(sale, receipt or count) and quantity columns")
+    command.add_argument('feed', metavar='FEED.csv', help="the feed file, or - for stdin")
+    command.add_argument('--allow-negative', action='store_true',
+                         help="accept sales beyond the units in stock")
+    command.add_argument('--flush-every', type=positive_int, default=STOCK_FLUSH_EVERY,
+                         metavar='N', help=f"save after every N movements "
+                                           f"(default {STOCK_FLUSH_EVERY})")
+    command.set_defaults(run=run_stock)
+
+    command = commands.add_parser('low-stock', help="list the products running out")
+    command.add_argument('--below', type=int, default=LOW_STOCK_THRESHOLD, metavar='UNITS',
+                         help=f"most units in stock listed (default {LOW_STOCK_THRESHOLD})")
+    command.add_argument('--limit', type=positive_int, help="list at most this many products")
+    command.set_defaults(run=run_low_stock)
+
+    command = commands.add_parser('template', help="write an import template")
+    command.add_argument('type', choices=list(TEMPLATE_TYPES))
+    command.add_argument('file')
+    command.add_argument('--language', choices=['en', 'ar'], default='en',
+                         help="language of the column headers (default en)")
+    command.set_defaults(run=run_template, standalone=True)
+
+    command = commands.add_parser('compact', help="rewrite the data file without its journal")
+    command.set_defaults(run=run_compact)
+
+    command = commands.add_parser(
+        'convert', help="copy a whole store into a new one; the format follows "
+                        "the extension (.arrow, .db or .json)")
+    command.add_argument('source')
+    command.add_argument('target')
+    command.set_defaults(run=run_convert, standalone=True)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.perf_log:
+        perf.open(args.perf_log)
+    if args.profile:
+        perf.profile_next(args.profile, os.getcwd())
+    if getattr(args, 'standalone', False):
+        return args.run(args)
+    data = CRMData(args.data)
+    try:
+        data.load()
+        return args.run(data, args)
+    finally:
+        data.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
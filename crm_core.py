@@ -0,0 +1,2919 @@
+import bisect
+import collections
+import concurrent.futures
+import difflib
+import hashlib
+import importlib.util
+import itertools
+import numpy as np
+import pandas as pd
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+import re
+import shutil
+
+# openpyxl takes longer to import than the rest of this module together
+# and is only needed for Excel files, so it is imported where it is used.
+
+
+def memory_usage():
+    # (current, peak) resident memory of the process in bytes; either is
+    # None where the platform does not report it
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return info.rss, getattr(info, 'peak_wset', None)
+    except ImportError:
+        pass
+    current = peak = None
+    try:
+        with open('/proc/self/statm') as f:
+            current = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # KiB on Linux
+    except ImportError:
+        pass
+    return current, peak
+
+
+PERF_HISTORY = 500
+PERF_LOG_MAX_BYTES = 5 * 1024 * 1024
+
+
+# Timing and counters for the hot paths. Each instrumented operation
+# produces one record: operation name, start time, duration, thread,
+# resident and peak memory, plus the counters the code fills in (rows,
+# bytes, table, file, ...). Records are kept in memory for the diagnostics
+# panel, passed to listeners (called on the thread that did the work) and,
+# once open() is given a file, appended to it as JSON lines.
+#
+#   with perf.timed('export', table=table) as record:
+#       ...
+#       record['rows'] = len(frame)
+#
+# profile_next(operation) runs the next occurrence of that operation under
+# cProfile and stores the stats next to the log; only the thread that runs
+# the timed block is profiled.
+class PerfLog:
+    def __init__(self):
+        self.file_name = None
+        self.records = collections.deque(maxlen=PERF_HISTORY)
+        self.listeners = []
+        self.lock = threading.Lock()
+        self.profile_operation = None
+        self.profile_dir = None
+
+    def open(self, file_name):
+        self.file_name = file_name
+
+    def profile_next(self, operation, directory=None):
+        with self.lock:
+            self.profile_operation = operation
+            self.profile_dir = directory
+
+    def _claim_profile(self, operation):
+        with self.lock:
+            if self.profile_operation != operation:
+                return None
+            self.profile_operation = None
+            return self.profile_dir or os.path.dirname(os.path.abspath(self.file_name or '.'))
+
+    @contextmanager
+    def timed(self, operation, **fields):
+        record = {'operation': operation, 'started': datetime.now().isoformat(timespec='milliseconds'),
+                  'thread': threading.current_thread().name}
+        record.update(fields)
+        profile_dir = self._claim_profile(operation)
+        profiler = None
+        if profile_dir is not None:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+        started = time.perf_counter()
+        try:
+            yield record
+        except Exception as e:
+            record['error'] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            record['seconds'] = round(time.perf_counter() - started, 6)
+            if profiler is not None:
+                profiler.disable()
+                stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+                record['profile'] = os.path.join(profile_dir, f"{operation}-{stamp}.prof")
+                profiler.dump_stats(record['profile'])
+            self.emit(record)
+
+    def emit(self, record):
+        record.setdefault('started', datetime.now().isoformat(timespec='milliseconds'))
+        current, peak = memory_usage()
+        if current is not None and peak is not None:
+            peak = max(peak, current)
+        if current is not None:
+            record.setdefault('rss_mb', round(current / 2**20, 1))
+        if peak is not None:
+            record.setdefault('peak_rss_mb', round(peak / 2**20, 1))
+        with self.lock:
+            self.records.append(record)
+            listeners = list(self.listeners)
+            if self.file_name:
+                self._write(record)
+        for listener in listeners:
+            try:
+                listener(record)
+            except Exception:
+                # Diagnostics must never break the operation they measure
+                pass
+
+    def _write(self, record):
+        try:
+            if (os.path.exists(self.file_name) and
+                    os.path.getsize(self.file_name) > PERF_LOG_MAX_BYTES):
+                os.replace(self.file_name, self.file_name + '.1')
+            with open(self.file_name, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+        except OSError:
+            pass
+
+
+perf = PerfLog()
+
+
+def default_perf_log(data_file):
+    # crm_data.arrow -> crm_data.perf.jsonl
+    return os.path.splitext(data_file.rstrip('/\\'))[0] + '.perf.jsonl'
+
+
+# Common interface of the storage backends. CRMData records every mutation
+# through record_insert/record_update/record_delete and calls flush() to
+# make them durable; load() returns the customer and product
+# frames. Small store-wide values such as ID high-water marks live in meta
+# and are changed through record_meta.
+class DataStore:
+    def __init__(self, data_file):
+        self.data_file = data_file
+        self.lock = threading.RLock()
+        self.meta = {}
+
+    @staticmethod
+    def frame_records(frame):
+        # Plain Python values with None for missing ones; tolist() unboxes
+        # numpy scalars far faster than DataFrame.to_dict does
+        names = [str(column) for column in frame.columns]
+        columns = []
+        for j in range(frame.shape[1]):
+            values = frame.iloc[:, j]
+            if pd.api.types.is_datetime64_any_dtype(values.dtype):
+                values = values.dt.strftime(STORED_DATE_FORMAT)
+            values = values.astype(object)
+            columns.append(values.where(values.notna(), None).tolist())
+        return [dict(zip(names, row)) for row in zip(*columns)]
+
+    def load(self):
+        raise NotImplementedError
+
+    def record_insert(self, table, frame):
+        raise NotImplementedError
+
+    def record_update(self, table, key, frame):
+        raise NotImplementedError
+
+    def record_update_records(self, table, key, records):
+        # record_update for a few plain dicts, e.g. only key and stock, so
+        # small frequent changes skip building a frame
+        self.record_update(table, key, pd.DataFrame(records))
+
+    def record_delete(self, table, key, values):
+        raise NotImplementedError
+
+    def record_meta(self, key, value):
+        raise NotImplementedError
+
+    def flush(self):
+        raise NotImplementedError
+
+    def needs_compaction(self):
+        return False
+
+    def compact(self, customers, products):
+        self.flush()
+
+    def compact_async(self, customers, products):
+        pass
+
+    def wait_for_compaction(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+
+# Snapshot + append-only journal persistence. Every mutation is appended to
+# the journal as one JSON line, so a save only writes what changed. Once the
+# journal grows past compact_threshold bytes the current frames are written
+# to a fresh snapshot in a background thread; snapshots and journal trims go
+# through a temp file and os.replace so a crash never leaves a half-written
+# store behind.
+class JournalStore(DataStore):
+    def __init__(self, data_file, compact_threshold=8 * 1024 * 1024):
+        super().__init__(data_file)
+        self.journal_file = data_file + '.journal'
+        self.compact_threshold = compact_threshold
+        self.pending = []
+        self.seq = 0
+        self.compaction_thread = None
+
+    def record_insert(self, table, frame):
+        self._append({'op': 'insert', 'table': table,
+                      'records': self.frame_records(frame)})
+
+    def record_update(self, table, key, frame):
+        self.record_update_records(table, key, self.frame_records(frame))
+
+    def record_update_records(self, table, key, records):
+        self._append({'op': 'update', 'table': table, 'key': key, 'records': records})
+
+    def record_delete(self, table, key, values):
+        self._append({'op': 'delete', 'table': table, 'key': key,
+                      'values': list(values)})
+
+    def record_meta(self, key, value):
+        with self.lock:
+            self.meta[key] = value
+            self._append({'op': 'meta', 'key': key, 'value': value})
+
+    def _append(self, entry):
+        with self.lock:
+            self.seq += 1
+            entry['seq'] = self.seq
+            self.pending.append(json.dumps(entry, ensure_ascii=False, default=str))
+
+    def flush(self):
+        with self.lock:
+            if not self.pending:
+                return 0
+            payload = '\n'.join(self.pending) + '\n'
+            with open(self.journal_file, 'a', encoding='utf-8') as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            self.pending = []
+            return len(payload)
+
+    def journal_size(self):
+        try:
+            return os.path.getsize(self.journal_file)
+        except OSError:
+            return 0
+
+    def needs_compaction(self):
+        return self.journal_size() > self.compact_threshold
+
+    def load(self):
+        tables = {'customers': [], 'products': []}
+        checkpoint = 0
+        if os.path.exists(self.data_file):
+            with open(self.data_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            tables['customers'] = data.get('customers', [])
+            tables['products'] = data.get('products', [])
+            checkpoint = data.get('journal_seq', 0)
+            self.meta = data.get('meta', {})
+        self.seq = checkpoint
+
+        removed = {name: set() for name in tables}
+        key_index = {}
+        for entry in self._read_journal():
+            if entry['seq'] <= checkpoint:
+                continue
+            self.seq = max(self.seq, entry['seq'])
+            if entry['op'] == 'meta':
+                self.meta[entry['key']] = entry['value']
+                continue
+            records = tables.setdefault(entry['table'], [])
+            removed.setdefault(entry['table'], set())
+            if entry['op'] == 'insert':
+                for (table, key), index in key_index.items():
+                    if table == entry['table']:
+                        index.update((record.get(key), len(records) + i)
+                                     for i, record in enumerate(entry['records']))
+                records.extend(entry['records'])
+                continue
+            # Updates and deletes need a key lookup; build it once per table
+            lookup_key = (entry['table'], entry['key'])
+            index = key_index.get(lookup_key)
+            if index is None:
+                index = key_index[lookup_key] = {
+                    record.get(entry['key']): i for i, record in enumerate(records)}
+            if entry['op'] == 'update':
+                for record in entry['records']:
+                    position = index.get(record.get(entry['key']))
+                    if position is None:
+                        index[record.get(entry['key'])] = len(records)
+                        records.append(record)
+                    else:
+                        records[position].update(record)
+            elif entry['op'] == 'delete':
+                for value in entry['values']:
+                    position = index.pop(value, None)
+                    if position is not None:
+                        removed[entry['table']].add(position)
+
+        for name, positions in removed.items():
+            if positions:
+                tables[name] = [r for i, r in enumerate(tables[name]) if i not in positions]
+        return pd.DataFrame(tables['customers']), pd.DataFrame(tables['products'])
+
+    def _read_journal(self):
+        if not os.path.exists(self.journal_file):
+            return
+        with open(self.journal_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn last line from a crash mid-append; skip it
+                    continue
+
+    def checkpoint(self, customers, products, seq=None):
+        with self.lock:
+            seq = self.seq if seq is None else seq
+        data = {
+            'journal_seq': seq,
+            'meta': dict(self.meta),
+            'customers': self.frame_records(customers),
+            'products': self.frame_records(products)
+        }
+        self._write_atomic(self.data_file,
+                           json.dumps(data, ensure_ascii=False, default=str))
+        self._trim_journal(seq)
+
+    def _trim_journal(self, seq):
+        # Drop the entries the snapshot now contains
+        with self.lock:
+            kept = [json.dumps(entry, ensure_ascii=False, default=str)
+                    for entry in self._read_journal() if entry['seq'] > seq]
+            self._write_atomic(self.journal_file,
+                               ''.join(line + '\n' for line in kept))
+
+    def compact(self, customers, products):
+        self.wait_for_compaction()
+        self.flush()
+        self.checkpoint(customers, products)
+
+    def compact_async(self, customers, products):
+        if self.compaction_thread is not None and self.compaction_thread.is_alive():
+            return
+        self.flush()
+        with self.lock:
+            seq = self.seq
+
+        def run(customers, products):
+            with perf.timed('compact', store=type(self).__name__, background=True):
+                self.checkpoint(customers, products, seq)
+
+        self.compaction_thread = threading.Thread(
+            target=run, args=(customers.copy(), products.copy()), daemon=True)
+        self.compaction_thread.start()
+
+    def wait_for_compaction(self):
+        if self.compaction_thread is not None:
+            self.compaction_thread.join()
+
+    @staticmethod
+    def _write_atomic(path, text):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+
+# Columnar snapshot + the same append-only journal. data_file is a
+# directory holding one uncompressed Arrow IPC file per table and
+# snapshot.json, which names the current files and carries journal_seq and
+# meta. Loading memory-maps the Arrow files, so the column buffers are not
+# parsed or copied, and only the journal entries written since the last
+# snapshot are replayed. Each snapshot gets new file names and
+# snapshot.json is replaced last, which makes that replacement the commit
+# point; files of older snapshots are removed once nothing maps them.
+# Snapshot files are named after journal_seq and never rewritten in place,
+# since truncating a mapped file would pull the data out from under the
+# frames that use it.
+#
+# A new store is seeded from legacy_file (a crm_data.json store), which is
+# left in place.
+class ArrowStore(JournalStore):
+    manifest_name = 'snapshot.json'
+
+    def __init__(self, data_file, legacy_file=None, compact_threshold=8 * 1024 * 1024):
+        super().__init__(data_file, compact_threshold)
+        self.legacy_file = legacy_file
+        self.manifest_file = os.path.join(data_file, self.manifest_name)
+        self.journal_file = os.path.join(data_file, 'journal.jsonl')
+        os.makedirs(data_file, exist_ok=True)
+
+    def _read_manifest(self):
+        if not os.path.exists(self.manifest_file):
+            return None
+        with open(self.manifest_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def load(self):
+        import pyarrow as pa
+
+        manifest = self._read_manifest()
+        if manifest is None:
+            return self._migrate()
+        self.meta = manifest.get('meta', {})
+        checkpoint = self.seq = manifest.get('journal_seq', 0)
+        frames = {}
+        for table in ('customers', 'products'):
+            name = manifest['tables'].get(table)
+            if name is None:
+                frames[table] = pd.DataFrame()
+                continue
+            with pa.memory_map(os.path.join(self.data_file, name)) as source:
+                frames[table] = pa.ipc.open_file(source).read_all().to_pandas()
+        self._replay(frames, checkpoint)
+        self._remove_stale_files(manifest)
+        return frames['customers'], frames['products']
+
+    def _migrate(self):
+        customers, products = pd.DataFrame(), pd.DataFrame()
+        if self.legacy_file and os.path.exists(self.legacy_file):
+            legacy = JournalStore(self.legacy_file)
+            customers, products = legacy.load()
+            customers = apply_schema(customers, 'customers')
+            products = apply_schema(products, 'products')
+            self.meta = dict(legacy.meta)
+        self.checkpoint(customers, products)
+        return customers, products
+
+    def _replay(self, frames, checkpoint):
+        # Runs of inserts are concatenated once; an update or delete first
+        # materializes the table and finds its rows through a key -> position
+        # Series, kept until the table next changes shape. As in
+        # JournalStore, the last row wins when a key is duplicated.
+        parts = {table: [frame] for table, frame in frames.items()}
+        lookups = {}
+
+        def materialize(table):
+            if len(parts[table]) > 1:
+                parts[table] = [concat_frames(parts[table])]
+            return parts[table][0]
+
+        def lookup(table, key):
+            if (table, key) not in lookups:
+                frame = materialize(table)
+                keys = (frame[key].astype(object) if key in frame.columns
+                        else [None] * len(frame))
+                positions = pd.Series(np.arange(len(frame)), index=pd.Index(keys))
+                lookups[table, key] = positions[~positions.index.duplicated(keep='last')]
+            return lookups[table, key]
+
+        for entry in self._read_journal():
+            if entry['seq'] <= checkpoint:
+                continue
+            self.seq = max(self.seq, entry['seq'])
+            if entry['op'] == 'meta':
+                self.meta[entry['key']] = entry['value']
+                continue
+            table = entry['table']
+            if entry['op'] == 'insert':
+                parts[table].append(apply_schema(pd.DataFrame(entry['records']), table))
+                lookups = {k: v for k, v in lookups.items() if k[0] != table}
+                continue
+            positions = lookup(table, entry['key'])
+            frame = materialize(table)
+            if entry['op'] == 'update':
+                updates = apply_schema(pd.DataFrame(entry['records']), table)
+                targets = positions.reindex(updates[entry['key']].astype(object)).to_numpy()
+                found = pd.notna(targets)
+                assign_rows(frame, targets[found].astype(np.int64), updates[found])
+                if not found.all():
+                    parts[table].append(updates[~found])
+                    lookups = {k: v for k, v in lookups.items() if k[0] != table}
+            elif entry['op'] == 'delete':
+                drop = positions.reindex(pd.Index(entry['values'], dtype=object)).dropna()
+                if len(drop):
+                    keep = np.ones(len(frame), dtype=bool)
+                    keep[drop.to_numpy().astype(np.int64)] = False
+                    parts[table] = [frame[keep].reset_index(drop=True)]
+                    lookups = {k: v for k, v in lookups.items() if k[0] != table}
+
+        for table in frames:
+            frames[table] = materialize(table)
+
+    @staticmethod
+    def arrow_table(frame):
+        import pyarrow as pa
+
+        # Object columns can mix types (int and str phones); store them as
+        # text so the file has one Arrow type per column
+        columns = {}
+        for name in frame.columns:
+            values = frame[name]
+            if pd.api.types.is_object_dtype(values.dtype):
+                values = values.where(values.isna(), values.astype(str)).astype(TEXT_DTYPE)
+            columns[str(name)] = values
+        return pa.Table.from_pandas(pd.DataFrame(columns, index=frame.index),
+                                    preserve_index=False)
+
+    def checkpoint(self, customers, products, seq=None):
+        import pyarrow as pa
+
+        with self.lock:
+            seq = self.seq if seq is None else seq
+        current = self._read_manifest()
+        if current is not None and current['journal_seq'] == seq:
+            # Nothing was recorded since the last snapshot
+            return
+        tables = {}
+        for table, frame in (('customers', customers), ('products', products)):
+            name = tables[table] = f"{table}-{seq}.arrow"
+            path = os.path.join(self.data_file, name)
+            arrow = self.arrow_table(frame)
+            with open(path + '.tmp', 'wb') as f:
+                with pa.ipc.new_file(f, arrow.schema) as writer:
+                    writer.write_table(arrow)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(path + '.tmp', path)
+        manifest = {'journal_seq': seq, 'meta': dict(self.meta), 'tables': tables}
+        self._write_atomic(self.manifest_file, json.dumps(manifest, ensure_ascii=False,
+                                                          default=str))
+        self._trim_journal(seq)
+        self._remove_stale_files(manifest)
+
+    def _remove_stale_files(self, manifest):
+        current = set(manifest['tables'].values())
+        for name in os.listdir(self.data_file):
+            if name.endswith(('.arrow', '.tmp')) and name not in current:
+                try:
+                    os.remove(os.path.join(self.data_file, name))
+                except OSError:
+                    # Still memory-mapped (Windows); removed on a later run
+                    pass
+
+
+# Embedded SQLite backend. Each table gets real indexed columns, writes go
+# through the indexes in O(log N), and WAL mode keeps readers and the single
+# writer from blocking each other. Statements run as they are recorded and
+# flush() commits the open transaction, so a whole import is one batch.
+# Startup still reads both tables into memory like the other stores do; the
+# grids and indexes work on those frames, not on pages queried from SQLite.
+class SQLiteStore(DataStore):
+    indexes = {
+        'customers': ['customer_id', 'email', 'phone'],
+        'products': ['product_id']
+    }
+
+    def __init__(self, data_file, legacy_file=None):
+        super().__init__(data_file)
+        # A brand-new database is seeded from the JSON store it replaces by
+        # load(), which runs on a worker thread; opening stays cheap
+        self.legacy_file = (legacy_file if not os.path.exists(data_file)
+                            and legacy_file and os.path.exists(legacy_file) else None)
+        self.connection = sqlite3.connect(data_file, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)')
+        self.meta = dict(self.connection.execute('SELECT key, value FROM meta'))
+        self.connection.commit()
+        self.columns = {}
+        for table in self.indexes:
+            self.columns[table] = [row[1] for row in self.connection.execute(
+                f'PRAGMA table_info("{table}")')]
+
+    def _migrate(self):
+        legacy = JournalStore(self.legacy_file)
+        customers, products = legacy.load()
+        for key, value in legacy.meta.items():
+            self.record_meta(key, value)
+        self.record_insert('customers', customers)
+        self.record_insert('products', products)
+        self.flush()
+        self.legacy_file = None
+
+    @staticmethod
+    def _sql_value(value):
+        if value is None or isinstance(value, (str, int, float, bytes)):
+            return value
+        return str(value)
+
+    def _ensure_columns(self, table, names):
+        if not self.columns[table]:
+            # Tables are created from the first batch so they keep its column
+            # order; indexed columns are always present
+            columns = names + [c for c in self.indexes[table] if c not in names]
+            self.connection.execute('CREATE TABLE "{}" ({})'.format(
+                table, ', '.join(f'"{column}"' for column in columns)))
+            for column in self.indexes[table]:
+                self.connection.execute(
+                    f'CREATE INDEX "idx_{table}_{column}" ON "{table}" ("{column}")')
+            self.columns[table] = columns
+            return
+        for name in names:
+            if name not in self.columns[table]:
+                self.connection.execute(f'ALTER TABLE "{table}" ADD COLUMN "{name}"')
+                self.columns[table].append(name)
+
+    def record_insert(self, table, frame):
+        if len(frame) == 0:
+            return
+        names = [str(column) for column in frame.columns]
+        with self.lock:
+            self._ensure_columns(table, names)
+            columns = ', '.join(f'"{name}"' for name in names)
+            placeholders = ', '.join('?' for _ in names)
+            rows = ([self._sql_value(record[name]) for name in names]
+                    for record in self.frame_records(frame))
+            self.connection.executemany(
+                f'INSERT INTO "{table}" ({columns}) VALUES ({placeholders})', rows)
+
+    def record_update(self, table, key, frame):
+        if len(frame):
+            self.record_update_records(table, key, self.frame_records(frame))
+
+    def record_update_records(self, table, key, records):
+        names = [name for name in records[0] if name != key] if records else []
+        if not names or not self.columns[table]:
+            return
+        with self.lock:
+            self._ensure_columns(table, names)
+            assignments = ', '.join(f'"{name}" = ?' for name in names)
+            rows = ([self._sql_value(record[name]) for name in names]
+                    + [self._sql_value(record[key])]
+                    for record in records)
+            self.connection.executemany(
+                f'UPDATE "{table}" SET {assignments} WHERE "{key}" = ?', rows)
+
+    def record_delete(self, table, key, values):
+        if not self.columns[table]:
+            return
+        with self.lock:
+            self.connection.executemany(
+                f'DELETE FROM "{table}" WHERE "{key}" = ?',
+                ([self._sql_value(value)] for value in values))
+
+    def record_meta(self, key, value):
+        with self.lock:
+            self.meta[key] = value
+            self.connection.execute(
+                'INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                (key, self._sql_value(value)))
+
+    def flush(self):
+        with self.lock:
+            self.connection.commit()
+        return 0
+
+    def load(self):
+        if self.legacy_file is not None:
+            self._migrate()
+        with self.lock:
+            return (self._read_table('customers'), self._read_table('products'))
+
+    def _read_table(self, table):
+        if not self.columns[table]:
+            return pd.DataFrame()
+        return pd.read_sql_query(f'SELECT * FROM "{table}" ORDER BY rowid',
+                                 self.connection)
+
+    def compact(self, customers, products):
+        # Fold the WAL back into the database file and reclaim free pages
+        with self.lock:
+            self.connection.commit()
+            self.connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            self.connection.execute('VACUUM')
+
+    def close(self):
+        with self.lock:
+            self.connection.commit()
+            self.connection.close()
+
+
+def open_store(data_file, seed=True):
+    # Pick the backend from the file extension; .db/.sqlite files use SQLite
+    # and .arrow directories the Arrow snapshot, both seeded from
+    # crm_data.json the first time they are created unless seed is false.
+    # Anything else is a JSON snapshot + journal.
+    legacy_file = (os.path.join(os.path.dirname(data_file), LEGACY_DATA_FILE)
+                   if seed else None)
+    if data_file.endswith(('.db', '.sqlite', '.sqlite3')):
+        return SQLiteStore(data_file, legacy_file=legacy_file)
+    if data_file.endswith('.arrow'):
+        return ArrowStore(data_file, legacy_file=legacy_file)
+    return JournalStore(data_file)
+
+
+LEGACY_DATA_FILE = 'crm_data.json'
+DEFAULT_DATA_FILE = ('crm_data.arrow' if importlib.util.find_spec('pyarrow') is not None
+                     else LEGACY_DATA_FILE)
+
+
+# Copy the tables and meta of one store into a new store of any backend,
+# e.g. an Arrow store out to a single crm_data.json for interchange.
+def convert_store(source, target):
+    if not os.path.exists(source):
+        raise FileNotFoundError(f"{source} does not exist")
+    if os.path.exists(target):
+        raise FileExistsError(f"{target} already exists")
+    reader = open_store(source, seed=False)
+    try:
+        customers, products = reader.load()
+        meta = dict(reader.meta)
+    finally:
+        reader.close()
+    customers = apply_schema(customers, 'customers')
+    products = apply_schema(products, 'products')
+    writer = open_store(target, seed=False)
+    try:
+        for key, value in meta.items():
+            writer.record_meta(key, value)
+        writer.record_insert('customers', customers)
+        writer.record_insert('products', products)
+        writer.compact(customers, products)
+    finally:
+        writer.close()
+    return len(customers), len(products)
+
+
+# Column types applied on load and import. Repeated labels are categoricals,
+# registration_date is datetime64 and product price/stock are numeric; every
+# other text column is an Arrow-backed string column when pyarrow is
+# available. Values that do not parse become missing.
+TABLE_SCHEMAS = {
+    'customers': {
+        'category': 'category',
+        'preferred_contact': 'category',
+        'city': 'category',
+        'country': 'category',
+        'status': 'category',
+        'registration_date': 'datetime'
+    },
+    'products': {
+        'category': 'category',
+        'supplier': 'category',
+        'status': 'category',
+        'price': 'float',
+        'stock': 'int'
+    }
+}
+STORED_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def text_dtype():
+    try:
+        return pd.StringDtype('pyarrow', na_value=np.nan)
+    except (ImportError, TypeError):
+        # No pyarrow, or a pandas without NaN-backed string arrays
+        return object
+
+
+TEXT_DTYPE = text_dtype()
+
+
+def parse_dates(values):
+    # The stored format first; anything else goes through the slower
+    # per-value parser
+    dates = pd.to_datetime(values, format=STORED_DATE_FORMAT, errors='coerce')
+    retry = dates.isna() & values.notna()
+    if retry.any():
+        dates[retry] = pd.to_datetime(values[retry].astype(str), format='mixed',
+                                      errors='coerce')
+    return dates
+
+
+def apply_schema(frame, table):
+    schema = TABLE_SCHEMAS[table]
+    converted = {}
+    for name in frame.columns:
+        values = frame[name]
+        kind = schema.get(name)
+        if kind == 'category':
+            if not isinstance(values.dtype, pd.CategoricalDtype):
+                values = values.where(values.isna(), values.astype(str)).astype('category')
+        elif kind == 'datetime':
+            if not pd.api.types.is_datetime64_any_dtype(values.dtype):
+                values = parse_dates(values)
+            # One resolution everywhere; microseconds also box to datetime
+            values = values.astype('datetime64[us]')
+        elif kind == 'float':
+            values = pd.to_numeric(values, errors='coerce').astype('float64')
+        elif kind == 'int':
+            values = pd.to_numeric(values, errors='coerce').round().astype('Int64')
+        elif pd.api.types.is_object_dtype(values.dtype) and TEXT_DTYPE is not object:
+            values = values.where(values.isna(), values.astype(str)).astype(TEXT_DTYPE)
+        converted[name] = values
+    return pd.DataFrame(converted, index=frame.index)
+
+
+def concat_frames(parts):
+    # pd.concat turns categoricals with different categories into object
+    # columns; turn those back into categoricals
+    frame = pd.concat(parts, ignore_index=True)
+    for name in frame.columns:
+        if (not isinstance(frame[name].dtype, pd.CategoricalDtype) and
+                any(name in part.columns and
+                    isinstance(part[name].dtype, pd.CategoricalDtype) for part in parts)):
+            frame[name] = frame[name].astype('category')
+    return frame
+
+
+IMPORT_CHUNK_ROWS = 50000
+IMPORT_EXTENSIONS = ('.xlsx', '.xls', '.csv', '.jsonl', '.parquet')
+
+
+class MissingColumnsError(ValueError):
+    def __init__(self, missing_columns):
+        super().__init__(f"Missing required columns: {', '.join(missing_columns)}")
+        self.missing_columns = missing_columns
+
+
+class UnsupportedFileError(ValueError):
+    def __init__(self, extension):
+        super().__init__(f"Unsupported file type '{extension}'; "
+                         f"expected {', '.join(IMPORT_EXTENSIONS)}")
+
+
+# Stream an import file as DataFrames of at most chunk_rows rows, yielding
+# (chunk, fraction_done). CSV and JSON Lines go through pandas' chunked
+# readers, xlsx through openpyxl's read-only iter_rows and Parquet through
+# its row batches, so memory is bounded by the chunk size. The header is
+# checked before any data row is read.
+def iter_import_chunks(file_name, required_columns, chunk_rows=IMPORT_CHUNK_ROWS,
+                       sheet=None, aliases=None):
+    # sheet names the worksheet of an Excel file; None reads the first one.
+    # aliases maps other headers (e.g. the Arabic ones of a localized
+    # template) to field names.
+    aliases = aliases or {}
+
+    def header_names(columns):
+        return [aliases.get(column, column) for column in columns]
+
+    def check_header(columns):
+        missing = [col for col in required_columns if col not in columns]
+        if missing:
+            raise MissingColumnsError(missing)
+
+    extension = os.path.splitext(file_name)[1].lower()
+    if extension not in IMPORT_EXTENSIONS:
+        raise UnsupportedFileError(extension)
+    if extension == '.xlsx':
+        from openpyxl import load_workbook
+        wb = load_workbook(file_name, read_only=True, data_only=True)
+        try:
+            ws = wb.active if sheet is None else wb[sheet]
+            total_rows = max((ws.max_row or 1) - 1, 1)
+            rows = ws.iter_rows(values_only=True)
+            header = next(rows, ())
+            columns = header_names(str(h).strip() if h is not None else None
+                                   for h in header)
+            check_header(columns)
+            keep = [i for i, column in enumerate(columns) if column is not None]
+            names = [columns[i] for i in keep]
+            batch, done = [], 0
+            for row in rows:
+                if not any(value is not None for value in row):
+                    continue
+                batch.append([row[i] if i < len(row) else None for i in keep])
+                if len(batch) >= chunk_rows:
+                    done += len(batch)
+                    yield pd.DataFrame(batch, columns=names), min(done / total_rows, 1.0)
+                    batch = []
+            if batch:
+                yield pd.DataFrame(batch, columns=names), 1.0
+        finally:
+            wb.close()
+    elif extension == '.jsonl':
+        # One record per line, as written by write_jsonl; values keep the
+        # types they have in the file
+        total_bytes = max(os.path.getsize(file_name), 1)
+        with open(file_name, 'rb') as f:
+            reader = pd.read_json(f, lines=True, chunksize=chunk_rows, dtype=False,
+                                  convert_dates=False)
+            for index, chunk in enumerate(reader):
+                chunk.columns = header_names(chunk.columns)
+                if index == 0:
+                    check_header(chunk.columns)
+                yield chunk, min(f.tell() / total_bytes, 1.0)
+    elif extension == '.xls':
+        # Legacy .xls has no streaming reader; parse once and hand out slices
+        data = pd.read_excel(file_name, sheet_name=0 if sheet is None else sheet)
+        data.columns = header_names(str(column).strip() for column in data.columns)
+        check_header(data.columns)
+        for start in range(0, len(data), chunk_rows):
+            yield data.iloc[start:start + chunk_rows], min((start + chunk_rows) / len(data), 1.0)
+    elif extension == '.parquet':
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet import requires the pyarrow package")
+        with pq.ParquetFile(file_name) as parquet:
+            total_rows = max(parquet.metadata.num_rows, 1)
+            columns = header_names(parquet.schema_arrow.names)
+            check_header(columns)
+            done = 0
+            for batch in parquet.iter_batches(batch_size=chunk_rows):
+                chunk = batch.to_pandas()
+                chunk.columns = columns
+                done += len(chunk)
+                yield chunk, min(done / total_rows, 1.0)
+    else:
+        total_bytes = max(os.path.getsize(file_name), 1)
+        with open(file_name, 'rb') as f:
+            # Every cell is read as text: inference would turn the phone
+            # 01001234567 into the number 1001234567, and could pick a
+            # different type for the same column in each chunk. apply_schema
+            # converts the numeric and date columns afterwards.
+            reader = pd.read_csv(f, chunksize=chunk_rows, dtype=str)
+            for index, chunk in enumerate(reader):
+                chunk.columns = header_names(str(column).strip() for column in chunk.columns)
+                if index == 0:
+                    check_header(chunk.columns)
+                yield chunk, min(f.tell() / total_bytes, 1.0)
+
+
+CUSTOMER_CATEGORIES = ["Real Estate", "Tourism", "E-store", "Retail", "Other"]
+CONTACT_METHODS = ["Email", "Phone", "Facebook", "Instagram", "Twitter", "LinkedIn"]
+REQUIRED_CUSTOMER_FIELDS = ['name', 'email', 'phone']
+CUSTOMER_PHONE_FIELDS = ['phone', 'alternative_phone']
+CUSTOMER_CHOICE_FIELDS = {'category': CUSTOMER_CATEGORIES,
+                          'preferred_contact': CONTACT_METHODS}
+# Patterns go to the vectorized string methods, which compile each one once
+# per column (natively for Arrow-backed strings)
+EMAIL_PATTERN = r'[^@\s]+@[^@\s]+\.[^@\s]+'
+PHONE_PATTERN = r'\+?[\d\s().\-/]+'
+NON_DIGIT_PATTERN = r'\D'
+FLOAT_SUFFIX_PATTERN = r'\.0$'
+# Shorter than E.164 allows for, so local service numbers still pass
+PHONE_MIN_DIGITS = 6
+PHONE_MAX_DIGITS = 15
+# Country code for national numbers (a leading trunk 0, e.g. 0100 123 4567);
+# without one they cannot be made E.164 and are rejected
+PHONE_COUNTRY_CODE = re.sub(r'\D', '', os.environ.get('CRM_PHONE_COUNTRY_CODE', '')) or None
+
+
+def trim_strings(frame):
+    # Strip surrounding whitespace from text cells; blank cells become missing
+    for column in frame.columns:
+        values = frame[column]
+        if not (pd.api.types.is_object_dtype(values) or pd.api.types.is_string_dtype(values)):
+            continue
+        stripped = values.str.strip()
+        text = stripped.notna()
+        frame[column] = values.where(~text, stripped).where(~(text & (stripped == '')), None)
+    return frame
+
+
+def normalize_phone_numbers(values, country_code=PHONE_COUNTRY_CODE):
+    # E.164 style '+<digits>'; a leading 00 international prefix is dropped
+    # and a national trunk 0 is replaced by country_code, or rejected when
+    # there is none. Returns the normalized values and a mask of present but
+    # invalid ones.
+    values = pd.Series(values)
+    present = values.notna()
+    text = values.astype(str).str.replace(FLOAT_SUFFIX_PATTERN, '', regex=True).str.strip()
+    digits = text.str.replace(NON_DIGIT_PATTERN, '', regex=True)
+    international = text.str.startswith('00')
+    digits = digits.where(~international, digits.str[2:])
+    national = ~text.str.startswith('+') & ~international & digits.str.startswith('0')
+    if country_code:
+        digits = digits.where(~national, country_code + digits.str[1:])
+        national = pd.Series(False, index=values.index)
+    lengths = digits.str.len()
+    valid = (text.str.fullmatch(PHONE_PATTERN).fillna(False).astype(bool)
+             & lengths.between(PHONE_MIN_DIGITS, PHONE_MAX_DIGITS) & ~national)
+    normalized = ('+' + digits).where(present & valid, values.astype(object))
+    return normalized.where(present, None), (present & ~valid).to_numpy()
+
+
+# Trim, normalize and check customer rows with whole-column string
+# operations. Returns the valid rows and a report of the rejected ones: their
+# values plus 'row' (the data row number, first_row being the first row of
+# frame) and 'errors'. A bad row never rejects the rest of the batch.
+def validate_customers(frame, first_row=1):
+    original = frame
+    frame = trim_strings(frame.copy())
+    problems = []
+
+    for field in REQUIRED_CUSTOMER_FIELDS:
+        missing = (frame[field].isna().to_numpy() if field in frame.columns
+                   else np.ones(len(frame), dtype=bool))
+        problems.append((missing, f"{field} is required"))
+
+    if 'email' in frame.columns:
+        emails = frame['email']
+        valid = emails.astype(str).str.fullmatch(EMAIL_PATTERN).fillna(False).astype(bool)
+        problems.append(((emails.notna() & ~valid).to_numpy(), "invalid email format"))
+
+    for field in CUSTOMER_PHONE_FIELDS:
+        if field in frame.columns:
+            frame[field], invalid = normalize_phone_numbers(frame[field])
+            problems.append((invalid, f"invalid {field.replace('_', ' ')}"))
+
+    # Choices are matched case-insensitively and stored as spelled in the form
+    for field, choices in CUSTOMER_CHOICE_FIELDS.items():
+        if field in frame.columns:
+            values = frame[field]
+            canonical = values.astype(str).str.lower().map(
+                {choice.lower(): choice for choice in choices})
+            problems.append(((values.notna() & canonical.isna()).to_numpy(),
+                             f"unknown {field.replace('_', ' ')}"))
+            frame[field] = canonical.astype(object).where(values.notna(), None)
+
+    rejected = np.zeros(len(frame), dtype=bool)
+    for mask, _ in problems:
+        rejected |= mask
+    errors = np.full(int(rejected.sum()), '', dtype=object)
+    for mask, message in problems:
+        errors = errors + np.where(mask[rejected], f"{message}; ", '')
+    report = original[rejected].copy()
+    report.insert(0, 'row', np.flatnonzero(rejected) + first_row)
+    report.insert(1, 'errors', pd.Series(errors, dtype=object).str[:-2].to_numpy())
+    return frame[~rejected], report
+
+
+CUSTOMER_ID_PREFIX = 'CUS'
+CUSTOMER_ID_WIDTH = 6
+
+
+# Monotonic, thread-safe allocator for IDs like CUS000001. The high-water
+# mark only ever grows, is persisted through on_advance before any reserved
+# ID is handed out, and is raised by observe() for IDs that arrive from
+# outside (imports), so deletes and overlapping imports never cause a reuse.
+# width is a minimum: numbers past 999999 simply get more digits, and older
+# narrower IDs keep matching the prefix pattern.
+class IdAllocator:
+    def __init__(self, prefix=CUSTOMER_ID_PREFIX, width=CUSTOMER_ID_WIDTH,
+                 high_water=0, on_advance=None):
+        self.prefix = prefix
+        self.width = width
+        self.high_water = int(high_water)
+        self.on_advance = on_advance
+        self.lock = threading.Lock()
+        self.pattern = re.compile(rf'^{re.escape(prefix)}(\d+)$')
+
+    def format(self, number):
+        return f"{self.prefix}{number:0{self.width}d}"
+
+    def reserve(self, count):
+        with self.lock:
+            first = self.high_water + 1
+            self.high_water += count
+            if self.on_advance is not None:
+                self.on_advance(self.high_water)
+        return [self.format(number) for number in range(first, first + count)]
+
+    def next_id(self):
+        return self.reserve(1)[0]
+
+    def observe(self, ids):
+        numbers = pd.Series(ids, dtype=object).dropna().astype(str) \
+                    .str.extract(self.pattern.pattern, expand=False)
+        numbers = pd.to_numeric(numbers, errors='coerce').dropna()
+        if len(numbers) == 0:
+            return
+        highest = int(numbers.max())
+        with self.lock:
+            if highest > self.high_water:
+                self.high_water = highest
+                if self.on_advance is not None:
+                    self.on_advance(self.high_water)
+
+
+IMPORT_MODES = ['upsert', 'skip', 'append']
+
+
+# Both return an object Series with None for a missing key: the string
+# dtype would turn it into NaN, which the index dicts would take for a key.
+def normalize_emails(values):
+    values = pd.Series(values, dtype=object)
+    normalized = values.astype(str).str.strip().str.lower()
+    return normalized.astype(object).where(values.notna() & (normalized != ''), None)
+
+
+def normalize_phones(values):
+    # Digits only, so '+1234567890', '1234567890' and 1234567890 all match
+    values = pd.Series(values, dtype=object)
+    normalized = values.astype(str).str.replace(r'\.0$', '', regex=True) \
+                       .str.replace(r'\D', '', regex=True)
+    return normalized.astype(object).where(values.notna() & (normalized != ''), None)
+
+
+# Hash indexes from customer_id, normalized email and normalized phone to
+# the row position of the customer in the customers table, so an imported
+# row is matched against existing customers in O(1).
+class CustomerIndex:
+    def __init__(self):
+        self.by_id = {}
+        self.by_email = {}
+        self.by_phone = {}
+
+    @staticmethod
+    def _keys(frame):
+        size = len(frame)
+        def column(name, normalize=None):
+            if name not in frame.columns:
+                return [None] * size
+            values = frame[name]
+            if normalize is None:
+                return values.astype(object).where(values.notna(), None).tolist()
+            return normalize(values.to_numpy()).tolist()
+        return (column('customer_id'), column('email', normalize_emails),
+                column('phone', normalize_phones))
+
+    def rebuild(self, frame):
+        self.by_id, self.by_email, self.by_phone = {}, {}, {}
+        self.add_rows(frame, 0)
+
+    def add_rows(self, frame, first_row=None, positions=None):
+        # The first row with a given key keeps it
+        positions = (range(first_row, first_row + len(frame))
+                     if positions is None else positions)
+        for position, keys in zip(positions, zip(*self._keys(frame))):
+            for index, key in zip((self.by_id, self.by_email, self.by_phone), keys):
+                if key is not None and key not in index:
+                    index[key] = position
+
+    def remove_rows(self, frame, first_row=None, positions=None):
+        positions = (range(first_row, first_row + len(frame))
+                     if positions is None else positions)
+        for position, keys in zip(positions, zip(*self._keys(frame))):
+            for index, key in zip((self.by_id, self.by_email, self.by_phone), keys):
+                if key is not None and index.get(key) == position:
+                    del index[key]
+
+    def match(self, customer_id, email, phone):
+        for index, key in ((self.by_id, customer_id), (self.by_email, email),
+                           (self.by_phone, phone)):
+            if key is not None:
+                position = index.get(key)
+                if position is not None:
+                    return position
+        return None
+
+    def plan(self, chunk, mode, first_new_row):
+        # Decide per row whether it is inserted, merged into an existing
+        # customer or skipped. Rows inserted earlier in the same chunk are
+        # matched as well, so duplicates inside one file collapse too. When
+        # several rows match the same existing customer the first one is
+        # merged and the rest are skipped, so targets are unique.
+        # Returns (insert_mask, update_targets, update_rows).
+        insert_mask = np.ones(len(chunk), dtype=bool)
+        update_targets, update_rows = [], []
+        if mode == 'append':
+            return insert_mask, update_targets, update_rows
+        next_row = first_new_row
+        pending = CustomerIndex()
+        claimed = set()
+        for row, keys in enumerate(zip(*self._keys(chunk))):
+            position = self.match(*keys)
+            if position is None:
+                position = pending.match(*keys)
+            if position is None:
+                for index, key in zip((pending.by_id, pending.by_email,
+                                       pending.by_phone), keys):
+                    if key is not None:
+                        index.setdefault(key, next_row)
+                next_row += 1
+                continue
+            insert_mask[row] = False
+            if mode == 'upsert' and position < first_new_row and position not in claimed:
+                claimed.add(position)
+                update_targets.append(position)
+                update_rows.append(row)
+        return insert_mask, update_targets, update_rows
+
+
+STOCK_MOVEMENT_KINDS = ['sale', 'receipt', 'count']
+LOW_STOCK_THRESHOLD = 10
+
+
+def product_key(value):
+    # Products are matched on their ID as trimmed text; a blank ID matches
+    # nothing. Imports, the index and stock movements all go through here.
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    key = str(value).strip()
+    return key or None
+
+
+class StockError(ValueError):
+    pass
+
+
+# product_id -> row position of the products table, plus the indexed
+# products bucketed by units in stock with the stock levels in use kept
+# sorted, so a low-stock query walks the lowest buckets rather than scanning.
+# A stock change moves the product between two buckets in O(1); only when a
+# level appears or empties is it bisected into or out of the level list,
+# which holds one entry per distinct stock level, not per product. details holds
+# what a stock movement needs besides the stock, (ID as stored, price,
+# label per ANALYTICS_PRODUCT_GROUPS name), so it never reads the frame. As in
+# CustomerIndex the first row with an ID keeps it. IDs are kept as text and
+# a missing stock or price counts as 0.
+class ProductIndex:
+    def __init__(self):
+        self.by_id = {}
+        self.units = {}
+        self.details = {}
+        self.by_units = collections.defaultdict(set)  # units -> product IDs
+        self.levels = []  # sorted keys of by_units
+
+    @staticmethod
+    def keys(frame):
+        if 'product_id' not in frame.columns:
+            return np.full(len(frame), None, dtype=object)
+        return frame['product_id'].astype(object).map(product_key).to_numpy(dtype=object)
+
+    @staticmethod
+    def _values(frame):
+        # Units and details, each as a column list
+        def numbers(name, dtype):
+            if name not in frame.columns:
+                return [dtype(0)] * len(frame)
+            return pd.to_numeric(frame[name], errors='coerce').fillna(0).astype(dtype).tolist()
+
+        stored = (frame['product_id'].astype(object).tolist() if 'product_id' in frame.columns
+                  else [None] * len(frame))
+        groups = [group_labels(frame[name] if name in frame.columns
+                               else [None] * len(frame)).tolist()
+                  for name in ANALYTICS_PRODUCT_GROUPS]
+        return numbers('stock', int), list(zip(stored, numbers('price', float), *groups))
+
+    def rebuild(self, frame):
+        self.by_id, self.units, self.details = {}, {}, {}
+        self.by_units, self.levels = collections.defaultdict(set), []
+        self.add_rows(frame, 0)
+
+    def add_rows(self, frame, first_row):
+        keys = pd.Series(self.keys(frame), dtype=object)
+        new = keys.notna() & ~keys.duplicated() & keys.map(self.by_id).isna()
+        rows = np.flatnonzero(new.to_numpy())
+        if len(rows) == 0:
+            return
+        if len(rows) < len(frame):
+            frame = frame.iloc[rows]
+        ids = keys.to_numpy()[rows].tolist()
+        units, details = self._values(frame)
+        self.by_id.update(zip(ids, (rows + first_row).tolist()))
+        self.units.update(zip(ids, units))
+        self.details.update(zip(ids, details))
+        for product_id, level in zip(ids, units):
+            self.by_units[level].add(product_id)
+        self.levels = sorted(self.by_units)
+
+    def update_rows(self, frame, positions):
+        units, details = self._values(frame)
+        for row, (product_id, position) in enumerate(zip(self.keys(frame).tolist(), positions)):
+            if product_id is not None and self.by_id.get(product_id) == position:
+                self.set_units(product_id, units[row])
+                self.details[product_id] = details[row]
+
+    def set_units(self, product_id, units):
+        old = self.units[product_id]
+        if old == units:
+            return
+        bucket = self.by_units[old]
+        bucket.discard(product_id)
+        if not bucket:
+            del self.by_units[old]
+            del self.levels[bisect.bisect_left(self.levels, old)]
+        if units not in self.by_units:
+            bisect.insort(self.levels, units)
+        self.by_units[units].add(product_id)
+        self.units[product_id] = units
+
+    def low_stock(self, threshold, limit=None):
+        # (product_id, units) of the products with at most threshold units,
+        # lowest first, then by product_id
+        result = []
+        for level in self.levels[:bisect.bisect_right(self.levels, int(np.floor(threshold)))]:
+            result += [(product_id, level) for product_id in sorted(self.by_units[level])]
+            if limit is not None and len(result) >= limit:
+                return result[:limit]
+        return result
+
+
+SEARCH_FIELDS = ['name', 'email', 'phone', 'company', 'city', 'notes']
+SEARCH_PHONE_FIELDS = {'phone'}
+
+# Arabic spelling variants that should match each other: diacritics and
+# tatweel are dropped and the alef/yeh/teh marbuta/hamza forms are folded.
+ARABIC_FOLDING = str.maketrans({'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا', 'ى': 'ي',
+                                'ة': 'ه', 'ؤ': 'و', 'ئ': 'ي', 'ـ': None,
+                                **{chr(c): None for c in itertools.chain(
+                                    range(0x0610, 0x061B), range(0x064B, 0x0660),
+                                    [0x0670], range(0x06D6, 0x06EE))}})
+TOKEN_PATTERN = re.compile(r'\w+')
+SEPARATED_TOKEN_PATTERN = re.compile(r'\w+|\0')
+
+
+def search_tokens(text):
+    text = str(text).casefold()
+    if not text.isascii():
+        text = text.translate(ARABIC_FOLDING)
+    return TOKEN_PATTERN.findall(text)
+
+
+# Inverted index from normalized tokens of SEARCH_FIELDS to customer row
+# positions. Rows are indexed in segments: each bulk build or imported chunk
+# becomes one postings array grouped by token in sorted token order, so a
+# prefix term maps to one contiguous slice per segment. Single rows added or
+# changed later go into a small delta index, and the segment postings of
+# changed rows are masked out, so edits never rebuild a segment.
+class SearchIndex:
+    SEGMENT_MIN_ROWS = 1000
+
+    def __init__(self, fields=SEARCH_FIELDS):
+        self.fields = fields
+        self.clear()
+
+    def clear(self):
+        self.segments = []                # (sorted tokens, offsets, rows)
+        self.size = 0
+        self.delta = {}                   # token -> set of rows
+        self.delta_tokens = []            # sorted keys of delta
+        self.delta_row_tokens = {}        # row -> its tokens in delta
+        self.superseded = set()           # rows whose segment postings are stale
+
+    def _field_values(self, frame):
+        for field in self.fields:
+            if field not in frame.columns:
+                continue
+            values = frame[field]
+            if field in SEARCH_PHONE_FIELDS:
+                values = normalize_phones(values.to_numpy())
+            values = values.astype(object)
+            yield values.where(values.notna(), '')
+
+    def _row_tokens(self, frame):
+        fields = [values.astype(str).tolist() for values in self._field_values(frame)]
+        if not fields:
+            return [[] for _ in range(len(frame))]
+        return [search_tokens(' '.join(parts)) for parts in zip(*fields)]
+
+    def _build_segment(self, frame, first_row):
+        count = len(frame)
+
+        # Tokenize the distinct values of each field as one NUL-separated
+        # string; a token's value is the number of separators before it
+        fields, found = [], []
+        for values in self._field_values(frame):
+            codes, uniques = pd.factorize(values)
+            text = '\0'.join(map(str, uniques)).casefold()
+            if not text.isascii():
+                text = text.translate(ARABIC_FOLDING)
+            tokens = SEPARATED_TOKEN_PATTERN.findall(text)
+            separators = np.fromiter(map('\0'.__eq__, tokens), dtype=bool, count=len(tokens))
+            tokens = np.array(tokens, dtype=object)
+            token_values = np.cumsum(separators)[~separators]
+            fields.append((codes, token_values, len(uniques)))
+            found.append(tokens[~separators])
+        if not fields or not sum(map(len, found)):
+            return None
+
+        # Number the distinct tokens in sorted order
+        token_codes, uniques = pd.factorize(np.concatenate(found))
+        uniques = list(uniques)
+        order = sorted(range(len(uniques)), key=uniques.__getitem__)
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order))
+        tokens = [uniques[i] for i in order]
+        token_codes = rank[token_codes]
+
+        # Expand each field's value tokens to the rows holding that value
+        keys, first_token = [], 0
+        for codes, token_values, value_count in fields:
+            lengths = np.bincount(token_values, minlength=value_count)
+            starts = np.cumsum(lengths) - lengths + first_token
+            first_token += len(token_values)
+            row_lengths = lengths[codes]
+            row_ends = np.cumsum(row_lengths)
+            within = np.arange(row_ends[-1] if len(row_ends) else 0) \
+                - np.repeat(row_ends - row_lengths, row_lengths)
+            positions = np.repeat(starts[codes], row_lengths) + within
+            rows = np.repeat(np.arange(count, dtype=np.int64), row_lengths)
+            keys.append(token_codes[positions] * count + rows)
+
+        # Distinct (token, row) pairs sorted by token, then row
+        keys = np.sort(np.concatenate(keys))
+        keys = keys[np.concatenate(([True], keys[1:] != keys[:-1]))]
+        offsets = np.searchsorted(keys // count, np.arange(len(tokens) + 1))
+        return tokens, offsets, keys % count + first_row
+
+    def build(self, frame):
+        self.clear()
+        self.add_rows(frame, 0)
+
+    def needs_rebuild(self):
+        return len(self.segments) > 8 or len(self.delta_row_tokens) > 50000
+
+    def _set_row_tokens(self, row, tokens):
+        for token in self.delta_row_tokens.pop(row, ()):
+            rows = self.delta[token]
+            rows.discard(row)
+            if not rows:
+                del self.delta[token]
+                del self.delta_tokens[bisect.bisect_left(self.delta_tokens, token)]
+        tokens = set(tokens)
+        for token in tokens:
+            if token not in self.delta:
+                bisect.insort(self.delta_tokens, token)
+                self.delta[token] = set()
+            self.delta[token].add(row)
+        self.delta_row_tokens[row] = tokens
+
+    def add_rows(self, frame, first_row):
+        self.size = max(self.size, first_row + len(frame))
+        if len(frame) >= self.SEGMENT_MIN_ROWS or not self.segments:
+            segment = self._build_segment(frame, first_row)
+            if segment is not None:
+                self.segments.append(segment)
+            return
+        for offset, tokens in enumerate(self._row_tokens(frame)):
+            self._set_row_tokens(first_row + offset, tokens)
+
+    def update_rows(self, frame, positions):
+        for position, tokens in zip(positions, self._row_tokens(frame)):
+            self.superseded.add(int(position))
+            self._set_row_tokens(int(position), tokens)
+
+    def search(self, query):
+        # Rows containing every query term, each term matched as a prefix;
+        # None when the query has no terms
+        terms = set(search_tokens(query))
+        if not terms:
+            return None
+        superseded = np.fromiter(self.superseded, dtype=np.int64,
+                                 count=len(self.superseded))
+        matches = None
+        for term in terms:
+            term_matches = np.zeros(self.size, dtype=bool)
+            for tokens, offsets, rows in self.segments:
+                first = bisect.bisect_left(tokens, term)
+                last = bisect.bisect_left(tokens, term + '\U0010ffff')
+                term_matches[rows[offsets[first]:offsets[last]]] = True
+            term_matches[superseded] = False
+            first = bisect.bisect_left(self.delta_tokens, term)
+            last = bisect.bisect_left(self.delta_tokens, term + '\U0010ffff')
+            for token in self.delta_tokens[first:last]:
+                term_matches[np.fromiter(self.delta[token], dtype=np.int64)] = True
+            matches = term_matches if matches is None else matches & term_matches
+        return np.flatnonzero(matches)
+
+
+# Near-duplicate customers. Rows are only compared with rows that share a
+# blocking key: the last digits of a phone (so a number with and without its
+# country code meets), a canonical email (lowercase, no dots or +tag in the
+# local part) or a phonetic key of the name that ignores word order, Arabic
+# spelling variants and Arabic vs Latin script. Blocks larger than
+# DEDUP_MAX_BLOCK_ROWS, such as a very common name, are skipped, so the work
+# stays linear in the number of rows. Candidate pairs are scored on name
+# similarity, shared contacts and city, and pairs scoring at least the
+# threshold are joined into clusters with union-find.
+DEDUP_PHONE_SUFFIX_DIGITS = 9
+DEDUP_MAX_BLOCK_ROWS = 50
+DEDUP_THRESHOLD = 0.7
+DEDUP_NAME_WEIGHT = 0.5
+DEDUP_CONTACT_WEIGHT = 0.4
+DEDUP_CITY_WEIGHT = 0.1
+# Name comparisons handed to each process pool task
+DEDUP_TASK_PAIRS = 100000
+
+ARABIC_TRANSLITERATION = str.maketrans({
+    'ا': 'a', 'ب': 'b', 'ت': 't', 'ث': 'th', 'ج': 'g', 'ح': 'h', 'خ': 'kh', 'د': 'd',
+    'ذ': 'z', 'ر': 'r', 'ز': 'z', 'س': 's', 'ش': 'sh', 'ص': 's', 'ض': 'd', 'ط': 't',
+    'ظ': 'z', 'ع': 'a', 'غ': 'gh', 'ف': 'f', 'ق': 'k', 'ك': 'k', 'ل': 'l', 'م': 'm',
+    'ن': 'n', 'ه': 'h', 'و': 'w', 'ي': 'y', 'ء': None})
+# Latin letters folded onto the sounds the transliteration produces
+LATIN_PHONETIC = str.maketrans({'j': 'g', 'q': 'k', 'c': 'k', 'v': 'f', 'p': 'b'})
+PHONETIC_VOWELS = set('aeiouyw')
+# Written apart in Latin ("El Sherif") but joined in Arabic ("الشريف")
+NAME_ARTICLES = {'al', 'el'}
+REPEATED_LETTER_PATTERN = re.compile(r'(.)\1+')
+
+
+def name_forms(name):
+    # (phonetic key, comparable text) of a name. Both are built from the
+    # sorted transliterated words, so "Doe, John" and "John Doe" agree; the
+    # key also drops vowels after the first letter and doubled letters, so
+    # "Mohamed", "Muhammad" and "محمد" share it.
+    words = []
+    for word in search_tokens(name):
+        word = word.translate(ARABIC_TRANSLITERATION).translate(LATIN_PHONETIC)
+        if words and words[-1] in NAME_ARTICLES:
+            word = words.pop() + word
+        words.append(word)
+    words.sort()
+    keys = []
+    for word in words:
+        first = 'a' if word[0] in 'aeiou' else word[0]
+        keys.append(REPEATED_LETTER_PATTERN.sub(
+            r'\1', first + ''.join(c for c in word[1:] if c not in PHONETIC_VOWELS)))
+    return ' '.join(sorted(keys)) or None, ' '.join(words)
+
+
+def phone_suffixes(values):
+    digits = normalize_phones(values)
+    suffixes = digits.str[-DEDUP_PHONE_SUFFIX_DIGITS:]
+    return suffixes.where(digits.str.len() >= PHONE_MIN_DIGITS, None)
+
+
+def canonical_emails(values):
+    emails = normalize_emails(values)
+    parts = emails.str.rpartition('@')
+    local = parts[0].str.split('+', n=1).str[0].str.replace('.', '', regex=False)
+    return (local + '@' + parts[2]).where(emails.notna(), None)
+
+
+def name_similarities(pairs):
+    # Runs in the process pool, so it only takes and returns plain lists
+    return [difflib.SequenceMatcher(None, a, b).ratio() for a, b in pairs]
+
+
+def block_pairs(keys, max_block_rows=DEDUP_MAX_BLOCK_ROWS):
+    # keys is a list of (kind, values) with one value per row; rows meet
+    # when they have the same value of the same kind. Returns the distinct
+    # candidate pairs (a < b) and how many blocks were too large.
+    size = len(keys[0][1]) if keys else 0
+    values = pd.concat([kind + ':' + pd.Series(values, dtype=object) for kind, values in keys],
+                       ignore_index=True)
+    rows = np.tile(np.arange(size), len(keys))
+    present = values.notna().to_numpy()
+    codes, _ = pd.factorize(values[present])
+    rows = rows[present]
+    order = np.argsort(codes, kind='stable')
+    codes, rows = codes[order], rows[order]
+    sizes = np.bincount(codes) if len(codes) else np.zeros(0, dtype=np.int64)
+    starts = np.cumsum(sizes) - sizes
+
+    # All pairs of the blocks of one size at once, from a (blocks, size)
+    # matrix of their rows
+    pairs = [np.zeros((0, 2), dtype=np.int64)]
+    for block_size in np.unique(sizes[(sizes >= 2) & (sizes <= max_block_rows)]):
+        members = rows[starts[sizes == block_size][:, None] + np.arange(block_size)]
+        first, second = np.triu_indices(block_size, 1)
+        pairs.append(np.stack([members[:, first].ravel(),
+                               members[:, second].ravel()], axis=1))
+    pairs = np.sort(np.concatenate(pairs), axis=1)
+    pairs = np.unique(pairs[pairs[:, 0] != pairs[:, 1]], axis=0)
+    return pairs, int((sizes > max_block_rows).sum())
+
+
+def find_duplicate_customers(frame, threshold=DEDUP_THRESHOLD, workers=None,
+                             max_block_rows=DEDUP_MAX_BLOCK_ROWS, job=None):
+    # Clusters of customers that look like the same person, as a list of
+    # (row positions, best pair score), most certain first, or None when job
+    # was cancelled. Name comparisons are spread over a process pool of
+    # workers processes (default: one per CPU) once there are more than
+    # DEDUP_TASK_PAIRS of them.
+    with perf.timed('dedup', rows=len(frame)) as record:
+        def column(name):
+            return (frame[name].astype(object) if name in frame.columns
+                    else pd.Series([None] * len(frame), dtype=object)).reset_index(drop=True)
+
+        names = column('name')
+        name_codes, unique_names = pd.factorize(names.where(names.notna(), ''))
+        forms = [name_forms(name) for name in unique_names]
+        name_keys = np.array([key for key, _ in forms], dtype=object)[name_codes]
+        phones = phone_suffixes(column('phone')).to_numpy()
+        alternatives = phone_suffixes(column('alternative_phone')).to_numpy()
+        emails = canonical_emails(column('email')).to_numpy()
+        cities = column('city')
+        cities = cities.astype(str).str.strip().str.casefold().where(cities.notna(), None)
+        cities = cities.to_numpy()
+        pairs, skipped = block_pairs([('phone', phones), ('phone', alternatives),
+                                      ('email', emails), ('name', name_keys)],
+                                     max_block_rows)
+        record.update(pairs=len(pairs), skipped_blocks=skipped)
+        if job is not None:
+            if job.cancelled():
+                return None
+            job.report(0.2, f"{len(pairs)} candidate pairs")
+
+        a, b = pairs[:, 0], pairs[:, 1]
+
+        def same(values, other=None):
+            other = values if other is None else other
+            return pd.notna(values[a]) & (values[a] == other[b])
+
+        contact = (same(emails) | same(phones) | same(phones, alternatives)
+                   | same(alternatives, phones) | same(alternatives))
+        city = same(cities)
+
+        # Each distinct pair of names is compared once
+        texts = [text for _, text in forms]
+        name_pairs = name_codes[a].astype(np.int64) * len(texts) + name_codes[b]
+        unique_pairs, inverse = np.unique(name_pairs, return_inverse=True)
+        work = [(texts[p // len(texts)], texts[p % len(texts)]) for p in unique_pairs.tolist()]
+        tasks = [work[i:i + DEDUP_TASK_PAIRS] for i in range(0, len(work), DEDUP_TASK_PAIRS)]
+        similarity = []
+        if len(tasks) > 1 and workers != 1:
+            # Spawned rather than forked: the dashboard calls this from a
+            # worker thread, and forking a threaded process is unsafe
+            pool = concurrent.futures.ProcessPoolExecutor(
+                workers, mp_context=multiprocessing.get_context('spawn'))
+            try:
+                futures = [pool.submit(name_similarities, task) for task in tasks]
+                for done, future in enumerate(futures, 1):
+                    if job is not None and job.cancelled():
+                        return None
+                    similarity += future.result()
+                    if job is not None:
+                        job.report(0.2 + 0.7 * done / len(tasks), "Comparing names")
+            finally:
+                pool.shutdown(cancel_futures=True)
+        else:
+            for done, task in enumerate(tasks, 1):
+                if job is not None and job.cancelled():
+                    return None
+                similarity += name_similarities(task)
+                if job is not None:
+                    job.report(0.2 + 0.7 * done / len(tasks), "Comparing names")
+        similarity = np.asarray(similarity, dtype=float)[inverse.ravel()]
+        if job is not None:
+            if job.cancelled():
+                return None
+            job.report(0.9, "Clustering")
+
+        score = (DEDUP_NAME_WEIGHT * similarity + DEDUP_CONTACT_WEIGHT * contact
+                 + DEDUP_CITY_WEIGHT * city)
+        matched = score >= threshold
+
+        # Union-find over the matched pairs; the lowest row is the root
+        parent = {}
+
+        def root(row):
+            parent.setdefault(row, row)
+            while parent[row] != row:
+                parent[row] = parent[parent[row]]
+                row = parent[row]
+            return row
+
+        for first, second in pairs[matched].tolist():
+            first, second = root(first), root(second)
+            if first != second:
+                parent[max(first, second)] = min(first, second)
+
+        clusters = collections.defaultdict(list)
+        for row in sorted(parent):
+            clusters[root(row)].append(row)
+        best = collections.defaultdict(float)
+        for first, pair_score in zip(a[matched].tolist(), score[matched].tolist()):
+            best[root(first)] = max(best[root(first)], pair_score)
+        result = sorted(((np.array(rows), round(best[top], 3))
+                         for top, rows in clusters.items()),
+                        key=lambda cluster: (-cluster[1], cluster[0][0]))
+        record['clusters'] = len(result)
+        return result
+
+
+# Which rows of updates would change the frame rows at positions; missing
+# values in updates never count as a change.
+def changed_rows(frame, positions, updates):
+    changed = np.zeros(len(positions), dtype=bool)
+    current = frame.iloc[positions]
+    for name in updates.columns:
+        new = updates[name].to_numpy(dtype=object)
+        present = pd.notna(new)
+        if name not in frame.columns:
+            changed |= present
+            continue
+        old = current[name].to_numpy(dtype=object)
+        changed |= present & (old != new)
+    return changed
+
+
+# Write the non-missing values of updates into frame at the given row
+# positions, widening a column to object when the new values do not fit its
+# dtype. Columns the frame does not have yet are added.
+def assign_rows(frame, positions, updates):
+    positions = np.asarray(positions, dtype=np.int64)
+    for name in updates.columns:
+        values = updates[name].to_numpy()
+        present = pd.notna(values)
+        if not present.any():
+            continue
+        if name not in frame.columns:
+            frame[name] = pd.Series([None] * len(frame), index=frame.index, dtype=object)
+        column = frame.columns.get_loc(name)
+        if isinstance(frame[name].dtype, pd.CategoricalDtype):
+            new = pd.Index(pd.unique(values[present])).difference(frame[name].cat.categories)
+            if len(new):
+                frame[name] = frame[name].cat.add_categories(new)
+        try:
+            frame.iloc[positions[present], column] = values[present]
+        except (TypeError, ValueError):
+            frame[name] = frame[name].astype(object)
+            frame.iloc[positions[present], column] = values[present]
+    return frame
+
+
+# Typed sorting and column filters for the table views. A column's sort key
+# is the dense rank of its values (equal values share a rank, missing values
+# are -1). Phones rank by their digits, dates by time, numbers numerically
+# and text case-insensitively, whatever dtype the column ended up with.
+SORT_PHONE_COLUMNS = set(CUSTOMER_PHONE_FIELDS)
+DATE_COLUMNS = {'registration_date'}
+
+
+def sort_ranks(values, name=None):
+    values = pd.Series(values)
+    if (pd.api.types.is_numeric_dtype(values.dtype)
+            or pd.api.types.is_datetime64_any_dtype(values.dtype)):
+        return pd.factorize(values, sort=True)[0]
+    if name in SORT_PHONE_COLUMNS:
+        # Stored phones are '+<digits>'; anything else goes through
+        # normalize_phones. At most 15 digits, so a float holds them exactly.
+        values = values.astype(object)
+        keys = pd.to_numeric(values.astype(str).str.lstrip('+'), errors='coerce')
+        retry = (keys.isna() & values.notna()).to_numpy()
+        if retry.any():
+            keys[retry] = normalize_phones(values[retry].to_numpy()).astype('float64').to_numpy()
+        return pd.factorize(keys, sort=True)[0]
+
+    # Other columns are converted per distinct value, then mapped back
+    codes, uniques = pd.factorize(values.astype(object))
+    uniques = pd.Series(uniques, dtype=object)
+    if name in DATE_COLUMNS:
+        keys = parse_dates(uniques)
+    else:
+        numbers = pd.to_numeric(uniques, errors='coerce')
+        # Numbers that were read into a text column sort as numbers
+        keys = (numbers if numbers.notna().all()
+                else uniques.astype(str).str.casefold())
+    unique_ranks = pd.factorize(keys, sort=True)[0]
+    return np.where(codes < 0, -1, unique_ranks[codes] if len(unique_ranks) else -1)
+
+
+def sort_rows(rows, keys):
+    # rows ordered by keys, a list of (ranks, ascending) with the primary
+    # key first; missing values go last either way and ties keep their order
+    last = np.iinfo(np.int64).max
+    columns = []
+    for ranks, ascending in reversed(keys):
+        ranks = ranks[rows].astype(np.int64)
+        columns.append(np.where(ranks < 0, last, ranks if ascending else -ranks))
+    return rows[np.lexsort(columns)] if columns else rows
+
+
+def value_mask(values, allowed):
+    # Rows whose value, as text, is one of allowed
+    values = pd.Series(values, dtype=object)
+    return (values.notna() & values.astype(str).isin({str(a) for a in allowed})).to_numpy()
+
+
+def date_range_mask(values, start=None, end=None):
+    # Rows dated in [start, end); either bound may be None
+    dates = parse_dates(pd.Series(values))
+    mask = dates.notna()
+    if start is not None:
+        mask &= dates >= pd.Timestamp(start)
+    if end is not None:
+        mask &= dates < pd.Timestamp(end)
+    return mask.to_numpy()
+
+
+# The sort keys and column filters of one table view. filters maps a column
+# to a set of allowed values or a (start, end) date range. Ranks and filter
+# masks are computed once per column and kept until invalidate() is told the
+# column changed, so re-sorting by several columns or toggling a filter is a
+# single np.lexsort or mask lookup over cached arrays.
+class TableQuery:
+    def __init__(self):
+        self.sort_keys = []               # (column, ascending), primary first
+        self.filters = {}
+        self.ranks = {}
+        self.masks = {}
+
+    def active(self):
+        return bool(self.sort_keys or self.filters)
+
+    def invalidate(self, columns=None):
+        if columns is None:
+            self.ranks, self.masks = {}, {}
+            return
+        for column in columns:
+            self.ranks.pop(column, None)
+            self.masks.pop(column, None)
+
+    def set_filter(self, column, condition):
+        # condition None removes the column's filter
+        self.masks.pop(column, None)
+        if condition is None:
+            self.filters.pop(column, None)
+        else:
+            self.filters[column] = condition
+
+    def sort_by(self, column, ascending=True, add=False):
+        # add keeps the current keys and makes column the last one
+        keys = [key for key in self.sort_keys if key[0] != column] if add else []
+        self.sort_keys = keys + [(column, ascending)]
+
+    def rows(self, column_values, rows):
+        # Filter and sort the row positions in rows; column_values(column)
+        # returns a column's values for all rows, or None when it is missing
+        for column, condition in self.filters.items():
+            if column not in self.masks:
+                values = column_values(column)
+                if values is None:
+                    return rows[:0]
+                self.masks[column] = (date_range_mask(values, *condition)
+                                      if isinstance(condition, tuple)
+                                      else value_mask(values, condition))
+            rows = rows[self.masks[column][rows]]
+        keys = []
+        for column, ascending in self.sort_keys:
+            if column not in self.ranks:
+                values = column_values(column)
+                if values is None:
+                    continue
+                self.ranks[column] = sort_ranks(values, column)
+            keys.append((self.ranks[column], ascending))
+        return sort_rows(rows, keys)
+
+
+ANALYTICS_CUSTOMER_GROUPS = ['category', 'country', 'city', 'preferred_contact']
+ANALYTICS_PRODUCT_GROUPS = ['category', 'supplier']
+ANALYTICS_PERIODS = {'day': 'D', 'week': 'W-MON', 'month': 'MS'}
+BLANK_LABEL = '(blank)'
+ANALYTICS_TOP_GROUPS = 50
+
+
+def group_labels(index):
+    labels = pd.Index(index).astype(object)
+    blank = pd.isna(labels) | (labels == '')
+    return labels.where(~np.asarray(blank), BLANK_LABEL)
+
+
+# Aggregates behind the analytics tab, computed once with vectorized
+# groupbys and then kept current from the rows that change: inserted rows
+# add their groupby, removed rows subtract theirs and an update does both,
+# so the tab never rescans the tables. Stock movements only add to running
+# per-group deltas, which are folded into stock the next time it is read.
+# version changes on every update.
+class AnalyticsCache:
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.customer_count = 0
+        self.customer_groups = {name: pd.Series(dtype='int64')
+                                for name in ANALYTICS_CUSTOMER_GROUPS}
+        self.daily_registrations = pd.Series(dtype='int64', index=pd.DatetimeIndex([]))
+        self.product_count = 0
+        # Per group: number of products, units in stock and price x stock
+        self._stock = {name: pd.DataFrame(columns=['products', 'units', 'value'], dtype='float64')
+                       for name in ANALYTICS_PRODUCT_GROUPS}
+        # Per group: label -> [units, value] moved since stock was last read
+        self.stock_moves = {name: {} for name in ANALYTICS_PRODUCT_GROUPS}
+        self.version = 0
+
+    @property
+    def stock(self):
+        for name, moves in self.stock_moves.items():
+            if moves:
+                moved = pd.DataFrame.from_dict(moves, orient='index', columns=['units', 'value'])
+                self._stock[name] = self._stock[name].add(moved, fill_value=0)[
+                    ['products', 'units', 'value']]
+                moves.clear()
+        return self._stock
+
+    def rebuild(self, customers, products):
+        self.clear()
+        self.add_customers(customers)
+        self.add_products(products)
+
+    @staticmethod
+    def _merge(total, part, sign):
+        total = total.add(part * sign, fill_value=0).astype('int64')
+        return total[total != 0]
+
+    def _apply_customers(self, frame, sign):
+        if len(frame) == 0:
+            return
+        self.customer_count += sign * len(frame)
+        for name in ANALYTICS_CUSTOMER_GROUPS:
+            if name in frame.columns:
+                counts = frame[name].value_counts(dropna=False, sort=False)
+                counts = counts.groupby(group_labels(counts.index)).sum()
+            else:
+                counts = pd.Series({BLANK_LABEL: len(frame)})
+            self.customer_groups[name] = self._merge(self.customer_groups[name],
+                                                     counts, sign)
+        if 'registration_date' in frame.columns:
+            days = pd.to_datetime(frame['registration_date'], errors='coerce').dt.floor('D')
+            self.daily_registrations = self._merge(self.daily_registrations,
+                                                   days.value_counts(), sign).sort_index()
+        self.version += 1
+
+    def add_customers(self, frame):
+        self._apply_customers(frame, 1)
+
+    def remove_customers(self, frame):
+        self._apply_customers(frame, -1)
+
+    def update_customers(self, old_rows, new_rows):
+        self._apply_customers(old_rows, -1)
+        self._apply_customers(new_rows, 1)
+
+    def _apply_products(self, frame, sign):
+        if len(frame) == 0:
+            return
+        self.product_count += sign * len(frame)
+
+        def numeric(name):
+            if name not in frame.columns:
+                return pd.Series(0.0, index=frame.index)
+            return pd.to_numeric(frame[name], errors='coerce').astype('float64').fillna(0.0)
+
+        units = numeric('stock')
+        parts = pd.DataFrame({'products': 1.0, 'units': units,
+                              'value': numeric('price') * units}, index=frame.index)
+        for name in ANALYTICS_PRODUCT_GROUPS:
+            keys = (frame[name] if name in frame.columns
+                    else pd.Series(BLANK_LABEL, index=frame.index))
+            grouped = parts.groupby(keys, observed=True, dropna=False).sum()
+            grouped = grouped.groupby(group_labels(grouped.index)).sum()
+            total = self.stock[name].add(grouped * sign, fill_value=0)
+            self.stock[name] = total[total['products'] > 0]
+        self.version += 1
+
+    def add_products(self, frame):
+        self._apply_products(frame, 1)
+
+    def remove_products(self, frame):
+        self._apply_products(frame, -1)
+
+    def update_products(self, old_rows, new_rows):
+        self._apply_products(old_rows, -1)
+        self._apply_products(new_rows, 1)
+
+    def move_stock(self, groups, units, price):
+        # units more (or fewer) in stock of one product; groups are its
+        # labels in ANALYTICS_PRODUCT_GROUPS order
+        value = units * price
+        for name, label in zip(ANALYTICS_PRODUCT_GROUPS, groups):
+            moved = self.stock_moves[name].setdefault(label, [0.0, 0.0])
+            moved[0] += units
+            moved[1] += value
+        self.version += 1
+
+    def registrations(self, period='month'):
+        daily = self.daily_registrations
+        if daily.empty:
+            return daily
+        # Periods are labelled by their first day
+        return daily.resample(ANALYTICS_PERIODS[period], label='left', closed='left').sum()
+
+    def stock_value(self):
+        return float(self.stock[ANALYTICS_PRODUCT_GROUPS[0]]['value'].sum())
+
+
+EXPORT_BATCH_ROWS = 5000
+EXPORT_STYLED_ROW_LIMIT = 200000
+EXPORT_WIDTH_SAMPLE_ROWS = 10000
+
+
+# Column widths from the header and a sample of the rows, measured with
+# vectorized str.len() instead of visiting every written cell.
+def export_column_widths(frame, sample_rows=EXPORT_WIDTH_SAMPLE_ROWS):
+    if len(frame) > sample_rows:
+        sample = frame.sample(n=sample_rows, random_state=0)
+    else:
+        sample = frame
+    widths = []
+    for j, header in enumerate(frame.columns):
+        values = sample.iloc[:, j]
+        lengths = values[values.notna()].astype(str).str.len()
+        longest = int(lengths.max()) if len(lengths) else 0
+        widths.append(max(len(str(header)), longest) + 2)
+    return widths
+
+
+# The named cell styles shared by exports and templates: crm_header,
+# crm_cell and crm_date
+def add_workbook_styles(wb):
+    from openpyxl.styles import PatternFill, Font, Alignment, Border, Side, NamedStyle
+
+    border = Border(left=Side(style='thin'), 
+                  right=Side(style='thin'),
+                  top=Side(style='thin'), 
+                  bottom=Side(style='thin'))
+    wb.add_named_style(NamedStyle(
+        name='crm_header',
+        fill=PatternFill(start_color="1F497D", end_color="1F497D", fill_type="solid"),
+        font=Font(color="FFFFFF", bold=True),
+        alignment=Alignment(horizontal="center", vertical="center"),
+        border=border))
+    wb.add_named_style(NamedStyle(
+        name='crm_cell', border=border, alignment=Alignment(horizontal="left")))
+    wb.add_named_style(NamedStyle(
+        name='crm_date', border=border, alignment=Alignment(horizontal="left"),
+        number_format='yyyy-mm-dd hh:mm:ss'))
+
+
+# Stream frame into a write-only workbook. Rows are written in batches
+# straight from the column arrays and every cell shares one named style,
+# so memory stays flat however many rows are exported. Beyond
+# EXPORT_STYLED_ROW_LIMIT rows the data cells are written unstyled, which
+# is several times faster. job is an optional Job used to report progress
+# and to stop early; returns False when the export was cancelled.
+def write_styled_workbook(frame, file_name, sheet_title, job=None):
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.utils import get_column_letter
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(sheet_title)
+    add_workbook_styles(wb)
+    column_styles = ['crm_date' if pd.api.types.is_datetime64_any_dtype(dtype)
+                     else 'crm_cell' for dtype in frame.dtypes]
+
+    # Column widths have to be set before the first row is streamed
+    for col, width in enumerate(export_column_widths(frame), 1):
+        ws.column_dimensions[get_column_letter(col)].width = width
+
+    header = []
+    for name in frame.columns:
+        cell = WriteOnlyCell(ws, value=str(name))
+        cell.style = 'crm_header'
+        header.append(cell)
+    ws.append(header)
+
+    styled = len(frame) <= EXPORT_STYLED_ROW_LIMIT
+    total_rows = max(len(frame), 1)
+    for start in range(0, len(frame), EXPORT_BATCH_ROWS):
+        if job is not None and job.cancelled():
+            ws.close()
+            return False
+        batch = frame.iloc[start:start + EXPORT_BATCH_ROWS]
+        batch = batch.astype(object).where(batch.notna(), None)
+        columns = [batch.iloc[:, j].to_numpy() for j in range(batch.shape[1])]
+        for values in zip(*columns):
+            if styled:
+                row = []
+                for value, style in zip(values, column_styles):
+                    cell = WriteOnlyCell(ws, value=value)
+                    cell.style = style
+                    row.append(cell)
+                ws.append(row)
+            else:
+                ws.append(values)
+        if job is not None:
+            done = start + len(batch)
+            job.report(0.95 * done / total_rows, f"{done} rows")
+
+    if job is not None:
+        job.report(0.95, "Saving workbook")
+    wb.save(file_name)
+    return True
+
+
+# Sample rows of the import templates; their keys are also the column schema
+# used by every export format.
+SAMPLE_TEMPLATES = {
+    'customers': {
+        'name': ['John Doe', 'Jane Smith'],
+        'email': ['john@example.com', 'jane@example.com'],
+        'phone': ['+1234567890', '+0987654321'],
+        'alternative_phone': ['+1122334455', '+5544332211'],
+        'category': ['Real Estate', 'Tourism'],
+        'facebook': ['fb.com/john', 'fb.com/jane'],
+        'instagram': ['@john_doe', '@jane_smith'],
+        'twitter': ['@johnd', '@janes'],
+        'linkedin': ['linkedin.com/john', 'linkedin.com/jane'],
+        'preferred_contact': ['Email', 'Phone'],
+        'company': ['ABC Corp', 'XYZ Ltd'],
+        'position': ['Manager', 'Director'],
+        'address': ['123 Main St', '456 Oak Ave'],
+        'city': ['New York', 'Los Angeles'],
+        'country': ['USA', 'USA'],
+        'notes': ['VIP Customer', 'Regular Customer']
+    },
+    'products': {
+        'product_id': ['PRD001', 'PRD002'],
+        'name': ['Product 1', 'Product 2'],
+        'category': ['Category A', 'Category B'],
+        'price': [99.99, 149.99],
+        'stock': [100, 50],
+        'description': ['Product 1 description', 'Product 2 description'],
+        'supplier': ['Supplier A', 'Supplier B'],
+        'status': ['Active', 'Active']
+    }
+}
+
+EXPORT_COLUMNS = {
+    'customers': list(SAMPLE_TEMPLATES['customers']) + ['customer_id', 'registration_date'],
+    'products': list(SAMPLE_TEMPLATES['products'])
+}
+
+EXPORT_FORMATS = {
+    '.xlsx': 'xlsx',
+    '.csv': 'csv',
+    '.parquet': 'parquet',
+    '.jsonl': 'jsonl'
+}
+
+EXPORT_FILE_FILTER = ("Excel Files (*.xlsx);;CSV Files (*.csv);;"
+                      "Parquet Files (*.parquet);;JSON Lines (*.jsonl)")
+IMPORT_FILE_FILTER = ("Excel Files (*.xlsx *.xls);;CSV Files (*.csv);;"
+                      "JSON Lines (*.jsonl);;Parquet Files (*.parquet)")
+
+
+# Put frame in the export column order: every schema column (empty when the
+# frame lacks it) followed by any extra columns the frame carries.
+def schema_frame(frame, table):
+    columns = EXPORT_COLUMNS[table]
+    extra = [column for column in frame.columns if column not in columns]
+    return frame.reindex(columns=columns + extra)
+
+
+def export_frame(frame, file_name, table, fmt=None, job=None):
+    fmt = fmt or EXPORT_FORMATS.get(os.path.splitext(file_name)[1].lower(), 'xlsx')
+    writers = {'csv': write_csv, 'parquet': write_parquet, 'jsonl': write_jsonl}
+    if fmt != 'xlsx' and fmt not in writers:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    with perf.timed('export', table=table, format=fmt, file=file_name,
+                    rows=len(frame)) as record:
+        frame = schema_frame(frame, table)
+        if fmt == 'xlsx':
+            title = "Customer Data" if table == 'customers' else "Product Data"
+            completed = write_styled_workbook(frame, file_name, title, job)
+        else:
+            completed = writers[fmt](frame, file_name, job)
+        record['bytes'] = os.path.getsize(file_name) if os.path.exists(file_name) else 0
+        record['completed'] = completed
+    return completed
+
+
+def _export_batches(frame, job):
+    total_rows = max(len(frame), 1)
+    for start in range(0, len(frame), EXPORT_BATCH_ROWS):
+        if job is not None and job.cancelled():
+            return
+        yield start, frame.iloc[start:start + EXPORT_BATCH_ROWS]
+        if job is not None:
+            done = min(start + EXPORT_BATCH_ROWS, len(frame))
+            job.report(done / total_rows, f"{done} rows")
+
+
+def write_csv(frame, file_name, job=None):
+    with open(file_name, 'w', encoding='utf-8', newline='') as f:
+        if len(frame) == 0:
+            frame.to_csv(f, index=False)
+        for start, batch in _export_batches(frame, job):
+            batch.to_csv(f, header=start == 0, index=False)
+    return not (job is not None and job.cancelled())
+
+
+def write_jsonl(frame, file_name, job=None):
+    with open(file_name, 'w', encoding='utf-8') as f:
+        for _, batch in _export_batches(frame, job):
+            text = batch.to_json(orient='records', lines=True,
+                                 force_ascii=False, date_format='iso')
+            # Older pandas leave off the final newline; newer ones add it
+            f.write(text if text.endswith('\n') else text + '\n')
+    return not (job is not None and job.cancelled())
+
+
+def write_parquet(frame, file_name, job=None, compression='zstd'):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export requires the pyarrow package")
+
+    # Text columns can mix types (int and str phones); store them as strings
+    # so every batch has the same Arrow schema
+    fields = []
+    text_columns = []
+    for name, dtype in frame.dtypes.items():
+        if pd.api.types.is_datetime64_any_dtype(dtype):
+            fields.append(pa.field(str(name), pa.timestamp('ns')))
+        elif pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_numeric_dtype(dtype):
+            numpy_dtype = getattr(dtype, 'numpy_dtype', dtype)  # nullable Int64
+            fields.append(pa.field(str(name), pa.from_numpy_dtype(np.dtype(numpy_dtype))))
+        else:
+            fields.append(pa.field(str(name), pa.string()))
+            text_columns.append(name)
+    schema = pa.schema(fields)
+
+    with pq.ParquetWriter(file_name, schema, compression=compression) as writer:
+        for _, batch in _export_batches(frame, job):
+            batch = batch.copy()
+            for name in text_columns:
+                values = batch[name]
+                batch[name] = values.where(values.isna(), values.astype(str)).astype(object)
+            writer.write_table(pa.Table.from_pandas(batch, schema=schema,
+                                                    preserve_index=False))
+    return not (job is not None and job.cancelled())
+
+
+IMPORT_REQUIRED_COLUMNS = {
+    'customers': ['name', 'email', 'phone'],
+    'products': ['product_id', 'name', 'category']
+}
+
+# Localized column headers per table and language; the customer ones are
+# the dashboard's form labels. Templates can be written with them, and
+# imports map them back to the field names.
+TEMPLATE_HEADERS = {
+    'customers': {
+        'ar': {
+            'name': 'الاسم الكامل',
+            'email': 'البريد الإلكتروني',
+            'phone': 'الهاتف',
+            'alternative_phone': 'هاتف بديل',
+            'category': 'الفئة',
+            'customer_id': 'رقم العميل',
+            'registration_date': 'تاريخ التسجيل',
+            'facebook': 'فيسبوك',
+            'instagram': 'انستغرام',
+            'twitter': 'تويتر',
+            'linkedin': 'لينكد إن',
+            'preferred_contact': 'طريقة التواصل المفضلة',
+            'company': 'الشركة',
+            'position': 'المنصب',
+            'address': 'العنوان',
+            'city': 'المدينة',
+            'country': 'البلد',
+            'notes': 'ملاحظات'
+        }
+    },
+    'products': {
+        'ar': {
+            'product_id': 'رقم المنتج',
+            'name': 'اسم المنتج',
+            'category': 'الفئة',
+            'price': 'السعر',
+            'stock': 'المخزون',
+            'description': 'الوصف',
+            'supplier': 'المورد',
+            'status': 'الحالة'
+        }
+    }
+}
+
+IMPORT_HEADER_ALIASES = {
+    table: {header: field for headers in languages.values() for field, header in headers.items()}
+    for table, languages in TEMPLATE_HEADERS.items()
+}
+
+# The import templates: the table each one imports into, its columns (with
+# sample rows from SAMPLE_TEMPLATES plus any given here) and how an import
+# uses its rows, for the Instructions sheet
+TEMPLATE_TYPES = {
+    'customers': {
+        'table': 'customers',
+        'columns': list(SAMPLE_TEMPLATES['customers']),
+        'usage': "Each row is added as a new customer, or merged into the customer "
+                 "with the same email or phone"
+    },
+    'customers_update': {
+        'table': 'customers',
+        'columns': ['customer_id', 'name', 'email', 'phone', 'category', 'preferred_contact',
+                    'company', 'position', 'address', 'city', 'country', 'notes'],
+        'samples': {'customer_id': ['CUS000001', 'CUS000002']},
+        'usage': "Each row updates the customer with the same customer ID, email or "
+                 "phone; import it with Update duplicates"
+    },
+    'products': {
+        'table': 'products',
+        'columns': list(SAMPLE_TEMPLATES['products']),
+        'usage': "Each row is added as a product"
+    }
+}
+# Bump when write_template changes what it writes, so cached templates
+# are rebuilt
+TEMPLATE_FORMAT_VERSION = 1
+RIGHT_TO_LEFT_LANGUAGES = {'ar'}
+TEMPLATE_INSTRUCTIONS_SHEET = 'Instructions'
+
+
+def template_samples(template_type):
+    spec = TEMPLATE_TYPES[template_type]
+    samples = dict(SAMPLE_TEMPLATES[spec['table']], **spec.get('samples', {}))
+    return pd.DataFrame({column: samples[column] for column in spec['columns']})
+
+
+# Write the template_type template, headed with headers (field name ->
+# header; unlisted fields keep their name), and its Instructions sheet
+def write_template(file_name, template_type, language='en', headers=None):
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.utils import get_column_letter
+
+    spec = TEMPLATE_TYPES[template_type]
+    headers = headers or {}
+    label = template_type.replace('_', ' ')
+    frame = template_samples(template_type)
+    frame.columns = [headers.get(column, column) for column in frame.columns]
+
+    wb = Workbook(write_only=True)
+    add_workbook_styles(wb)
+    ws = wb.create_sheet(f"{label.title()} Template")
+    ws.sheet_view.rightToLeft = language in RIGHT_TO_LEFT_LANGUAGES
+    ws.freeze_panes = 'A2'
+    for col, width in enumerate(export_column_widths(frame), 1):
+        ws.column_dimensions[get_column_letter(col)].width = width
+    for style, values in [('crm_header', frame.columns)] + \
+            [('crm_cell', row) for row in frame.astype(object).to_numpy()]:
+        row = []
+        for value in values:
+            cell = WriteOnlyCell(ws, value=value)
+            cell.style = style
+            row.append(cell)
+        ws.append(row)
+
+    instructions = [
+        "Instructions for using this template:",
+        "",
+        f"1. This is a sample {label} template with example data",
+        "2. Replace the example data with your actual data",
+        "3. Keep the column headers exactly as they are",
+        "4. Save the file and use it to import into the CRM system",
+        f"5. {spec['usage']}",
+        "",
+        "Required fields:"
+    ] + [f"- {headers[field]} ({field})" if field in headers else f"- {field}"
+         for field in IMPORT_REQUIRED_COLUMNS[spec['table']]]
+    ws = wb.create_sheet(TEMPLATE_INSTRUCTIONS_SHEET)
+    ws.column_dimensions['A'].width = max(len(line) for line in instructions) + 2
+    for line in instructions:
+        ws.append([line])
+    wb.save(file_name)
+
+
+def template_key(template_type, language, headers):
+    # Hash of everything a template is built from, so a change to its
+    # columns, sample rows, headers or instructions gives a new key
+    spec = TEMPLATE_TYPES[template_type]
+    source = {'version': TEMPLATE_FORMAT_VERSION, 'type': template_type,
+              'language': language, 'spec': spec, 'headers': headers,
+              'required': IMPORT_REQUIRED_COLUMNS[spec['table']],
+              'samples': template_samples(template_type).to_dict('list')}
+    text = json.dumps(source, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+
+def default_template_dir(data_file):
+    # crm_data.arrow -> crm_data.templates/
+    return os.path.splitext(data_file.rstrip('/\\'))[0] + '.templates'
+
+
+# Built templates, kept as files in directory named by template_key. A
+# template is written the first time it is asked for and only copied after
+# that, across runs too; once the schema behind it changes its key does as
+# well, so it is rebuilt on the next request and the stale file removed.
+class TemplateCache:
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, template_type, language='en', headers=None):
+        # headers defaults to TEMPLATE_HEADERS for language; English
+        # templates are headed with the field names
+        if headers is None:
+            table = TEMPLATE_TYPES[template_type]['table']
+            headers = TEMPLATE_HEADERS[table].get(language, {})
+        prefix = f"{template_type}.{language}."
+        file_name = os.path.join(self.directory,
+                                 f"{prefix}{template_key(template_type, language, headers)}.xlsx")
+        if not os.path.exists(file_name):
+            with perf.timed('template', type=template_type, language=language):
+                os.makedirs(self.directory, exist_ok=True)
+                temp_name = file_name + '.tmp'
+                write_template(temp_name, template_type, language, headers)
+                os.replace(temp_name, file_name)
+            for name in os.listdir(self.directory):
+                if name.startswith(prefix) and name != os.path.basename(file_name):
+                    try:
+                        os.remove(os.path.join(self.directory, name))
+                    except OSError:
+                        pass
+        return file_name
+
+    def export(self, template_type, target, language='en', headers=None):
+        shutil.copyfile(self.path(template_type, language, headers), target)
+
+
+class ValidationError(ValueError):
+    def __init__(self, report):
+        super().__init__('; '.join(report['errors']))
+        self.report = report
+
+
+def prepare_import_rows(table, chunk, first_row=1):
+    # Validation, registration dates and the column schema for imported
+    # rows; see CRMData.prepare_chunk
+    if table == 'customers':
+        chunk, rejected = validate_customers(chunk, first_row)
+        if 'registration_date' not in chunk.columns:
+            chunk['registration_date'] = datetime.now().strftime(STORED_DATE_FORMAT)
+    else:
+        rejected = chunk.iloc[:0]
+    return apply_schema(chunk, table), rejected
+
+
+def import_sources(paths):
+    # Expand files and folders into (file, sheet) pairs. Every sheet of an
+    # .xlsx workbook is a source of its own, except the Instructions sheet
+    # of a template; sheet None stands for the only or first one.
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(os.path.join(path, name) for name in os.listdir(path)
+                                if name.lower().endswith(IMPORT_EXTENSIONS)
+                                and not name.startswith('~$')))
+        else:
+            files.append(path)
+    sources = []
+    for file_name in files:
+        if file_name.lower().endswith('.xlsx'):
+            from openpyxl import load_workbook
+            wb = load_workbook(file_name, read_only=True)
+            try:
+                sources.extend((file_name, name) for name in wb.sheetnames
+                               if name != TEMPLATE_INSTRUCTIONS_SHEET)
+            finally:
+                wb.close()
+        else:
+            sources.append((file_name, None))
+    return sources
+
+
+def parse_import_source(table, file_name, sheet=None, aliases=None):
+    # Read and prepare one source of a batch import. This runs in the
+    # process pool, so failures come back as text: 'error' is set when the
+    # source cannot be read or lacks required columns, and it is skipped.
+    # aliases defaults to IMPORT_HEADER_ALIASES of the table.
+    result = {'file': file_name, 'sheet': sheet, 'rows': None, 'rejected': None,
+              'parsed': 0, 'error': None}
+    parts, rejected = [], []
+    try:
+        for chunk, _ in iter_import_chunks(file_name, IMPORT_REQUIRED_COLUMNS[table],
+                                           sheet=sheet,
+                                           aliases=aliases or IMPORT_HEADER_ALIASES[table]):
+            rows, report = prepare_import_rows(table, chunk.copy(), result['parsed'] + 1)
+            result['parsed'] += len(chunk)
+            parts.append(rows)
+            if len(report):
+                rejected.append(report)
+    except (ValueError, OSError) as e:
+        result['error'] = str(e)
+        return result
+    result['rows'] = concat_frames(parts) if parts else None
+    if rejected:
+        report = pd.concat(rejected, ignore_index=True)
+        report.insert(0, 'file', os.path.basename(file_name))
+        report.insert(1, 'sheet', sheet)
+        result['rejected'] = report
+    return result
+
+
+def parse_import_batch(table, paths, workers=None, job=None, aliases=None):
+    # Parse and validate many files, folders or sheets at once, one source
+    # per task in a process pool of workers processes (default: one per
+    # CPU). Nothing is merged here; the prepared rows come back in source
+    # order as one frame, so they go through a single dedup merge and a
+    # single save. Returns (rows, rejected report, per-source results), or
+    # None when job was cancelled.
+    sources = import_sources(paths)
+    results = [None] * len(sources)
+    workers = min(workers or os.cpu_count() or 1, len(sources))
+    with perf.timed('parse_batch', table=table, sources=len(sources), workers=workers,
+                    bytes=sum(os.path.getsize(f) for f in {f for f, _ in sources})) as record:
+        if workers <= 1:
+            for number, source in enumerate(sources):
+                if job is not None and job.cancelled():
+                    return None
+                results[number] = parse_import_source(table, *source, aliases)
+                if job is not None:
+                    job.report((number + 1) / len(sources),
+                               f"{number + 1}/{len(sources)} files")
+        else:
+            # Spawned for the same reason as in find_duplicate_customers
+            pool = concurrent.futures.ProcessPoolExecutor(
+                workers, mp_context=multiprocessing.get_context('spawn'))
+            try:
+                futures = {pool.submit(parse_import_source, table, *source, aliases): number
+                           for number, source in enumerate(sources)}
+                for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+                    if job is not None and job.cancelled():
+                        return None
+                    results[futures[future]] = future.result()
+                    if job is not None:
+                        job.report(done / len(sources), f"{done}/{len(sources)} files")
+            finally:
+                pool.shutdown(cancel_futures=True)
+        frames = [r['rows'] for r in results if r['rows'] is not None]
+        reports = [r['rejected'] for r in results if r['rejected'] is not None]
+        rows = concat_frames(frames) if frames else apply_schema(pd.DataFrame(), table)
+        rejected = (pd.concat(reports, ignore_index=True) if reports
+                    else pd.DataFrame(columns=['file', 'sheet', 'row', 'errors']))
+        record.update(rows=sum(r['parsed'] for r in results), rejected=len(rejected),
+                      skipped=sum(r['error'] is not None for r in results))
+        return rows, rejected, results
+
+
+# The customer and product tables together with everything that is kept in
+# step with them: the store, the customer hash indexes, the ID allocator and
+# the analytics aggregates. Nothing here needs a display; the dashboard and
+# the crm command line both work through this class. After every change
+# on_rows_inserted(table, first_row, frame),
+# on_rows_updated(table, positions, frame) or
+# on_rows_removed(table, positions) is called, so a front end can keep its
+# own views current.
+class CRMData:
+    def __init__(self, data_file=None):
+        self.data_file = data_file or os.environ.get('CRM_DATA_FILE', DEFAULT_DATA_FILE)
+        self.store = open_store(self.data_file)
+        # Each table is a base frame plus rows appended since it was last
+        # materialized; see table_frame()
+        self.frames = {'customers': [pd.DataFrame()], 'products': [pd.DataFrame()]}
+        self.customer_index = CustomerIndex()
+        self.product_index = ProductIndex()
+        self.customer_ids = IdAllocator(
+            on_advance=lambda value: self.store.record_meta('customer_id_seq', value))
+        self.analytics = AnalyticsCache()
+        self.templates = TemplateCache(default_template_dir(self.data_file))
+        self.on_rows_inserted = None
+        self.on_rows_updated = None
+        self.on_rows_removed = None
+        self.on_stock_changed = None
+
+    @property
+    def customers(self):
+        return self.table_frame('customers')
+
+    @customers.setter
+    def customers(self, frame):
+        self.frames['customers'] = [frame]
+
+    @property
+    def products(self):
+        return self.table_frame('products')
+
+    @products.setter
+    def products(self, frame):
+        self.frames['products'] = [frame]
+
+    def table_frame(self, table):
+        parts = self.frames[table]
+        if len(parts) > 1:
+            self.frames[table] = [concat_frames(parts)]
+        return self.frames[table][0]
+
+    def table_rows(self, table):
+        return sum(len(part) for part in self.frames[table])
+
+    def load(self):
+        with perf.timed('load', store=type(self.store).__name__) as record:
+            started = time.perf_counter()
+            customers, products = self.store.load()
+            record['read_seconds'] = round(time.perf_counter() - started, 6)
+            self.customers = apply_schema(customers, 'customers')
+            self.products = apply_schema(products, 'products')
+            started = time.perf_counter()
+            self.customer_index.rebuild(self.customers)
+            self.product_index.rebuild(self.products)
+            record['index_seconds'] = round(time.perf_counter() - started, 6)
+            # Older stores have no high-water mark; derive it from the IDs
+            self.customer_ids.high_water = int(self.store.meta.get('customer_id_seq', 0))
+            if ('customer_id_seq' not in self.store.meta and
+                    'customer_id' in self.customers.columns):
+                self.customer_ids.observe(self.customers['customer_id'])
+            self.analytics.rebuild(self.customers, self.products)
+            record['rows'] = len(self.customers) + len(self.products)
+
+    def insert_rows(self, table, frame):
+        # Appending only queues the rows; the frame is concatenated once, the
+        # next time the whole table is needed
+        first_row = self.table_rows(table)
+        self.frames[table].append(frame)
+        if table == 'customers':
+            self.customer_index.add_rows(frame, first_row)
+            self.analytics.add_customers(frame)
+        else:
+            self.product_index.add_rows(frame, first_row)
+            self.analytics.add_products(frame)
+        self.store.record_insert(table, frame)
+        if self.on_rows_inserted is not None:
+            self.on_rows_inserted(table, first_row, frame)
+        return first_row
+
+    def add_customer(self, record):
+        # record maps field names to values; raises ValidationError when the
+        # customer does not pass validate_customers()
+        rows, rejected = validate_customers(pd.DataFrame([record]))
+        if len(rejected):
+            raise ValidationError(rejected)
+        rows = rows.copy()
+        rows['registration_date'] = datetime.now().strftime(STORED_DATE_FORMAT)
+        rows['customer_id'] = self.customer_ids.next_id()
+        rows = apply_schema(rows, 'customers')
+        self.insert_rows('customers', rows)
+        return rows
+
+    def prepare_chunk(self, table, chunk, first_row=1):
+        # The part of an import that can run on a worker thread: validation,
+        # registration dates and the column schema. IDs are assigned when the
+        # rows are merged, once it is known which of them are new. Returns
+        # the rows to merge and a report of the rejected ones.
+        with perf.timed('prepare', table=table, rows=len(chunk)) as record:
+            chunk, rejected = prepare_import_rows(table, chunk, first_row)
+            record['rejected'] = len(rejected)
+            return chunk, rejected
+
+    def apply_chunk(self, table, chunk, mode='upsert'):
+        # Merge one prepared chunk; returns how many rows were inserted,
+        # updated and skipped
+        if len(chunk) == 0:
+            return {'inserted': 0, 'updated': 0, 'skipped': 0}
+        with perf.timed('merge', table=table, rows=len(chunk)) as record:
+            if table == 'customers':
+                counts = self.merge_customers(chunk, mode)
+            else:
+                counts = self.merge_products(chunk, mode)
+            record.update(counts)
+            return counts
+
+    def assign_customer_ids(self, rows):
+        # Keep IDs that came with the file and reserve one block for the
+        # rest. An ID already taken by a stored customer, or by an earlier
+        # row of the same batch (possible in append mode), gets a new one
+        # too, so IDs stay unique.
+        ids = (rows['customer_id'].astype(object) if 'customer_id' in rows.columns
+               else pd.Series([None] * len(rows), index=rows.index, dtype=object))
+        self.customer_ids.observe(ids)
+        taken = ids.map(self.customer_index.by_id).notna() | ids.duplicated()
+        missing = (ids.isna() | taken).to_numpy()
+        if missing.any():
+            ids = ids.copy()
+            ids[missing] = self.customer_ids.reserve(int(missing.sum()))
+        rows['customer_id'] = ids
+        return rows
+
+    def merge_customers(self, chunk, mode='upsert'):
+        # Merge imported customers through the hash indexes
+        first_new_row = self.table_rows('customers')
+        insert_mask, targets, rows = self.customer_index.plan(chunk, mode, first_new_row)
+
+        if targets:
+            frame = self.customers
+            updates = chunk.iloc[rows].drop(columns=['customer_id', 'registration_date'],
+                                            errors='ignore')
+            # Re-importing the same data must not rewrite identical rows
+            changed = changed_rows(frame, targets, updates)
+            targets = [t for t, c in zip(targets, changed) if c]
+            updates = updates[changed]
+
+        if targets:
+            self.update_customers(targets, updates)
+
+        inserts = chunk[insert_mask]
+        if len(inserts):
+            self.insert_rows('customers', self.assign_customer_ids(inserts.copy()))
+
+        return {'inserted': len(inserts), 'updated': len(targets),
+                'skipped': len(chunk) - len(inserts) - len(targets)}
+
+    def update_customers(self, targets, updates):
+        # Write updates (one row per target position) over the customers at
+        # targets, keeping the indexes, analytics and store in step
+        frame = self.customers
+        old_rows = frame.iloc[targets].copy()
+        self.customer_index.remove_rows(old_rows, positions=targets)
+        assign_rows(frame, targets, updates)
+        merged = frame.iloc[targets]
+        self.customer_index.add_rows(merged, positions=targets)
+        self.analytics.update_customers(old_rows, merged)
+        self.store.record_update('customers', 'customer_id', merged)
+        if self.on_rows_updated is not None:
+            self.on_rows_updated('customers', targets, merged)
+
+    def merge_products(self, chunk, mode='upsert'):
+        # Imported products are matched on product_id: an existing product
+        # is updated (upsert) or left alone (skip), and a repeated ID within
+        # the import is skipped, so the first row with an ID wins whether it
+        # inserts or updates. append inserts every row.
+        if mode == 'append':
+            self.insert_rows('products', chunk)
+            return {'inserted': len(chunk), 'updated': 0, 'skipped': 0}
+        insert_mask = np.zeros(len(chunk), dtype=bool)
+        targets, rows = [], []
+        seen = set()
+        for row, product_id in enumerate(ProductIndex.keys(chunk).tolist()):
+            position = self.product_index.by_id.get(product_id)
+            if position is not None:
+                if mode == 'upsert' and product_id not in seen:
+                    targets.append(position)
+                    rows.append(row)
+                    seen.add(product_id)
+            elif product_id is None or product_id not in seen:
+                insert_mask[row] = True
+                seen.add(product_id)
+
+        if targets:
+            updates = chunk.iloc[rows]
+            changed = changed_rows(self.products, targets, updates)
+            targets = [t for t, c in zip(targets, changed) if c]
+            if targets:
+                self.update_products(targets, updates[changed])
+
+        inserts = chunk[insert_mask]
+        if len(inserts):
+            self.insert_rows('products', inserts)
+        return {'inserted': len(inserts), 'updated': len(targets),
+                'skipped': len(chunk) - len(inserts) - len(targets)}
+
+    def update_products(self, targets, updates):
+        # update_customers for products
+        frame = self.products
+        old_rows = frame.iloc[targets].copy()
+        assign_rows(frame, targets, updates)
+        merged = frame.iloc[targets]
+        self.product_index.update_rows(merged, targets)
+        self.analytics.update_products(old_rows, merged)
+        self.store.record_update('products', 'product_id', merged)
+        if self.on_rows_updated is not None:
+            self.on_rows_updated('products', targets, merged)
+
+    def move_stock(self, movements, allow_negative=False):
+        # Apply stock movements, each (product_id, kind, quantity) with kind
+        # one of STOCK_MOVEMENT_KINDS: a sale takes quantity units out, a
+        # receipt adds them and a count sets the stock to quantity. They
+        # form one transaction: all are checked first, and a StockError
+        # leaves the stock as it was. Each product changed costs an index
+        # lookup, one cell write, a move between stock buckets and one
+        # small journal record, so a POS feed never rescans the table.
+        # Returns {row position: new units}.
+        index = self.product_index
+        units = {}
+        for product_id, kind, quantity in movements:
+            key = product_key(product_id)
+            if key not in index.by_id:
+                raise StockError(f"Unknown product: {product_id}")
+            if kind not in STOCK_MOVEMENT_KINDS:
+                raise StockError(f"{key}: unknown stock movement {kind!r}")
+            try:
+                amount = float(quantity)
+            except (TypeError, ValueError):
+                raise StockError(f"{key}: invalid quantity {quantity!r}") from None
+            if amount < 0 or amount != int(amount):
+                raise StockError(f"{key}: invalid quantity {quantity!r}")
+            current = units.get(key, index.units[key])
+            new = {'sale': current - int(amount), 'receipt': current + int(amount),
+                   'count': int(amount)}[kind]
+            if new < 0 and not allow_negative:
+                raise StockError(f"{key}: {current} in stock, cannot sell {int(amount)}")
+            units[key] = new
+        if not units:
+            return {}
+
+        frame = self.products
+        if 'stock' not in frame.columns:
+            frame['stock'] = pd.array([pd.NA] * len(frame), dtype='Int64')
+        stock_column = frame.columns.get_loc('stock')
+        changes, records = {}, []
+        for key, new in units.items():
+            position = index.by_id[key]
+            stored_id, price, *groups = index.details[key]
+            self.analytics.move_stock(groups, new - index.units[key], price)
+            frame.iat[position, stock_column] = new
+            index.set_units(key, new)
+            records.append({'product_id': stored_id, 'stock': new})
+            changes[position] = new
+        self.store.record_update_records('products', 'product_id', records)
+        if self.on_stock_changed is not None:
+            self.on_stock_changed(changes)
+        return changes
+
+    def low_stock(self, threshold=LOW_STOCK_THRESHOLD, limit=None):
+        # The products with at most threshold units, lowest stock first
+        by_id = self.product_index.by_id
+        positions = [by_id[product_id]
+                     for product_id, _ in self.product_index.low_stock(threshold, limit)]
+        return self.products.iloc[positions]
+
+    def merge_duplicates(self, clusters):
+        # Fold each cluster of customer row positions (from
+        # find_duplicate_customers) into its first row: the kept customer's
+        # blank fields are filled from the others in row order, then the
+        # others are deleted. Returns the number of customers removed.
+        # The store deletes by customer_id, so a removed customer must not
+        # share its ID with one that stays; ValueError is raised before
+        # anything changes otherwise.
+        frame = self.customers
+        clusters = [sorted(int(p) for p in positions) for positions in clusters]
+        clusters = [positions for positions in clusters if len(positions) > 1]
+        if not clusters:
+            return 0
+        keep = [positions[0] for positions in clusters]
+        drop = np.array([p for positions in clusters for p in positions[1:]],
+                        dtype=np.int64)
+        remaining = np.ones(len(frame), dtype=bool)
+        remaining[drop] = False
+        ids = frame['customer_id'].astype(object)
+        shared = set(ids.iloc[drop].dropna()) & set(ids[remaining].dropna())
+        if shared:
+            raise ValueError(f"Customers to merge share IDs with customers that stay: "
+                             f"{', '.join(sorted(map(str, shared)))}")
+        with perf.timed('dedup_merge', clusters=len(clusters)) as record:
+            filled = pd.concat([frame.iloc[positions].bfill().iloc[:1]
+                                for positions in clusters])
+            updates = filled.drop(columns=['customer_id', 'registration_date'],
+                                  errors='ignore')
+            changed = changed_rows(frame, keep, updates)
+            if changed.any():
+                self.update_customers([k for k, c in zip(keep, changed) if c],
+                                      updates[changed])
+
+            removed = frame.iloc[drop]
+            self.analytics.remove_customers(removed)
+            self.store.record_delete('customers', 'customer_id',
+                                     removed['customer_id'].astype(object).tolist())
+            self.customers = frame[remaining].reset_index(drop=True)
+            # Every later row moved up, so the positions are rebuilt
+            self.customer_index.rebuild(self.customers)
+            if self.on_rows_removed is not None:
+                self.on_rows_removed('customers', drop)
+            record['removed'] = len(drop)
+            return len(drop)
+
+    def import_file(self, table, file_name, mode='upsert', job=None):
+        # Import a whole file on the calling thread; returns the summary
+        # counts and the report of rejected rows
+        summary = {'inserted': 0, 'updated': 0, 'skipped': 0}
+        rejected = []
+        parsed = 0
+        with perf.timed('import', table=table, file=file_name, mode=mode,
+                        bytes=os.path.getsize(file_name)) as record:
+            for chunk, fraction in iter_import_chunks(
+                    file_name, IMPORT_REQUIRED_COLUMNS[table],
+                    aliases=IMPORT_HEADER_ALIASES[table]):
+                if job is not None and job.cancelled():
+                    break
+                rows = len(chunk)
+                chunk, report = self.prepare_chunk(table, chunk.copy(), parsed + 1)
+                parsed += rows
+                if len(report):
+                    rejected.append(report)
+                for key, count in self.apply_chunk(table, chunk, mode).items():
+                    summary[key] += count
+                if job is not None:
+                    job.report(fraction, f"{parsed} rows")
+            record.update(summary, rows=parsed,
+                          rejected=sum(len(report) for report in rejected))
+        return summary, (pd.concat(rejected, ignore_index=True) if rejected
+                         else pd.DataFrame(columns=['row', 'errors']))
+
+    def import_batch(self, table, paths, mode='upsert', workers=None, job=None):
+        # Batch version of import_file over files, folders and sheets: the
+        # sources are parsed in parallel by parse_import_batch and merged
+        # once all of them are read, so a failed or cancelled batch changes
+        # nothing. Returns the summary counts, the rejected rows and the
+        # per-source results.
+        parsed = parse_import_batch(table, paths, workers, job)
+        if parsed is None:
+            return None
+        rows, rejected, results = parsed
+        return self.apply_chunk(table, rows, mode), rejected, results
+
+    def export_table(self, table, file_name, fmt=None, job=None):
+        return export_frame(self.table_frame(table), file_name, table, fmt, job)
+
+    def flush(self):
+        with perf.timed('save', store=type(self.store).__name__) as record:
+            record['bytes'] = self.store.flush()
+            return record['bytes']
+
+    def compact_if_needed(self):
+        # Rebuilds the snapshot in the background once the journal is large
+        if self.store.needs_compaction():
+            self.store.compact_async(self.customers, self.products)
+
+    def compact(self):
+        with perf.timed('compact', store=type(self.store).__name__) as record:
+            self.store.compact(self.customers, self.products)
+            record['rows'] = self.table_rows('customers') + self.table_rows('products')
+
+    def close(self):
+        self.store.flush()
+        self.store.wait_for_compaction()
+        self.store.close()
@@ -1,23 +1,667 @@
+import time
+# Taken before the heavy imports below so startup timing includes them
+STARTUP_STARTED = time.perf_counter()
 import sys
+import bisect
+import numpy as np
 import pandas as pd
-import json
 import os
-from datetime import datetime
-from openpyxl import Workbook
-from openpyxl.styles import PatternFill, Font, Alignment, Border, Side
+import threading
 import re
+from datetime import datetime
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                             QHBoxLayout, QTabWidget, QPushButton, QLabel, 
-                            QFileDialog, QTableWidget, QTableWidgetItem, 
+                            QFileDialog, QTableView, 
                             QLineEdit, QFormLayout, QComboBox, QMessageBox,
                             QScrollArea, QStyleFactory, QFrame, QTextEdit,
-                            QHeaderView, QSizePolicy)
-from PyQt5.QtCore import Qt, QTranslator, QLocale
+                            QHeaderView, QSizePolicy, QDockWidget, QProgressBar,
+                            QTableWidget, QTableWidgetItem, QGridLayout,
+                            QGroupBox, QDialog, QDialogButtonBox, QDateEdit,
+                            QSpinBox, QCheckBox)
+from PyQt5.QtCore import (Qt, QTranslator, QLocale, QAbstractTableModel,
+                          QModelIndex, QObject, QRunnable, QThreadPool,
+                          QTimer, QDate, pyqtSignal)
 from PyQt5.QtGui import QFont, QIcon, QPalette, QColor
+from crm_core import (CRMData, ValidationError, MissingColumnsError, SearchIndex,
+                      iter_import_chunks, export_frame, IMPORT_REQUIRED_COLUMNS,
+                      IMPORT_HEADER_ALIASES,
+                      IMPORT_MODES, SEARCH_FIELDS, CUSTOMER_CATEGORIES, CONTACT_METHODS,
+                      STORED_DATE_FORMAT, EXPORT_FORMATS,
+                      EXPORT_FILE_FILTER, IMPORT_FILE_FILTER, EXPORT_COLUMNS,
+                      ANALYTICS_PERIODS, ANALYTICS_PRODUCT_GROUPS, ANALYTICS_TOP_GROUPS,
+                      PERF_HISTORY, perf, default_perf_log, find_duplicate_customers,
+                      TableQuery, BLANK_LABEL, import_sources, parse_import_batch,
+                      StockError, STOCK_MOVEMENT_KINDS, LOW_STOCK_THRESHOLD)
+
+# Empty rows shown under the real headers while the data loads
+SKELETON_ROWS = 30
+# Autosave waits for edits to pause this long, but never defers the first
+# unsaved edit by more than the maximum
+AUTOSAVE_DELAY_MS = int(os.environ.get('CRM_AUTOSAVE_DELAY_MS', 1000))
+AUTOSAVE_MAX_DELAY_MS = int(os.environ.get('CRM_AUTOSAVE_MAX_DELAY_MS', 10000))
+# Lowest date of the date filters, shown as "Any"
+FILTER_DATE_ANY = QDate(2000, 1, 1)
+
+
+# Read-only model over the column arrays of a DataFrame. Cells are only
+# formatted when the view paints them, and sorting and filtering keep a row
+# permutation instead of moving any data around.
+#
+# Sorting and column filters go through a crm_core.TableQuery over the
+# column arrays: sorts are typed, a shift-click on a header adds a secondary
+# sort key, and the per-column ranks and filter masks are cached until the
+# column changes.
+#
+# Appended rows are kept in separate blocks that are merged like a binary
+# counter, so adding k rows costs O(k) amortized instead of copying every
+# column. Mutations are announced with the usual begin/end insert/remove and
+# dataChanged signals so the view only repaints what actually changed.
+class DataFrameTableModel(QAbstractTableModel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._headers = []
+        self._blocks = []        # list of blocks, each a list of column arrays
+        self._block_starts = []  # first source row of each block
+        self._source_count = 0
+        self._order = None       # view row -> source row, None for identity
+        self._filter = None      # sorted source rows to show, None for all
+        self._query = TableQuery()
+        self._positions = None   # source row -> view row (-1 hidden), on demand
+
+    def set_frame(self, frame):
+        self.beginResetModel()
+        self._headers = [str(column) for column in frame.columns]
+        self._blocks = [self._frame_columns(frame, self._headers)] if len(frame) else []
+        self._block_starts = [0] if len(frame) else []
+        self._source_count = len(frame)
+        self._filter = None
+        # Column filters stay; the sort does not
+        self._query.sort_keys = []
+        self._query.invalidate()
+        self._rebuild_order()
+        self.endResetModel()
+
+    @staticmethod
+    def _frame_columns(frame, headers):
+        names = [str(column) for column in frame.columns]
+        columns = []
+        for header in headers:
+            if header in names:
+                columns.append(frame.iloc[:, names.index(header)].to_numpy())
+            else:
+                columns.append(np.full(len(frame), None, dtype=object))
+        return columns
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self._source_count if self._order is None else len(self._order)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._headers)
+
+    def source_row(self, row):
+        return row if self._order is None else int(self._order[row])
+
+    def view_row(self, source_row):
+        if self._order is None:
+            return source_row
+        if self._positions is None:
+            self._positions = np.full(self._source_count, -1, dtype=np.int64)
+            self._positions[self._order] = np.arange(len(self._order))
+        return int(self._positions[source_row])
+
+    def _locate(self, source_row):
+        if len(self._blocks) == 1:
+            return 0, source_row
+        block = bisect.bisect_right(self._block_starts, source_row) - 1
+        return block, source_row - self._block_starts[block]
+
+    def _column_array(self, column):
+        parts = [block[column] for block in self._blocks]
+        if not parts:
+            return np.empty(0, dtype=object)
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role not in (Qt.DisplayRole, Qt.ToolTipRole):
+            return None
+        block, offset = self._locate(self.source_row(index.row()))
+        return self.format_value(self._blocks[block][index.column()][offset])
+
+    @staticmethod
+    def format_value(value):
+        if value is None or (not isinstance(value, str) and pd.isna(value)):
+            return ""
+        if isinstance(value, np.datetime64):
+            return pd.Timestamp(value).strftime(STORED_DATE_FORMAT)
+        return str(value)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self._headers[section] if section < len(self._headers) else None
+        return str(section + 1)
+
+    def _column_values(self, name):
+        if name not in self._headers:
+            return None
+        return self._column_array(self._headers.index(name))
+
+    def _rebuild_order(self):
+        if self._filter is None and not self._query.active():
+            self._order = None
+        else:
+            rows = (np.arange(self._source_count) if self._filter is None
+                    else self._filter)
+            self._order = self._query.rows(self._column_values, rows)
+        self._positions = None
+
+    def sort(self, column, order=Qt.AscendingOrder, add=None):
+        # add (default: shift held) keeps the current sort keys, so ties
+        # are broken by the columns sorted before
+        if not 0 <= column < len(self._headers):
+            return
+        if add is None:
+            add = bool(QApplication.keyboardModifiers() & Qt.ShiftModifier)
+        self.layoutAboutToBeChanged.emit()
+        old_indexes = self.persistentIndexList()
+        old_sources = [self.source_row(index.row()) for index in old_indexes]
+
+        with perf.timed('table_sort', rows=self.rowCount()) as record:
+            self._query.sort_by(self._headers[column], order == Qt.AscendingOrder, add)
+            self._rebuild_order()
+            record['keys'] = len(self._query.sort_keys)
+
+        # Keep selections pointing at the same records after the reorder
+        if old_indexes:
+            new_indexes = [self.index(self.view_row(source), index.column())
+                           for source, index in zip(old_sources, old_indexes)]
+            self.changePersistentIndexList(old_indexes, new_indexes)
+        self.layoutChanged.emit()
+
+    def set_row_filter(self, source_rows):
+        # Show only the given source rows (None shows everything), keeping
+        # the current sort
+        self.beginResetModel()
+        self._filter = (None if source_rows is None else
+                        np.unique(np.asarray(source_rows, dtype=np.int64)))
+        self._rebuild_order()
+        self.endResetModel()
+
+    def set_column_filter(self, column, condition):
+        # condition is a set of allowed values, a (start, end) date range or
+        # None to drop the column's filter
+        self.beginResetModel()
+        with perf.timed('table_filter', column=column):
+            self._query.set_filter(column, condition)
+            self._rebuild_order()
+        self.endResetModel()
+
+    def _add_missing_columns(self, frame):
+        missing = [str(c) for c in frame.columns if str(c) not in self._headers]
+        if not missing:
+            return
+        first = len(self._headers)
+        self.beginInsertColumns(QModelIndex(), first, first + len(missing) - 1)
+        for block in self._blocks:
+            size = len(block[0]) if block else 0
+            block.extend(np.full(size, None, dtype=object) for _ in missing)
+        self._headers.extend(missing)
+        self.endInsertColumns()
+
+    def append_rows(self, frame):
+        # Rows are added at the end of the view, even when it is sorted or
+        # filtered; the next sort or filter puts them in place.
+        if frame is None or len(frame) == 0:
+            return
+        if not self._headers:
+            self.set_frame(frame)
+            return
+        self._add_missing_columns(frame)
+        first_source = self._source_count
+        new_sources = np.arange(first_source, first_source + len(frame))
+        first = self.rowCount()
+        self.beginInsertRows(QModelIndex(), first, first + len(frame) - 1)
+        self._blocks.append(self._frame_columns(frame, self._headers))
+        self._block_starts.append(first_source)
+        self._source_count += len(frame)
+        self._query.invalidate()
+        if self._order is not None:
+            self._order = np.concatenate([self._order, new_sources])
+            self._positions = None
+        if self._filter is not None:
+            self._filter = np.concatenate([self._filter, new_sources])
+        self._merge_tail_blocks()
+        self.endInsertRows()
+
+    def _merge_tail_blocks(self):
+        # Merge the last two blocks while the newer one is at least half the
+        # size of the older one; block sizes stay roughly geometric.
+        while len(self._blocks) > 1:
+            older, newer = self._blocks[-2], self._blocks[-1]
+            if len(newer[0]) * 2 < len(older[0]):
+                break
+            merged = [np.concatenate([a, b]) if a.dtype == b.dtype
+                      else np.concatenate([a.astype(object), b.astype(object)])
+                      for a, b in zip(older, newer)]
+            self._blocks[-2:] = [merged]
+            self._block_starts.pop()
+
+    def update_rows(self, source_rows, frame):
+        # Overwrite the given source rows with the matching rows of frame and
+        # repaint only the affected range
+        source_rows = np.asarray(source_rows, dtype=np.int64)
+        if len(source_rows) == 0:
+            return
+        self._add_missing_columns(frame)
+        block_of = np.searchsorted(self._block_starts, source_rows, side='right') - 1
+        names = [str(column) for column in frame.columns]
+        self._query.invalidate(names)
+        for col_pos, name in enumerate(names):
+            column = self._headers.index(name)
+            values = frame.iloc[:, col_pos].to_numpy()
+            for block_index in np.unique(block_of):
+                in_block = block_of == block_index
+                block = self._blocks[block_index]
+                offsets = source_rows[in_block] - self._block_starts[block_index]
+                array = block[column]
+                if not array.flags.writeable:
+                    array = block[column] = array.copy()
+                try:
+                    array[offsets] = values[in_block]
+                except (TypeError, ValueError):
+                    array = block[column] = array.astype(object)
+                    array[offsets] = values[in_block]
+        if self._order is None:
+            rows = source_rows
+        else:
+            self.view_row(0)
+            rows = self._positions[source_rows]
+            rows = rows[rows >= 0]
+        if len(rows):
+            self.dataChanged.emit(self.index(int(rows.min()), 0),
+                                  self.index(int(rows.max()), len(self._headers) - 1))
+
+    def set_cell(self, source_row, name, value):
+        # A one-cell edit such as a stock movement; only that cell is
+        # repainted. A sorted or filtered view is brought up to date by the
+        # next sort or filter.
+        if name not in self._headers:
+            return
+        column = self._headers.index(name)
+        block, offset = self._locate(source_row)
+        array = self._blocks[block][column]
+        if not array.flags.writeable:
+            array = self._blocks[block][column] = array.copy()
+        try:
+            array[offset] = value
+        except (TypeError, ValueError):
+            array = self._blocks[block][column] = array.astype(object)
+            array[offset] = value
+        self._query.invalidate([name])
+        row = self.view_row(source_row)
+        if row >= 0:
+            self.dataChanged.emit(self.index(row, column), self.index(row, column))
+
+    def remove_rows(self, source_rows):
+        source_rows = np.unique(np.asarray(source_rows, dtype=np.int64))
+        if len(source_rows) == 0:
+            return
+        if self._order is None:
+            self._order = np.arange(self._source_count)
+        self._positions = None
+
+        # Remove contiguous runs of view rows from the bottom up; the
+        # permutation is trimmed per run so the view stays consistent.
+        view_rows = np.sort(np.flatnonzero(np.isin(self._order, source_rows)))
+        if len(view_rows):
+            breaks = np.flatnonzero(np.diff(view_rows) != 1) + 1
+            for run in reversed(np.split(view_rows, breaks)):
+                first, last = int(run[0]), int(run[-1])
+                self.beginRemoveRows(QModelIndex(), first, last)
+                self._order = np.delete(self._order, np.s_[first:last + 1])
+                self.endRemoveRows()
+
+        # Drop the rows from storage and renumber the permutation
+        keep = np.ones(self._source_count, dtype=bool)
+        keep[source_rows] = False
+        self._query.invalidate()
+        columns = [self._column_array(c)[keep] for c in range(len(self._headers))]
+        self._source_count = int(keep.sum())
+        self._blocks = [columns] if self._source_count else []
+        self._block_starts = [0] if self._source_count else []
+        renumber = np.cumsum(keep) - 1
+        if self._filter is not None:
+            self._filter = renumber[self._filter[keep[self._filter]]]
+        if self._filter is None and not self._query.active():
+            self._order = None
+        else:
+            self._order = renumber[self._order]
+
+
+class JobSignals(QObject):
+    progress = pyqtSignal(float, str)
+    chunk = pyqtSignal(object)
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(object)
+
+
+# Runs fn(job) on a QThreadPool thread. fn reports back through
+# job.report()/job.emit_chunk() and should stop once job.cancelled() is
+# true; everything reaches the GUI thread as queued signals.
+class Job(QRunnable):
+    def __init__(self, title, fn):
+        super().__init__()
+        self.title = title
+        self.fn = fn
+        self.signals = JobSignals()
+        self.cancel_event = threading.Event()
+        self.setAutoDelete(False)
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def report(self, fraction, text=''):
+        self.signals.progress.emit(fraction, text)
+
+    def emit_chunk(self, chunk):
+        self.signals.chunk.emit(chunk)
+
+    def run(self):
+        self.report(0.0, "Running")
+        try:
+            result = self.fn(self)
+        except Exception as e:
+            self.signals.failed.emit(e)
+        else:
+            self.signals.finished.emit(result)
+
+
+class JobQueuePanel(QWidget):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.jobs = []
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        self.table = QTableWidget(0, 4)
+        self.table.setHorizontalHeaderLabels(["Job", "Status", "Progress", ""])
+        self.table.verticalHeader().setVisible(False)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        layout.addWidget(self.table)
+
+        clear_btn = QPushButton("Clear Finished")
+        clear_btn.clicked.connect(self.clear_finished)
+        layout.addWidget(clear_btn, alignment=Qt.AlignRight)
+
+    def add_job(self, job):
+        row = self.table.rowCount()
+        self.table.insertRow(row)
+        self.table.setItem(row, 0, QTableWidgetItem(job.title))
+        status = QTableWidgetItem("Queued")
+        self.table.setItem(row, 1, status)
+        bar = QProgressBar()
+        bar.setRange(0, 100)
+        self.table.setCellWidget(row, 2, bar)
+        cancel_btn = QPushButton("Cancel")
+        cancel_btn.clicked.connect(job.cancel)
+        self.table.setCellWidget(row, 3, cancel_btn)
+        self.jobs.append(job)
+
+        def on_progress(fraction, text):
+            bar.setValue(int(fraction * 100))
+            status.setText("Cancelling..." if job.cancelled() else text)
+
+        def on_finished(_):
+            status.setText("Cancelled" if job.cancelled() else "Done")
+            bar.setValue(100)
+            cancel_btn.setEnabled(False)
+
+        def on_failed(error):
+            status.setText(f"Failed: {error}")
+            cancel_btn.setEnabled(False)
+
+        job.signals.progress.connect(on_progress)
+        job.signals.finished.connect(on_finished)
+        job.signals.failed.connect(on_failed)
+
+    def clear_finished(self):
+        for row in reversed(range(self.table.rowCount())):
+            if not self.table.cellWidget(row, 3).isEnabled():
+                self.table.removeRow(row)
+                del self.jobs[row]
+
+    def cancel_all(self):
+        for job in self.jobs:
+            job.cancel()
+
+
+# Debounced autosave. mark_dirty() (re)starts a single-shot timer, so a
+# burst of edits ends in one save once they pause for delay_ms, and at most
+# max_delay_ms after the first unsaved edit. save_fn runs as a job; edits
+# made while it runs are saved by the next one, and a failed save leaves
+# the state dirty so it is retried on the next edit or on close.
+class SaveScheduler(QObject):
+    state_changed = pyqtSignal(str)
+    saved = pyqtSignal(object)
+    failed = pyqtSignal(object)
+
+    def __init__(self, save_fn, start_job, delay_ms=AUTOSAVE_DELAY_MS,
+                 max_delay_ms=AUTOSAVE_MAX_DELAY_MS, parent=None):
+        super().__init__(parent)
+        self.save_fn = save_fn
+        self.start_job = start_job
+        self.delay_ms = delay_ms
+        self.max_delay_ms = max_delay_ms
+        self.dirty = False
+        self.saving = False
+        self.dirty_since = None
+        self.last_saved = None
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.save)
+
+    def mark_dirty(self):
+        self.dirty = True
+        if self.dirty_since is None:
+            self.dirty_since = time.monotonic()
+        waited_ms = (time.monotonic() - self.dirty_since) * 1000
+        self.timer.start(int(max(0, min(self.delay_ms, self.max_delay_ms - waited_ms))))
+        if not self.saving:
+            self.state_changed.emit("Unsaved changes")
+
+    def save(self):
+        if not self.dirty or self.saving:
+            # A running save reschedules itself when it finishes
+            return
+        self.dirty = False
+        self.dirty_since = None
+        self.saving = True
+        self.state_changed.emit("Saving...")
+        self.start_job("Save data", lambda job: self.save_fn(),
+                       on_finished=self._finished, on_failed=self._failed,
+                       show_in_panel=False)
+
+    def _finished(self, result):
+        self.saving = False
+        self.last_saved = datetime.now()
+        self.state_changed.emit(f"Saved {self.last_saved.strftime('%H:%M:%S')}")
+        self.saved.emit(result)
+        if self.dirty:
+            self.mark_dirty()
+
+    def _failed(self, error):
+        self.saving = False
+        self.dirty = True
+        self.state_changed.emit("Save failed")
+        self.failed.emit(error)
+
+    def flush_now(self):
+        # Synchronous save for shutdown; call once no save job is running
+        self.timer.stop()
+        if self.dirty:
+            self.save_fn()
+            self.dirty = False
+            self.dirty_since = None
+            self.last_saved = datetime.now()
+
+
+# Recent perf records, newest first, and a way to profile the next run of
+# one operation. Records arrive on whichever thread did the work and are
+# moved to the GUI thread through the recorded signal.
+class DiagnosticsPanel(QWidget):
+    recorded = pyqtSignal(object)
+    columns = ["Time", "Operation", "Seconds", "Rows", "Bytes", "Peak MB", "Details"]
+    profile_operations = ['load', 'save', 'compact', 'import', 'prepare', 'merge',
+                          'export', 'table_refresh', 'search_build']
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        controls = QHBoxLayout()
+        self.profile_combo = QComboBox()
+        self.profile_combo.addItems(self.profile_operations)
+        controls.addWidget(self.profile_combo)
+        profile_btn = QPushButton("Profile Next")
+        profile_btn.clicked.connect(self.profile_next)
+        controls.addWidget(profile_btn)
+        self.status_label = QLabel()
+        controls.addWidget(self.status_label, 1)
+        clear_btn = QPushButton("Clear")
+        clear_btn.clicked.connect(lambda: self.table.setRowCount(0))
+        controls.addWidget(clear_btn)
+        layout.addLayout(controls)
+
+        self.table = QTableWidget(0, len(self.columns))
+        self.table.setHorizontalHeaderLabels(self.columns)
+        self.table.verticalHeader().setVisible(False)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        layout.addWidget(self.table)
+
+        self.recorded.connect(self.add_record)
+        for record in list(perf.records):
+            self.add_record(record)
+        self.listener = self.recorded.emit
+        perf.listeners.append(self.listener)
+        self.show_log_file()
+
+    def detach(self):
+        if self.listener in perf.listeners:
+            perf.listeners.remove(self.listener)
+
+    def show_log_file(self):
+        self.status_label.setText(f"Log: {perf.file_name}" if perf.file_name
+                                  else "Log file disabled")
+
+    def profile_next(self):
+        operation = self.profile_combo.currentText()
+        perf.profile_next(operation)
+        self.status_label.setText(f"The next {operation} will be profiled")
+
+    def add_record(self, record):
+        shown = {'operation', 'started', 'seconds', 'rows', 'bytes', 'peak_rss_mb',
+                 'rss_mb', 'thread'}
+        details = ", ".join(f"{key}={value}" for key, value in record.items()
+                            if key not in shown)
+        values = [record.get('started', '')[11:], record['operation'],
+                  f"{record.get('seconds', 0):.3f}",
+                  f"{record['rows']:,}" if 'rows' in record else "",
+                  f"{record['bytes']:,}" if record.get('bytes') else "",
+                  f"{record['peak_rss_mb']:,.0f}" if 'peak_rss_mb' in record else "",
+                  details]
+        self.table.insertRow(0)
+        for column, value in enumerate(values):
+            self.table.setItem(0, column, QTableWidgetItem(value))
+        if self.table.rowCount() > PERF_HISTORY:
+            self.table.removeRow(self.table.rowCount() - 1)
+        if 'profile' in record:
+            self.status_label.setText(f"Profile saved to {record['profile']}")
+
+
+# Lists the clusters found by find_duplicate_customers for review. Every
+# cluster starts checked; the checked ones are merged into their first
+# customer when the dialog is accepted. Clusters are held as customer IDs,
+# since row positions may move while the dialog is open.
+class DuplicateReviewDialog(QDialog):
+    columns = ["Merge", "Score", "Keep", "Merge into it"]
+    shown_fields = ['name', 'email', 'phone', 'city']
+
+    def __init__(self, frame, clusters, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(f"Review duplicates ({len(clusters)} clusters)")
+        self.resize(1000, 600)
+        layout = QVBoxLayout(self)
+
+        fields = [f for f in self.shown_fields if f in frame.columns]
+        self.clusters = []
+        self.table = QTableWidget(len(clusters), len(self.columns))
+        self.table.setHorizontalHeaderLabels(self.columns)
+        self.table.verticalHeader().setVisible(False)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        for row, (positions, score) in enumerate(clusters):
+            rows = frame.iloc[positions]
+            self.clusters.append(rows['customer_id'].astype(object).tolist())
+            described = [" | ".join(str(value) for value in values if pd.notna(value))
+                         for values in rows[fields].itertuples(index=False)]
+            check = QTableWidgetItem()
+            check.setFlags(Qt.ItemIsUserCheckable | Qt.ItemIsEnabled)
+            check.setCheckState(Qt.Checked)
+            self.table.setItem(row, 0, check)
+            self.table.setItem(row, 1, QTableWidgetItem(f"{score:.2f}"))
+            self.table.setItem(row, 2, QTableWidgetItem(described[0]))
+            self.table.setItem(row, 3, QTableWidgetItem("\n".join(described[1:])))
+        self.table.resizeColumnsToContents()
+        self.table.resizeRowsToContents()
+        layout.addWidget(self.table)
+
+        buttons = QDialogButtonBox()
+        merge_btn = buttons.addButton("Merge Selected", QDialogButtonBox.AcceptRole)
+        merge_btn.setEnabled(bool(clusters))
+        buttons.addButton(QDialogButtonBox.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+
+    def selected_clusters(self):
+        return [ids for row, ids in enumerate(self.clusters)
+                if self.table.item(row, 0).checkState() == Qt.Checked]
+
+
+# Wall-clock time of each startup phase, counted from STARTUP_STARTED. Set
+# CRM_STARTUP_TIMING=1 to have the phases printed once the data is loaded.
+class StartupTimer:
+    def __init__(self, started=STARTUP_STARTED):
+        self.phases = []
+        self.last = started
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def total(self):
+        return sum(seconds for _, seconds in self.phases)
+
+    def summary(self):
+        return ", ".join(f"{phase} {seconds * 1000:.0f} ms" for phase, seconds in self.phases)
+
 
 class CRMDashboard(QMainWindow):
     def __init__(self):
         super().__init__()
+        self.startup = StartupTimer()
+        self.startup.mark('imports')
         self.current_language = 'en'
         self.form_fields = {}  # Initialize form_fields dictionary
         self.customer_fields = {
@@ -49,11 +693,153 @@ class CRMDashboard(QMainWindow):
         self.init_data_storage()
         self.init_translations()
         self.init_ui()
-        self.load_saved_data()
+        self.startup.mark('window')
+        self.show_skeleton()
+        # Loading starts from the event loop, once the window has been painted
+        QTimer.singleShot(0, self.load_saved_data)
     def init_data_storage(self):
-        self.data_file = 'crm_data.json'
-        self.customers_data = pd.DataFrame()
-        self.products_data = pd.DataFrame()
+        self.data = CRMData()
+        # CRM_PERF_LOG names the perf log; set it empty to turn the log off
+        perf.open(os.environ.get('CRM_PERF_LOG', default_perf_log(self.data.data_file)))
+        self.data.on_rows_inserted = self.rows_inserted
+        self.data.on_rows_updated = self.rows_updated
+        self.data.on_rows_removed = self.rows_removed
+        self.data.on_stock_changed = self.stock_changed
+        self.thread_pool = QThreadPool(self)
+        self.active_jobs = set()
+        self.saver = SaveScheduler(self.data.flush, self.start_job, parent=self)
+        self.saver.saved.connect(lambda _: self.data.compact_if_needed())
+        self.saver.failed.connect(
+            lambda error: QMessageBox.critical(self, self.tr_text('error'),
+                                               f"Error saving data: {str(error)}"))
+        self.search_index = SearchIndex()
+        # Edits made while the search index is rebuilt in the background
+        self.search_replay = None
+        # Rows were removed during the rebuild, so its result is outdated
+        self.search_stale = False
+
+    @property
+    def customers_data(self):
+        return self.data.customers
+
+    @property
+    def products_data(self):
+        return self.data.products
+
+    def table_model(self, table):
+        return self.customers_model if table == 'customers' else self.products_model
+
+    def rows_inserted(self, table, first_row, frame):
+        self.save_data()
+        self.table_model(table).append_rows(frame)
+        self.analytics_changed()
+        if table == 'customers':
+            self.index_customer_rows(frame, first_row)
+            if self.customer_search.text():
+                # Appended rows are shown until the search is re-applied
+                self.customer_search_timer.start()
+
+    def rows_updated(self, table, positions, frame):
+        self.save_data()
+        if table == 'customers':
+            self.index_customer_rows(frame, positions=positions)
+        self.table_model(table).update_rows(positions, frame)
+        self.analytics_changed()
+
+    def rows_removed(self, table, positions):
+        self.save_data()
+        self.table_model(table).remove_rows(positions)
+        self.analytics_changed()
+        if table == 'customers':
+            # Later rows moved up, so the search index is rebuilt
+            if self.search_replay is not None:
+                self.search_stale = True
+            self.rebuild_search_index()
+
+    def stock_changed(self, changes):
+        # Stock movements come one product at a time (a POS feed), so they
+        # repaint single cells rather than refreshing the table
+        self.save_data()
+        for position, units in changes.items():
+            self.products_model.set_cell(position, 'stock', units)
+        self.analytics_changed()
+
+    def index_customer_rows(self, frame, first_row=None, positions=None):
+        # Keep the search index in step with inserted (first_row) or updated
+        # (positions) customers
+        edit = (frame.copy(), first_row, positions)
+        if self.search_replay is not None:
+            self.search_replay.append(edit)
+        self._apply_search_edit(self.search_index, *edit)
+
+    def _apply_search_edit(self, index, frame, first_row, positions):
+        if positions is None:
+            index.add_rows(frame, first_row)
+        else:
+            index.update_rows(frame, positions)
+
+    def rebuild_search_index(self):
+        # Builds on a worker thread from a copy of the searchable columns;
+        # edits made meanwhile are replayed before the new index is swapped in
+        if self.search_replay is not None:
+            return
+        frame = self.customers_data
+        frame = frame[[f for f in SEARCH_FIELDS if f in frame.columns]].copy()
+        index = SearchIndex()
+        self.search_replay = replay = []
+
+        def build(job):
+            with perf.timed('search_build', rows=len(frame)):
+                index.build(frame)
+            return index
+
+        def finished(index):
+            self.search_replay = None
+            if self.search_stale:
+                self.search_stale = False
+                self.rebuild_search_index()
+                return
+            for edit in replay:
+                self._apply_search_edit(index, *edit)
+            self.search_index = index
+            if self.customer_search.text():
+                self.apply_customer_search()
+
+        def failed(error):
+            self.search_replay = None
+            self.search_stale = False
+            QMessageBox.warning(self, self.tr_text('warning'),
+                              f"Error building the search index: {str(error)}")
+
+        return self.start_job("Build search index", build, on_finished=finished,
+                              on_failed=failed, show_in_panel=False)
+
+    def apply_customer_search(self):
+        rows = self.search_index.search(self.customer_search.text())
+        self.customers_model.set_row_filter(rows)
+        if rows is None:
+            self.customer_search_count.clear()
+        else:
+            self.customer_search_count.setText(f"{len(rows)} {self.tr_text('matches')}")
+
+    def start_job(self, title, fn, on_chunk=None, on_finished=None,
+                  on_failed=None, show_in_panel=True):
+        job = Job(title, fn)
+        if on_chunk is not None:
+            job.signals.chunk.connect(on_chunk)
+        if on_finished is not None:
+            job.signals.finished.connect(on_finished)
+        if on_failed is not None:
+            job.signals.failed.connect(on_failed)
+        # Keep a reference until the job is done; the pool does not own it
+        self.active_jobs.add(job)
+        job.signals.finished.connect(lambda _: self.active_jobs.discard(job))
+        job.signals.failed.connect(lambda _: self.active_jobs.discard(job))
+        if show_in_panel:
+            self.jobs_panel.add_job(job)
+            self.jobs_dock.show()
+        self.thread_pool.start(job)
+        return job
 
     def init_translations(self):
         self.translations = {
@@ -64,7 +850,8 @@ class CRMDashboard(QMainWindow):
                 'analytics': 'Analytics',
                 'add_customer': 'Add Customer',
                 'import_customers': 'Import Customers',
-                'export_excel': 'Export to Excel',
+                'import_folder': 'Import Folder',
+                'export_excel': 'Export Data',
                 'name': 'Name',
                 'email': 'Email',
                 'phone': 'Phone',
@@ -72,7 +859,19 @@ class CRMDashboard(QMainWindow):
                 'success': 'Success',
                 'error': 'Error',
                 'warning': 'Warning',
-                'download_template': 'Download Template'
+                'download_template': 'Download Template',
+                'download_update_template': 'Download Update Template',
+                'search_customers': 'Search name, email, phone, company, city or notes',
+                'matches': 'matches',
+                'find_duplicates': 'Find Duplicates',
+                'country': 'Country',
+                'registered_from': 'Registered from',
+                'registered_to': 'to',
+                'all': 'All',
+                'any': 'Any',
+                'low_stock': 'Low stock at or below',
+                'product_id': 'Product ID',
+                'move_stock': 'Apply Movement'
             },
             'ar': {
                 'window_title': 'لوحة إدارة العملاء',
@@ -81,7 +880,8 @@ class CRMDashboard(QMainWindow):
                 'analytics': 'التحليلات',
                 'add_customer': 'إضافة عميل',
                 'import_customers': 'استيراد العملاء',
-                'export_excel': 'تصدير إلى Excel',
+                'import_folder': 'استيراد مجلد',
+                'export_excel': 'تصدير البيانات',
                 'name': 'الاسم',
                 'email': 'البريد الإلكتروني',
                 'phone': 'الهاتف',
@@ -89,7 +889,19 @@ class CRMDashboard(QMainWindow):
                 'success': 'نجاح',
                 'error': 'خطأ',
                 'warning': 'تحذير',
-                'download_template': 'تحميل النموذج'
+                'download_template': 'تحميل النموذج',
+                'download_update_template': 'تحميل نموذج التحديث',
+                'search_customers': 'ابحث بالاسم أو البريد أو الهاتف أو الشركة أو المدينة أو الملاحظات',
+                'matches': 'نتيجة',
+                'find_duplicates': 'البحث عن المكررات',
+                'country': 'الدولة',
+                'registered_from': 'مسجل من',
+                'registered_to': 'إلى',
+                'all': 'الكل',
+                'any': 'أي',
+                'low_stock': 'مخزون منخفض حتى',
+                'product_id': 'رقم المنتج',
+                'move_stock': 'تطبيق الحركة'
             }
         }
 
@@ -130,16 +942,16 @@ class CRMDashboard(QMainWindow):
             QPushButton:pressed {
                 background-color: #2573a7;
             }
-            QTableWidget {
+            QTableView {
                 border: 1px solid #bdc3c7;
                 gridline-color: #ecf0f1;
                 border-radius: 4px;
                 alternate-background-color: #f9f9f9;
             }
-            QTableWidget::item {
+            QTableView::item {
                 padding: 5px;
             }
-            QTableWidget::item:selected {
+            QTableView::item:selected {
                 background-color: #3498db;
                 color: white;
             }
@@ -194,9 +1006,14 @@ class CRMDashboard(QMainWindow):
 
         # Language switcher
         language_layout = QHBoxLayout()
+        language_layout.addStretch()
+        diagnostics_btn = QPushButton("Diagnostics")
+        diagnostics_btn.clicked.connect(
+            lambda: self.diagnostics_dock.setVisible(not self.diagnostics_dock.isVisible()))
+        language_layout.addWidget(diagnostics_btn)
         language_btn = QPushButton("🌐 English/عربي")
         language_btn.clicked.connect(self.toggle_language)
-        language_layout.addWidget(language_btn, alignment=Qt.AlignRight)
+        language_layout.addWidget(language_btn)
         main_layout.addLayout(language_layout)
 
         # Create tab widget
@@ -208,8 +1025,28 @@ class CRMDashboard(QMainWindow):
         self.tab_widget.addTab(self.customers_tab, self.tr_text('customers'))
         self.tab_widget.addTab(self.products_tab, self.tr_text('products'))
         self.tab_widget.addTab(self.analytics_tab, self.tr_text('analytics'))
+        self.tab_widget.currentChanged.connect(lambda _: self.refresh_analytics())
 
         main_layout.addWidget(self.tab_widget)
+
+        # Job queue panel for imports/exports running in the background
+        self.jobs_panel = JobQueuePanel()
+        self.jobs_dock = QDockWidget("Jobs", self)
+        self.jobs_dock.setWidget(self.jobs_panel)
+        self.addDockWidget(Qt.BottomDockWidgetArea, self.jobs_dock)
+        self.jobs_dock.hide()
+
+        # Timings of the hot paths; hidden until the Diagnostics button
+        self.diagnostics_panel = DiagnosticsPanel()
+        self.diagnostics_dock = QDockWidget("Diagnostics", self)
+        self.diagnostics_dock.setWidget(self.diagnostics_panel)
+        self.addDockWidget(Qt.BottomDockWidgetArea, self.diagnostics_dock)
+        self.diagnostics_dock.hide()
+
+        # Permanent status bar entry for the autosave state
+        self.save_status = QLabel("All changes saved")
+        self.statusBar().addPermanentWidget(self.save_status)
+        self.saver.state_changed.connect(self.save_status.setText)
     def create_customers_tab(self):
         tab = QWidget()
         layout = QVBoxLayout()
@@ -228,6 +1065,18 @@ class CRMDashboard(QMainWindow):
         import_customers_btn.clicked.connect(self.import_customers)
         buttons_layout.addWidget(import_customers_btn)
 
+        # Every workbook and CSV file in a folder at once
+        import_folder_btn = QPushButton(self.tr_text('import_folder'))
+        import_folder_btn.clicked.connect(self.import_customers_folder)
+        buttons_layout.addWidget(import_folder_btn)
+
+        # How imported rows that match an existing customer are handled
+        self.import_mode_combo = QComboBox()
+        for mode, label in zip(IMPORT_MODES, ["Update duplicates", "Skip duplicates",
+                                              "Append all"]):
+            self.import_mode_combo.addItem(label, mode)
+        buttons_layout.addWidget(self.import_mode_combo)
+
         # Export Excel button
         export_excel_btn = QPushButton(self.tr_text('export_excel'))
         export_excel_btn.clicked.connect(self.export_customers_excel)
@@ -237,18 +1086,58 @@ class CRMDashboard(QMainWindow):
         template_btn = QPushButton(self.tr_text('download_template'))
         template_btn.clicked.connect(lambda: self.export_template('customers'))
         buttons_layout.addWidget(template_btn)
+        update_template_btn = QPushButton(self.tr_text('download_update_template'))
+        update_template_btn.clicked.connect(lambda: self.export_template('customers_update'))
+        buttons_layout.addWidget(update_template_btn)
+
+        # Near-duplicate search and merge review
+        duplicates_btn = QPushButton(self.tr_text('find_duplicates'))
+        duplicates_btn.clicked.connect(self.find_duplicates)
+        buttons_layout.addWidget(duplicates_btn)
 
         # Add stretch to push buttons to the left
         buttons_layout.addStretch()
         layout.addLayout(buttons_layout)
 
+        # Search box; the query runs once typing pauses
+        search_layout = QHBoxLayout()
+        self.customer_search = QLineEdit()
+        self.customer_search.setPlaceholderText(self.tr_text('search_customers'))
+        self.customer_search.setClearButtonEnabled(True)
+        self.customer_search_timer = QTimer(self)
+        self.customer_search_timer.setSingleShot(True)
+        self.customer_search_timer.setInterval(150)
+        self.customer_search_timer.timeout.connect(self.apply_customer_search)
+        self.customer_search.textChanged.connect(
+            lambda _: self.customer_search_timer.start())
+        search_layout.addWidget(self.customer_search)
+        self.customer_search_count = QLabel()
+        search_layout.addWidget(self.customer_search_count)
+        layout.addLayout(search_layout)
+
+        # Column filters; they combine with the search
+        filter_layout = QHBoxLayout()
+        self.customer_category_filter = self.create_filter_combo(
+            self.customers_model_filter('category'))
+        self.customer_category_filter.addItems(CUSTOMER_CATEGORIES)
+        self.customer_country_filter = self.create_filter_combo(
+            self.customers_model_filter('country'))
+        self.customer_date_from = self.create_date_filter()
+        self.customer_date_to = self.create_date_filter()
+        for label, widget in ((self.tr_text('category'), self.customer_category_filter),
+                              (self.tr_text('country'), self.customer_country_filter),
+                              (self.tr_text('registered_from'), self.customer_date_from),
+                              (self.tr_text('registered_to'), self.customer_date_to)):
+            filter_layout.addWidget(QLabel(label))
+            filter_layout.addWidget(widget)
+        self.customer_date_from.dateChanged.connect(lambda _: self.apply_date_filter())
+        self.customer_date_to.dateChanged.connect(lambda _: self.apply_date_filter())
+        filter_layout.addStretch()
+        layout.addLayout(filter_layout)
+
         # Create and setup customers table
-        self.customers_table = QTableWidget()
-        self.customers_table.setAlternatingRowColors(True)
-        self.customers_table.setSelectionBehavior(QTableWidget.SelectRows)
-        self.customers_table.setSelectionMode(QTableWidget.SingleSelection)
-        self.customers_table.horizontalHeader().setStretchLastSection(True)
-        self.customers_table.verticalHeader().setVisible(False)
+        self.customers_model = DataFrameTableModel(self)
+        self.customers_table = self.create_table_view(self.customers_model)
         layout.addWidget(self.customers_table)
 
         tab.setLayout(layout)
@@ -268,7 +1157,7 @@ class CRMDashboard(QMainWindow):
         buttons_layout.addWidget(import_products_btn)
         
         # Export Excel button
-        export_excel_btn = QPushButton("Export to Excel")
+        export_excel_btn = QPushButton(self.tr_text('export_excel'))
         export_excel_btn.clicked.connect(self.export_products_excel)
         buttons_layout.addWidget(export_excel_btn)
         
@@ -281,18 +1170,128 @@ class CRMDashboard(QMainWindow):
         buttons_layout.addStretch()
         layout.addLayout(buttons_layout)
         
+        # Column filters
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(QLabel(self.tr_text('category')))
+        self.product_category_filter = self.create_filter_combo(
+            lambda value: self.products_model.set_column_filter(
+                'category', None if value is None else {value}))
+        filter_layout.addWidget(self.product_category_filter)
+        # Shows the products at or below the threshold as they are now;
+        # toggle it again to pick up later movements
+        self.low_stock_check = QCheckBox(self.tr_text('low_stock'))
+        self.low_stock_check.toggled.connect(self.apply_low_stock_filter)
+        filter_layout.addWidget(self.low_stock_check)
+        self.low_stock_threshold = QSpinBox()
+        self.low_stock_threshold.setRange(0, 1000000)
+        self.low_stock_threshold.setValue(LOW_STOCK_THRESHOLD)
+        self.low_stock_threshold.valueChanged.connect(self.apply_low_stock_filter)
+        filter_layout.addWidget(self.low_stock_threshold)
+        filter_layout.addStretch()
+        layout.addLayout(filter_layout)
+
+        # Stock movements by hand: a receipt, a sale or a stock count
+        stock_layout = QHBoxLayout()
+        self.stock_product_id = QLineEdit()
+        self.stock_product_id.setPlaceholderText(self.tr_text('product_id'))
+        stock_layout.addWidget(self.stock_product_id)
+        self.stock_kind = QComboBox()
+        for kind in STOCK_MOVEMENT_KINDS:
+            self.stock_kind.addItem(kind.capitalize(), kind)
+        stock_layout.addWidget(self.stock_kind)
+        self.stock_quantity = QSpinBox()
+        self.stock_quantity.setRange(0, 1000000)
+        self.stock_quantity.setValue(1)
+        stock_layout.addWidget(self.stock_quantity)
+        stock_btn = QPushButton(self.tr_text('move_stock'))
+        stock_btn.clicked.connect(self.apply_stock_movement)
+        stock_layout.addWidget(stock_btn)
+        stock_layout.addStretch()
+        layout.addLayout(stock_layout)
+
         # Create and setup products table
-        self.products_table = QTableWidget()
-        self.products_table.setAlternatingRowColors(True)
-        self.products_table.setSelectionBehavior(QTableWidget.SelectRows)
-        self.products_table.setSelectionMode(QTableWidget.SingleSelection)
-        self.products_table.horizontalHeader().setStretchLastSection(True)
-        self.products_table.verticalHeader().setVisible(False)
+        self.products_model = DataFrameTableModel(self)
+        self.products_table = self.create_table_view(self.products_model)
         layout.addWidget(self.products_table)
         
         tab.setLayout(layout)
         return tab
 
+    def apply_low_stock_filter(self):
+        if not self.low_stock_check.isChecked():
+            self.products_model.set_row_filter(None)
+            return
+        by_id = self.data.product_index.by_id
+        self.products_model.set_row_filter(
+            [by_id[product_id] for product_id, _ in
+             self.data.product_index.low_stock(self.low_stock_threshold.value())])
+
+    def apply_stock_movement(self):
+        try:
+            self.data.move_stock([(self.stock_product_id.text(), self.stock_kind.currentData(),
+                                   self.stock_quantity.value())])
+        except StockError as e:
+            QMessageBox.warning(self, self.tr_text('warning'), str(e))
+
+    def customers_model_filter(self, column):
+        return lambda value: self.customers_model.set_column_filter(
+            column, None if value is None else {value})
+
+    def create_filter_combo(self, apply_filter):
+        # The first entry shows every row; the others filter on their text
+        combo = QComboBox()
+        combo.addItem(self.tr_text('all'))
+        combo.currentIndexChanged.connect(
+            lambda index: apply_filter(combo.currentText() if index > 0 else None))
+        return combo
+
+    def create_date_filter(self):
+        # The minimum date stands for an open bound and shows as "Any"
+        edit = QDateEdit()
+        edit.setCalendarPopup(True)
+        edit.setDisplayFormat("yyyy-MM-dd")
+        edit.setMinimumDate(FILTER_DATE_ANY)
+        edit.setSpecialValueText(self.tr_text('any'))
+        edit.setDate(FILTER_DATE_ANY)
+        return edit
+
+    def apply_date_filter(self):
+        start, end = self.customer_date_from.date(), self.customer_date_to.date()
+        start = None if start == FILTER_DATE_ANY else start.toPyDate()
+        # The end date is inclusive
+        end = None if end == FILTER_DATE_ANY else end.addDays(1).toPyDate()
+        self.customers_model.set_column_filter(
+            'registration_date', None if start is None and end is None else (start, end))
+
+    def refresh_filter_choices(self):
+        # Countries and product categories come from the data, so their
+        # lists are refreshed after loads and imports
+        for combo, values in (
+                (self.customer_country_filter,
+                 self.data.analytics.customer_groups['country'].index),
+                (self.product_category_filter, self.data.analytics.stock['category'].index)):
+            current = combo.currentText()
+            combo.blockSignals(True)
+            while combo.count() > 1:
+                combo.removeItem(1)
+            combo.addItems(sorted(str(value) for value in values if value != BLANK_LABEL))
+            combo.setCurrentIndex(max(combo.findText(current), 0))
+            combo.blockSignals(False)
+
+    def create_table_view(self, model):
+        table = QTableView()
+        table.setModel(model)
+        table.setAlternatingRowColors(True)
+        table.setSelectionBehavior(QTableView.SelectRows)
+        table.setSelectionMode(QTableView.SingleSelection)
+        table.setSortingEnabled(True)
+        table.horizontalHeader().setStretchLastSection(True)
+        # Only sample the rows around the viewport when sizing columns
+        table.horizontalHeader().setResizeContentsPrecision(200)
+        table.verticalHeader().setVisible(False)
+        table.verticalHeader().setDefaultSectionSize(28)
+        return table
+
     def create_analytics_tab(self):
         tab = QWidget()
         layout = QVBoxLayout()
@@ -312,17 +1311,110 @@ class CRMDashboard(QMainWindow):
         """)
         title_label.setAlignment(Qt.AlignCenter)
         analytics_layout.addWidget(title_label)
-        
-        # Add placeholder for future analytics features
-        placeholder_label = QLabel("Analytics features coming soon...")
-        placeholder_label.setAlignment(Qt.AlignCenter)
-        placeholder_label.setStyleSheet("color: #7f8c8d; font-size: 14px;")
-        analytics_layout.addWidget(placeholder_label)
-        
+
+        self.analytics_summary = QLabel()
+        self.analytics_summary.setAlignment(Qt.AlignCenter)
+        self.analytics_summary.setStyleSheet("color: #2c3e50; font-size: 14px;")
+        analytics_layout.addWidget(self.analytics_summary)
+
+        # One breakdown table per aggregate; they are filled from the cached
+        # aggregates by refresh_analytics()
+        grid = QGridLayout()
+        self.analytics_tables = {}
+        panels = [('category', "Customers by Category"),
+                  ('country', "Customers by Country"),
+                  ('city', "Customers by City"),
+                  ('preferred_contact', "Preferred Contact Method"),
+                  ('registrations', "Registrations"),
+                  ('stock_category', "Stock Value by Category"),
+                  ('stock_supplier', "Stock Value by Supplier")]
+        for position, (key, title) in enumerate(panels):
+            box = QGroupBox(title)
+            box_layout = QVBoxLayout(box)
+            if key == 'registrations':
+                self.registrations_period = QComboBox()
+                for period in ANALYTICS_PERIODS:
+                    self.registrations_period.addItem(f"Per {period}", period)
+                self.registrations_period.setCurrentIndex(len(ANALYTICS_PERIODS) - 1)
+                self.registrations_period.currentIndexChanged.connect(
+                    lambda _: self.refresh_analytics(force=True))
+                box_layout.addWidget(self.registrations_period)
+            table = QTableWidget(0, 0)
+            table.setEditTriggers(QTableWidget.NoEditTriggers)
+            table.verticalHeader().setVisible(False)
+            table.horizontalHeader().setStretchLastSection(True)
+            box_layout.addWidget(table)
+            self.analytics_tables[key] = table
+            grid.addWidget(box, position // 4, position % 4)
+        analytics_layout.addLayout(grid)
+
         layout.addWidget(analytics_frame)
         tab.setLayout(layout)
+
+        self.analytics_shown_version = None
+        self.analytics_timer = QTimer(self)
+        self.analytics_timer.setSingleShot(True)
+        self.analytics_timer.setInterval(300)
+        self.analytics_timer.timeout.connect(self.refresh_analytics)
         return tab
 
+    def fill_analytics_table(self, key, headers, rows):
+        table = self.analytics_tables[key]
+        table.setRowCount(0)
+        table.setColumnCount(len(headers))
+        table.setHorizontalHeaderLabels(headers)
+        table.setRowCount(len(rows))
+        for row, values in enumerate(rows):
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if column:
+                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                table.setItem(row, column, item)
+        table.resizeColumnsToContents()
+
+    def analytics_changed(self):
+        # Repaint shortly after a batch of changes, and only when visible
+        if self.tab_widget.currentWidget() is self.analytics_tab:
+            self.analytics_timer.start()
+
+    def refresh_analytics(self, force=False):
+        # Renders the cached aggregates; nothing here touches the tables
+        if self.tab_widget.currentWidget() is not self.analytics_tab:
+            return
+        analytics = self.data.analytics
+        if not force and self.analytics_shown_version == analytics.version:
+            return
+        self.analytics_shown_version = analytics.version
+
+        self.analytics_summary.setText(
+            f"Customers: {analytics.customer_count:,}    "
+            f"Products: {analytics.product_count:,}    "
+            f"Stock value: {analytics.stock_value():,.2f}")
+
+        total = max(analytics.customer_count, 1)
+        for name, counts in analytics.customer_groups.items():
+            counts = counts.sort_values(ascending=False).head(ANALYTICS_TOP_GROUPS)
+            self.fill_analytics_table(
+                name, ["Value", "Customers", "Share"],
+                [(str(label), f"{count:,}", f"{100 * count / total:.1f}%")
+                 for label, count in counts.items()])
+
+        period = self.registrations_period.currentData()
+        registrations = analytics.registrations(period).sort_index(ascending=False)
+        date_format = {'day': '%Y-%m-%d', 'week': 'Week of %Y-%m-%d', 'month': '%Y-%m'}[period]
+        self.fill_analytics_table(
+            'registrations', ["Period", "Customers"],
+            [(date.strftime(date_format), f"{count:,}")
+             for date, count in registrations.head(ANALYTICS_TOP_GROUPS).items()])
+
+        for name in ANALYTICS_PRODUCT_GROUPS:
+            stock = analytics.stock[name].sort_values('value', ascending=False)
+            self.fill_analytics_table(
+                f"stock_{name}", ["Value", "Products", "Units", "Stock Value"],
+                [(str(label), f"{int(row.products):,}", f"{int(row.units):,}",
+                  f"{row.value:,.2f}")
+                 for label, row in stock.head(ANALYTICS_TOP_GROUPS).iterrows()])
+
     def show_add_customer_form(self):
         self.customer_form = QWidget()
         self.customer_form.setWindowTitle(self.tr_text('add_customer'))
@@ -371,14 +1463,10 @@ class CRMDashboard(QMainWindow):
         for field_key, field_labels in fields.items():
             if field_key == 'category':
                 self.form_fields[field_key] = QComboBox()
-                self.form_fields[field_key].addItems([
-                    "Real Estate", "Tourism", "E-store", "Retail", "Other"
-                ])
+                self.form_fields[field_key].addItems(CUSTOMER_CATEGORIES)
             elif field_key == 'preferred_contact':
                 self.form_fields[field_key] = QComboBox()
-                self.form_fields[field_key].addItems([
-                    "Email", "Phone", "Facebook", "Instagram", "Twitter", "LinkedIn"
-                ])
+                self.form_fields[field_key].addItems(CONTACT_METHODS)
             elif field_key == 'notes':
                 self.form_fields[field_key] = QTextEdit()
                 self.form_fields[field_key].setMaximumHeight(100)
@@ -390,142 +1478,45 @@ class CRMDashboard(QMainWindow):
         section.setLayout(layout)
         return section
 
-    def create_sample_template(self, template_type='customers'):
-        if template_type == 'customers':
-            sample_data = {
-                'name': ['John Doe', 'Jane Smith'],
-                'email': ['john@example.com', 'jane@example.com'],
-                'phone': ['+1234567890', '+0987654321'],
-                'alternative_phone': ['+1122334455', '+5544332211'],
-                'category': ['Real Estate', 'Tourism'],
-                'facebook': ['fb.com/john', 'fb.com/jane'],
-                'instagram': ['@john_doe', '@jane_smith'],
-                'twitter': ['@johnd', '@janes'],
-                'linkedin': ['linkedin.com/john', 'linkedin.com/jane'],
-                'preferred_contact': ['Email', 'Phone'],
-                'company': ['ABC Corp', 'XYZ Ltd'],
-                'position': ['Manager', 'Director'],
-                'address': ['123 Main St', '456 Oak Ave'],
-                'city': ['New York', 'Los Angeles'],
-                'country': ['USA', 'USA'],
-                'notes': ['VIP Customer', 'Regular Customer']
-            }
-        else:  # products template
-            sample_data = {
-                'product_id': ['PRD001', 'PRD002'],
-                'name': ['Product 1', 'Product 2'],
-                'category': ['Category A', 'Category B'],
-                'price': [99.99, 149.99],
-                'stock': [100, 50],
-                'description': ['Product 1 description', 'Product 2 description'],
-                'supplier': ['Supplier A', 'Supplier B'],
-                'status': ['Active', 'Active']
-            }
-        
-        df = pd.DataFrame(sample_data)
-        return df
+    def template_headers(self, template_type):
+        # Localized customer templates are headed with the form labels, so
+        # editing customer_fields gives a new cached template. English ones
+        # keep the field names.
+        if self.current_language == 'en' or not template_type.startswith('customers'):
+            return None
+        return {field: labels[self.current_language]
+                for section in self.customer_fields.values()
+                for field, labels in section.items()}
+
+    def header_aliases(self, table):
+        # Headers imports map to field names: the shared localized ones plus
+        # the form labels customer templates may be headed with
+        aliases = dict(IMPORT_HEADER_ALIASES[table])
+        if table == 'customers':
+            aliases.update((label, field)
+                           for section in self.customer_fields.values()
+                           for field, labels in section.items()
+                           for language, label in labels.items() if language != 'en')
+        return aliases
 
     def export_template(self, template_type='customers'):
         try:
-            template_df = self.create_sample_template(template_type)
-            
             file_name, _ = QFileDialog.getSaveFileName(
-                self, f"Save {template_type.capitalize()} Template", 
+                self, f"Save {template_type.replace('_', ' ').title()} Template",
                 f"{template_type}_template.xlsx", 
                 "Excel Files (*.xlsx)")
             
             if file_name:
-                wb = Workbook()
-                ws = wb.active
-                ws.title = f"{template_type.capitalize()} Template"
-
-                # Style the header
-                header_fill = PatternFill(start_color="1F497D", 
-                                        end_color="1F497D", 
-                                        fill_type="solid")
-                header_font = Font(color="FFFFFF", bold=True)
-                header_alignment = Alignment(horizontal="center", 
-                                          vertical="center")
-                border = Border(left=Side(style='thin'), 
-                              right=Side(style='thin'),
-                              top=Side(style='thin'), 
-                              bottom=Side(style='thin'))
-
-                # Write headers
-                for col, header in enumerate(template_df.columns, 1):
-                    cell = ws.cell(row=1, column=col, value=header)
-                    cell.fill = header_fill
-                    cell.font = header_font
-                    cell.alignment = header_alignment
-                    cell.border = border
-
-                # Write sample data
-                for row, data in enumerate(template_df.values, 2):
-                    for col, value in enumerate(data, 1):
-                        cell = ws.cell(row=row, column=col, value=value)
-                        cell.border = border
-                        cell.alignment = Alignment(horizontal="left")
-
-                # Add instructions sheet
-                ws_instructions = wb.create_sheet("Instructions")
-                instructions = [
-                    "Instructions for using this template:",
-                    "",
-                    f"1. This is a sample {template_type} template with example data",
-                    "2. Replace the example data with your actual data",
-                    "3. Keep the column headers exactly as they are",
-                    "4. Save the file and use it to import into the CRM system",
-                    "",
-                    "Required fields:",
-                ]
-                
-                if template_type == 'customers':
-                    required_fields = ["name", "email", "phone"]
-                else:
-                    required_fields = ["product_id", "name", "category"]
-                
-                for idx, instruction in enumerate(instructions, 1):
-                    ws_instructions.cell(row=idx, column=1, value=instruction)
-                
-                for idx, field in enumerate(required_fields, len(instructions) + 2):
-                    ws_instructions.cell(row=idx, column=1, value=f"- {field}")
-
-                # Adjust column widths
-                for ws in [ws, ws_instructions]:
-                    for column in ws.columns:
-                        max_length = 0
-                        column = [cell for cell in column]
-                        for cell in column:
-                            try:
-                                if len(str(cell.value)) > max_length:
-                                    max_length = len(str(cell.value))
-                            except:
-                                pass
-                        adjusted_width = (max_length + 2)
-                        ws.column_dimensions[column[0].column_letter].width = adjusted_width
-
-                wb.save(file_name)
+                # Built once per schema and language, then only copied
+                self.data.templates.export(template_type, file_name, self.current_language,
+                                           self.template_headers(template_type))
                 QMessageBox.information(self, "Success", 
-                                      f"{template_type.capitalize()} template created successfully!")
+                                      f"{template_type.replace('_', ' ').capitalize()} "
+                                      f"template created successfully!")
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Error creating template: {str(e)}")
     def add_customer(self):
         try:
-            # Validate required fields
-            required_fields = ['name', 'email', 'phone']
-            for field in required_fields:
-                if not self.form_fields[field].text().strip():
-                    QMessageBox.warning(self, self.tr_text('warning'),
-                                      f"{field.capitalize()} is required!")
-                    return
-
-            # Validate email format
-            email = self.form_fields['email'].text()
-            if not re.match(r"[^@]+@[^@]+\.[^@]+", email):
-                QMessageBox.warning(self, self.tr_text('warning'),
-                                  "Invalid email format!")
-                return
-
             # Create new customer dictionary
             new_customer = {}
             for section in self.customer_fields.values():
@@ -537,18 +1528,14 @@ class CRMDashboard(QMainWindow):
                     else:
                         new_customer[field_key] = self.form_fields[field_key].text()
 
-            # Add timestamp and customer ID
-            new_customer['registration_date'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            new_customer['customer_id'] = f"CUS{len(self.customers_data) + 1:06d}"
-
-            # Add to DataFrame
-            self.customers_data = pd.concat([self.customers_data, 
-                                           pd.DataFrame([new_customer])], 
-                                          ignore_index=True)
-            
-            # Update table and save data
-            self.update_customers_table()
-            self.save_data()
+            # Same checks and normalization as imported rows
+            try:
+                self.data.add_customer(new_customer)
+            except ValidationError as e:
+                errors = str(e)
+                QMessageBox.warning(self, self.tr_text('warning'),
+                                  f"{errors[0].upper()}{errors[1:]}!")
+                return
             
             # Close form and show success message
             self.customer_form.close()
@@ -561,74 +1548,215 @@ class CRMDashboard(QMainWindow):
 
     def import_customers(self):
         try:
-            file_name, _ = QFileDialog.getOpenFileName(
+            file_names, _ = QFileDialog.getOpenFileNames(
                 self, "Import Customers", "", 
-                "Excel Files (*.xlsx *.xls);;CSV Files (*.csv)")
-            if file_name:
-                if file_name.endswith(('.xlsx', '.xls')):
-                    imported_data = pd.read_excel(file_name)
-                else:
-                    imported_data = pd.read_csv(file_name)
-                
-                # Validate required columns
-                required_columns = ['name', 'email', 'phone']
-                missing_columns = [col for col in required_columns if col not in imported_data.columns]
-                if missing_columns:
-                    QMessageBox.warning(self, self.tr_text('warning'),
-                                      f"Missing required columns: {', '.join(missing_columns)}")
-                    return
-
-                # Add customer IDs and registration dates if not present
-                if 'customer_id' not in imported_data.columns:
-                    start_id = len(self.customers_data) + 1
-                    imported_data['customer_id'] = [f"CUS{i:06d}" for i in range(start_id, start_id + len(imported_data))]
-                
-                if 'registration_date' not in imported_data.columns:
-                    imported_data['registration_date'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-                # Concatenate with existing data
-                self.customers_data = pd.concat([self.customers_data, imported_data], 
-                                              ignore_index=True)
-                
-                self.update_customers_table()
-                self.save_data()
-                QMessageBox.information(self, self.tr_text('success'),
-                                      "Customers imported successfully!")
+                IMPORT_FILE_FILTER)
+            if file_names:
+                self.import_files('customers', file_names,
+                                  self.import_mode_combo.currentData())
         except Exception as e:
             QMessageBox.critical(self, self.tr_text('error'),
                                f"Error importing file: {str(e)}")
 
+    def import_customers_folder(self):
+        try:
+            folder = QFileDialog.getExistingDirectory(self, "Import Customers Folder")
+            if folder:
+                self.import_batch('customers', [folder],
+                                  self.import_mode_combo.currentData())
+        except Exception as e:
+            QMessageBox.critical(self, self.tr_text('error'),
+                               f"Error importing folder: {str(e)}")
+
+    def import_files(self, table, file_names, mode='upsert'):
+        # A single file with a single sheet streams in chunk by chunk;
+        # anything more goes through the parallel batch import
+        if len(file_names) == 1 and len(import_sources(file_names)) == 1:
+            return self.import_file(table, file_names[0], mode)
+        return self.import_batch(table, file_names, mode)
+
+    def save_rejected_rows(self, report):
+        answer = QMessageBox.question(
+            self, self.tr_text('warning'),
+            f"{len(report)} rows were rejected. Save the error report?",
+            QMessageBox.Yes | QMessageBox.No)
+        if answer != QMessageBox.Yes:
+            return
+        file_name, _ = QFileDialog.getSaveFileName(
+            self, "Save Error Report", "import_errors.csv", "CSV Files (*.csv)")
+        if file_name:
+            try:
+                # BOM so Excel shows Arabic text correctly
+                report.to_csv(file_name, index=False, encoding='utf-8-sig')
+            except Exception as e:
+                QMessageBox.critical(self, self.tr_text('error'),
+                                   f"Error saving error report: {str(e)}")
+
     def import_products(self):
         try:
-            file_name, _ = QFileDialog.getOpenFileName(
+            file_names, _ = QFileDialog.getOpenFileNames(
                 self, "Import Products", "", 
-                "Excel Files (*.xlsx *.xls);;CSV Files (*.csv)")
-            if file_name:
-                if file_name.endswith(('.xlsx', '.xls')):
-                    imported_data = pd.read_excel(file_name)
-                else:
-                    imported_data = pd.read_csv(file_name)
-                
-                # Validate required columns
-                required_columns = ['product_id', 'name', 'category']
-                missing_columns = [col for col in required_columns if col not in imported_data.columns]
-                if missing_columns:
-                    QMessageBox.warning(self, self.tr_text('warning'),
-                                      f"Missing required columns: {', '.join(missing_columns)}")
-                    return
-
-                # Concatenate with existing data
-                self.products_data = pd.concat([self.products_data, imported_data], 
-                                             ignore_index=True)
-                
-                self.update_products_table()
-                self.save_data()
-                QMessageBox.information(self, self.tr_text('success'),
-                                      "Products imported successfully!")
+                IMPORT_FILE_FILTER)
+            if file_names:
+                self.import_files('products', file_names)
         except Exception as e:
             QMessageBox.critical(self, self.tr_text('error'),
                                f"Error importing file: {str(e)}")
 
+    def import_file(self, table, file_name, mode='upsert'):
+        # Parsing and CRMData.prepare_chunk run on a worker thread; each chunk
+        # is then merged on the GUI thread by CRMData.apply_chunk. A cancelled
+        # import keeps the chunks that were already merged.
+        summary = {'inserted': 0, 'updated': 0, 'skipped': 0}
+        rejected = []
+        # Spans the worker and the merges on the GUI thread, so it is
+        # recorded by hand when the job ends; prepare and merge are timed
+        # per chunk by CRMData
+        record = {'operation': 'import',
+                  'started': datetime.now().isoformat(timespec='milliseconds'),
+                  'table': table, 'file': file_name, 'mode': mode,
+                  'bytes': os.path.getsize(file_name), 'rows': 0}
+        started = time.perf_counter()
+
+        def work(job):
+            parsed = 0
+            for chunk, fraction in iter_import_chunks(
+                    file_name, IMPORT_REQUIRED_COLUMNS[table],
+                    aliases=self.header_aliases(table)):
+                if job.cancelled():
+                    break
+                rows = len(chunk)
+                chunk, report = self.data.prepare_chunk(table, chunk.copy(), parsed + 1)
+                if len(report):
+                    rejected.append(report)
+                parsed += rows
+                if len(chunk):
+                    job.emit_chunk(chunk)
+                job.report(fraction, f"{parsed} rows")
+            record['rows'] = parsed
+            return parsed
+
+        def log_import(error=None):
+            record.update(summary, seconds=round(time.perf_counter() - started, 6),
+                          rejected=sum(len(report) for report in rejected))
+            if error is not None:
+                record['error'] = f"{type(error).__name__}: {error}"
+            perf.emit(record)
+
+        def merge_chunk(chunk):
+            for key, count in self.data.apply_chunk(table, chunk, mode).items():
+                summary[key] += count
+
+        def finished(_):
+            log_import()
+            self.refresh_filter_choices()
+            if table == 'customers' and self.search_index.needs_rebuild():
+                self.rebuild_search_index()
+            rejected_rows = sum(len(report) for report in rejected)
+            QMessageBox.information(self, self.tr_text('success'),
+                                  f"{table.capitalize()} imported successfully!\n"
+                                  f"Inserted: {summary['inserted']}, "
+                                  f"updated: {summary['updated']}, "
+                                  f"skipped: {summary['skipped']}, "
+                                  f"rejected: {rejected_rows}")
+            if rejected:
+                self.save_rejected_rows(pd.concat(rejected, ignore_index=True))
+
+        def failed(error):
+            log_import(error)
+            if isinstance(error, MissingColumnsError):
+                QMessageBox.warning(self, self.tr_text('warning'), str(error))
+            else:
+                QMessageBox.critical(self, self.tr_text('error'),
+                                   f"Error importing file: {str(error)}")
+            if rejected:
+                self.save_rejected_rows(pd.concat(rejected, ignore_index=True))
+
+        return self.start_job(f"Import {table}: {os.path.basename(file_name)}", work,
+                              on_chunk=merge_chunk, on_finished=finished,
+                              on_failed=failed)
+
+    def find_duplicates(self):
+        # Clustering runs on a worker thread over a copy of the columns it
+        # reads; the review dialog opens when it is done
+        frame = self.customers_data
+        frame = frame[[c for c in ['customer_id', 'name', 'email', 'phone',
+                                   'alternative_phone', 'city'] if c in frame.columns]].copy()
+
+        def finished(clusters):
+            if clusters is None:
+                return
+            if not clusters:
+                QMessageBox.information(self, self.tr_text('success'),
+                                      "No duplicate customers found.")
+                return
+            dialog = DuplicateReviewDialog(frame, clusters, self)
+            if dialog.exec_() != QDialog.Accepted:
+                return
+            by_id = self.data.customer_index.by_id
+            selected = [[by_id[i] for i in ids if i in by_id]
+                        for ids in dialog.selected_clusters()]
+            try:
+                removed = self.data.merge_duplicates(selected)
+            except Exception as e:
+                QMessageBox.critical(self, self.tr_text('error'),
+                                   f"Error merging customers: {str(e)}")
+                return
+            QMessageBox.information(self, self.tr_text('success'),
+                                  f"{removed} duplicate customers merged.")
+
+        def failed(error):
+            QMessageBox.critical(self, self.tr_text('error'),
+                               f"Error finding duplicates: {str(error)}")
+
+        return self.start_job("Find duplicates",
+                              lambda job: find_duplicate_customers(frame, job=job),
+                              on_finished=finished, on_failed=failed)
+
+    def import_batch(self, table, paths, mode='upsert'):
+        # The files, folders and sheets are parsed in parallel by
+        # parse_import_batch on a worker thread; the rows are merged in one
+        # step on the GUI thread once every source is read, so a failed or
+        # cancelled batch changes nothing
+        aliases = self.header_aliases(table)
+
+        def finished(parsed):
+            if parsed is None:
+                return
+            rows, rejected, results = parsed
+            try:
+                summary = self.data.apply_chunk(table, rows, mode)
+            except Exception as e:
+                QMessageBox.critical(self, self.tr_text('error'),
+                                   f"Error importing files: {str(e)}")
+                return
+            self.refresh_filter_choices()
+            if table == 'customers' and self.search_index.needs_rebuild():
+                self.rebuild_search_index()
+            skipped = [os.path.basename(r['file'])
+                       + (f" [{r['sheet']}]" if r['sheet'] else "") + f": {r['error']}"
+                       for r in results if r['error']]
+            QMessageBox.information(self, self.tr_text('success'),
+                                  f"{len(results) - len(skipped)} of {len(results)} "
+                                  f"sources imported.\n"
+                                  f"Inserted: {summary['inserted']}, "
+                                  f"updated: {summary['updated']}, "
+                                  f"skipped: {summary['skipped']}, "
+                                  f"rejected: {len(rejected)}"
+                                  + "".join(f"\nSkipped {line}" for line in skipped))
+            if len(rejected):
+                self.save_rejected_rows(rejected)
+
+        def failed(error):
+            QMessageBox.critical(self, self.tr_text('error'),
+                               f"Error importing files: {str(error)}")
+
+        title = os.path.basename(paths[0]) if len(paths) == 1 else f"{len(paths)} files"
+        return self.start_job(f"Import {table}: {title}",
+                              lambda job: parse_import_batch(table, paths, job=job,
+                                                             aliases=aliases),
+                              on_finished=finished, on_failed=failed)
+
     def export_customers_excel(self):
         if self.customers_data.empty:
             QMessageBox.warning(self, self.tr_text('warning'), 
@@ -636,57 +1764,11 @@ class CRMDashboard(QMainWindow):
             return
 
         try:
-            file_name, _ = QFileDialog.getSaveFileName(
-                self, "Export Customers", "", 
-                "Excel Files (*.xlsx)")
+            file_name, selected_filter = QFileDialog.getSaveFileName(
+                self, "Export Customers", "", EXPORT_FILE_FILTER)
             
             if file_name:
-                wb = Workbook()
-                ws = wb.active
-                ws.title = "Customer Data"         
-         # Style definitions
-                header_fill = PatternFill(start_color="1F497D", 
-                                        end_color="1F497D", 
-                                        fill_type="solid")
-                header_font = Font(color="FFFFFF", bold=True)
-                header_alignment = Alignment(horizontal="center", 
-                                          vertical="center")
-                border = Border(left=Side(style='thin'), 
-                              right=Side(style='thin'),
-                              top=Side(style='thin'), 
-                              bottom=Side(style='thin'))
-
-                # Write headers with styling
-                for col, header in enumerate(self.customers_data.columns, 1):
-                    cell = ws.cell(row=1, column=col, value=header)
-                    cell.fill = header_fill
-                    cell.font = header_font
-                    cell.alignment = header_alignment
-                    cell.border = border
-
-                # Write data
-                for row, data in enumerate(self.customers_data.values, 2):
-                    for col, value in enumerate(data, 1):
-                        cell = ws.cell(row=row, column=col, value=value)
-                        cell.border = border
-                        cell.alignment = Alignment(horizontal="left")
-
-                # Auto-adjust column widths
-                for column in ws.columns:
-                    max_length = 0
-                    column = [cell for cell in column]
-                    for cell in column:
-                        try:
-                            if len(str(cell.value)) > max_length:
-                                max_length = len(str(cell.value))
-                        except:
-                            pass
-                    adjusted_width = (max_length + 2)
-                    ws.column_dimensions[column[0].column_letter].width = adjusted_width
-
-                wb.save(file_name)
-                QMessageBox.information(self, self.tr_text('success'),
-                                      "Customers exported successfully!")
+                self.export_table('customers', file_name, selected_filter)
         except Exception as e:
             QMessageBox.critical(self, self.tr_text('error'),
                                f"Error exporting file: {str(e)}")
@@ -698,125 +1780,103 @@ class CRMDashboard(QMainWindow):
             return
 
         try:
-            file_name, _ = QFileDialog.getSaveFileName(
-                self, "Export Products", "", 
-                "Excel Files (*.xlsx)")
+            file_name, selected_filter = QFileDialog.getSaveFileName(
+                self, "Export Products", "", EXPORT_FILE_FILTER)
             
             if file_name:
-                wb = Workbook()
-                ws = wb.active
-                ws.title = "Product Data"
-
-                # Style definitions
-                header_fill = PatternFill(start_color="1F497D", 
-                                        end_color="1F497D", 
-                                        fill_type="solid")
-                header_font = Font(color="FFFFFF", bold=True)
-                header_alignment = Alignment(horizontal="center", 
-                                          vertical="center")
-                border = Border(left=Side(style='thin'), 
-                              right=Side(style='thin'),
-                              top=Side(style='thin'), 
-                              bottom=Side(style='thin'))
-
-                # Write headers with styling
-                for col, header in enumerate(self.products_data.columns, 1):
-                    cell = ws.cell(row=1, column=col, value=header)
-                    cell.fill = header_fill
-                    cell.font = header_font
-                    cell.alignment = header_alignment
-                    cell.border = border
-
-                # Write data
-                for row, data in enumerate(self.products_data.values, 2):
-                    for col, value in enumerate(data, 1):
-                        cell = ws.cell(row=row, column=col, value=value)
-                        cell.border = border
-                        cell.alignment = Alignment(horizontal="left")
-
-                # Auto-adjust column widths
-                for column in ws.columns:
-                    max_length = 0
-                    column = [cell for cell in column]
-                    for cell in column:
-                        try:
-                            if len(str(cell.value)) > max_length:
-                                max_length = len(str(cell.value))
-                        except:
-                            pass
-                    adjusted_width = (max_length + 2)
-                    ws.column_dimensions[column[0].column_letter].width = adjusted_width
-
-                wb.save(file_name)
-                QMessageBox.information(self, self.tr_text('success'),
-                                      "Products exported successfully!")
+                self.export_table('products', file_name, selected_filter)
         except Exception as e:
             QMessageBox.critical(self, self.tr_text('error'),
                                f"Error exporting file: {str(e)}")
 
-    def update_customers_table(self):
-        try:
-            self.customers_table.setRowCount(len(self.customers_data))
-            self.customers_table.setColumnCount(len(self.customers_data.columns))
-            self.customers_table.setHorizontalHeaderLabels(self.customers_data.columns)
+    def export_table(self, table, file_name, selected_filter=''):
+        # Add the extension of the chosen filter when the name has none
+        if os.path.splitext(file_name)[1].lower() not in EXPORT_FORMATS:
+            match = re.search(r'\*(\.\w+)', selected_filter or '')
+            file_name += match.group(1) if match else '.xlsx'
 
-            header = self.customers_table.horizontalHeader()
-            for i in range(len(self.customers_data.columns)):
-                header.setSectionResizeMode(i, QHeaderView.ResizeToContents)
+        # The worker gets its own copy so edits made during the export
+        # cannot change the frame under it
+        frame = self.data.table_frame(table).copy()
 
-            for i in range(len(self.customers_data)):
-                for j in range(len(self.customers_data.columns)):
-                    item = QTableWidgetItem(str(self.customers_data.iloc[i, j]))
-                    self.customers_table.setItem(i, j, item)
+        def finished(completed):
+            if completed:
+                QMessageBox.information(self, self.tr_text('success'),
+                                      f"{table.capitalize()} exported successfully!")
+
+        def failed(error):
+            QMessageBox.critical(self, self.tr_text('error'),
+                               f"Error exporting file: {str(error)}")
 
-            self.customers_table.setSortingEnabled(True)
+        return self.start_job(f"Export {table}: {os.path.basename(file_name)}",
+                              lambda job: export_frame(frame, file_name, table, job=job),
+                              on_finished=finished, on_failed=failed)
+
+    def update_customers_table(self):
+        try:
+            with perf.timed('table_refresh', table='customers',
+                            rows=len(self.customers_data)):
+                self.customers_model.set_frame(self.customers_data)
+                self.customers_table.resizeColumnsToContents()
         except Exception as e:
             QMessageBox.critical(self, self.tr_text('error'),
                                f"Error updating table: {str(e)}")
     def update_products_table(self):
         try:
-            self.products_table.setRowCount(len(self.products_data))
-            self.products_table.setColumnCount(len(self.products_data.columns))
-            self.products_table.setHorizontalHeaderLabels(self.products_data.columns)
-
-            header = self.products_table.horizontalHeader()
-            for i in range(len(self.products_data.columns)):
-                header.setSectionResizeMode(i, QHeaderView.ResizeToContents)
-
-            for i in range(len(self.products_data)):
-                for j in range(len(self.products_data.columns)):
-                    item = QTableWidgetItem(str(self.products_data.iloc[i, j]))
-                    self.products_table.setItem(i, j, item)
-
-            self.products_table.setSortingEnabled(True)
+            with perf.timed('table_refresh', table='products',
+                            rows=len(self.products_data)):
+                self.products_model.set_frame(self.products_data)
+                self.products_table.resizeColumnsToContents()
         except Exception as e:
             QMessageBox.critical(self, self.tr_text('error'),
                                f"Error updating table: {str(e)}")
 
     def save_data(self):
-        try:
-            data = {
-                'customers': self.customers_data.to_dict('records'),
-                'products': self.products_data.to_dict('records')
-            }
-            with open(self.data_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            QMessageBox.critical(self, self.tr_text('error'),
-                               f"Error saving data: {str(e)}")
+        # Every change to the tables lands here. The save itself is deferred
+        # and coalesced by SaveScheduler; it writes only the journal entries
+        # recorded since the last save, and the snapshot is rebuilt in the
+        # background once the journal is large.
+        self.saver.mark_dirty()
+
+    def show_skeleton(self):
+        for table in ('customers', 'products'):
+            self.table_model(table).set_frame(
+                pd.DataFrame(index=range(SKELETON_ROWS), columns=EXPORT_COLUMNS[table]))
 
     def load_saved_data(self):
-        try:
-            if os.path.exists(self.data_file):
-                with open(self.data_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    self.customers_data = pd.DataFrame(data.get('customers', []))
-                    self.products_data = pd.DataFrame(data.get('products', []))
-                    self.update_customers_table()
-                    self.update_products_table()
-        except Exception as e:
+        # The store is read, typed and indexed on a worker thread; the tabs
+        # stay disabled over the skeleton tables until the data is in
+        self.startup.mark('first paint')
+        self.tab_widget.setEnabled(False)
+        self.statusBar().showMessage("Loading data...")
+
+        def finished(_):
+            self.startup.mark('load')
+            self.update_customers_table()
+            self.update_products_table()
+            self.tab_widget.setEnabled(True)
+            self.statusBar().clearMessage()
+            self.refresh_analytics(force=True)
+            self.refresh_filter_choices()
+            self.rebuild_search_index()
+            self.startup.mark('tables')
+            perf.emit({'operation': 'startup', 'seconds': round(self.startup.total(), 6),
+                       'phases': {phase: round(seconds, 6)
+                                  for phase, seconds in self.startup.phases}})
+            if os.environ.get('CRM_STARTUP_TIMING'):
+                print(f"Startup: {self.startup.summary()}", file=sys.stderr)
+
+        def failed(error):
+            self.update_customers_table()
+            self.update_products_table()
+            self.tab_widget.setEnabled(True)
+            self.statusBar().clearMessage()
             QMessageBox.warning(self, self.tr_text('warning'),
-                              f"Error loading data: {str(e)}")
+                              f"Error loading data: {str(error)}")
+
+        return self.start_job("Load data", lambda job: self.data.load(),
+                              on_finished=finished, on_failed=failed,
+                              show_in_panel=False)
 
     def tr_text(self, key):
         return self.translations[self.current_language].get(key, key)
@@ -833,7 +1893,12 @@ class CRMDashboard(QMainWindow):
 
     def closeEvent(self, event):
         try:
-            self.save_data()
+            # Stop running jobs and write everything synchronously before exit
+            self.jobs_panel.cancel_all()
+            self.thread_pool.waitForDone()
+            self.saver.flush_now()
+            self.data.close()
+            self.diagnostics_panel.detach()
             event.accept()
         except Exception as e:
             QMessageBox.critical(self, self.tr_text('error'),
@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import crm
+
+
+@pytest.mark.parametrize('argv', [
+    ['import', 'customers', 'customers.csv', '--workers', '0'],
+    ['dedup', '--workers', '-1'],
+    ['stock', 'feed.csv', '--flush-every', '0'],
+    ['low-stock', '--limit', '0'],
+    ['low-stock', '--limit', 'all'],
+])
+def test_counts_must_be_positive(argv, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        crm.build_parser().parse_args(argv)
+    assert exit_info.value.code == 2
+    assert 'expected a positive whole number' in capsys.readouterr().err
+
+
+def test_positive_counts_are_accepted():
+    args = crm.build_parser().parse_args(['dedup', '--workers', '3'])
+    assert args.workers == 3
@@ -0,0 +1,110 @@
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from crm_core import CRMData
+
+
+def import_rows(data, tmp_path, name, rows, mode):
+    file_name = str(tmp_path / name)
+    pd.DataFrame(rows).to_csv(file_name, index=False)
+    return data.import_file('customers', file_name, mode)[0]
+
+
+def test_appended_customer_id_collision_gets_a_new_id(tmp_path):
+    data_file = str(tmp_path / 'crm.db')
+    data = CRMData(data_file)
+    data.load()
+    import_rows(data, tmp_path, 'a.csv',
+                [{'name': 'A', 'email': 'a@example.com', 'phone': '+201000000001'}], 'upsert')
+    assert data.customers['customer_id'].tolist() == ['CUS000001']
+
+    # B arrives with A's ID; append keeps it as a separate customer
+    import_rows(data, tmp_path, 'b.csv',
+                [{'name': 'B', 'email': 'b@example.com', 'phone': '+201000000002',
+                  'customer_id': 'CUS000001'},
+                 {'name': 'C', 'email': 'c@example.com', 'phone': '+201000000003',
+                  'customer_id': 'CUS000001'}], 'append')
+    ids = data.customers['customer_id'].tolist()
+    assert ids[0] == 'CUS000001'
+    assert len(set(ids)) == 3
+
+    # Updating B must leave A alone, in memory and in the store
+    summary = import_rows(data, tmp_path, 'b2.csv',
+                          [{'name': 'B2', 'email': 'b@example.com',
+                            'phone': '+201000000002'}], 'upsert')
+    assert summary['updated'] == 1
+    data.flush()
+    data.close()
+
+    data = CRMData(data_file)
+    data.load()
+    assert data.customers['name'].tolist() == ['A', 'B2', 'C']
+    data.close()
+
+
+def test_rows_matching_one_customer_update_it_once(tmp_path):
+    data = CRMData(str(tmp_path / 'crm.db'))
+    data.load()
+    import_rows(data, tmp_path, 'a.csv',
+                [{'name': 'A', 'email': 'a@example.com', 'phone': '+201000000001'}], 'upsert')
+
+    # Both rows match A (by email and by phone); the first one wins
+    summary = import_rows(data, tmp_path, 'a2.csv',
+                          [{'name': 'A2', 'email': 'a@example.com', 'phone': '+201000000009'},
+                           {'name': 'A3', 'email': 'z@example.com', 'phone': '+201000000001'}],
+                          'upsert')
+    assert summary == {'inserted': 0, 'updated': 1, 'skipped': 1}
+    assert data.customers['name'].tolist() == ['A2']
+    data.close()
+
+
+def add_customers(data, *names):
+    for number, name in enumerate(names):
+        data.add_customer({'name': name, 'email': f'{name.lower()}@example.com',
+                           'phone': f'+20100000{len(data.customers) + number:04d}'})
+
+
+def test_high_water_mark_survives_reloads_and_deletes(tmp_path):
+    data_file = str(tmp_path / 'crm.json')
+    data = CRMData(data_file)
+    data.load()
+    add_customers(data, 'A', 'B', 'C')
+    # Merging C into B deletes CUS000003; its number is never handed out again
+    assert data.merge_duplicates([[1, 2]]) == 1
+    data.flush()
+    data.close()
+
+    data = CRMData(data_file)
+    data.load()
+    add_customers(data, 'D')
+    assert data.customers['customer_id'].tolist() == ['CUS000001', 'CUS000002', 'CUS000004']
+
+    # Imported IDs raise the mark too
+    import_rows(data, tmp_path, 'e.csv',
+                [{'name': 'E', 'email': 'e@example.com', 'phone': '+201000000099',
+                  'customer_id': 'CUS000050'}], 'upsert')
+    data.flush()
+    data.close()
+
+    data = CRMData(data_file)
+    data.load()
+    assert data.customer_ids.high_water == 50
+    add_customers(data, 'F')
+    assert data.customers['customer_id'].tolist()[-1] == 'CUS000051'
+    data.close()
+
+
+def test_allocator_starts_above_ids_of_an_old_store(tmp_path):
+    # A store written before the mark was persisted has no customer_id_seq
+    data_file = str(tmp_path / 'crm.json')
+    with open(data_file, 'w', encoding='utf-8') as f:
+        f.write('{"customers": [{"customer_id": "CUS000007", "name": "A", '
+                '"email": "a@example.com", "phone": "+201000000001"}], "products": []}')
+    data = CRMData(data_file)
+    data.load()
+    add_customers(data, 'B')
+    assert data.customers['customer_id'].tolist() == ['CUS000007', 'CUS000008']
+    data.close()
@@ -0,0 +1,44 @@
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from crm_core import find_duplicate_customers
+
+
+class StubJob:
+    # Cancelled once it has been asked cancel_after times
+    def __init__(self, cancel_after):
+        self.checks = 0
+        self.cancel_after = cancel_after
+        self.reports = []
+
+    def cancelled(self):
+        self.checks += 1
+        return self.checks > self.cancel_after
+
+    def report(self, fraction, text):
+        self.reports.append(fraction)
+
+
+def customers():
+    return pd.DataFrame({
+        'name': ['Ahmed Ali', 'Ahmad Ali', 'Sara Hassan', 'Omar Said'],
+        'email': ['ahmed@example.com', 'ahmed@example.com', 'sara@example.com',
+                  'omar@example.com'],
+        'phone': ['+201000000001', '+201000000001', '+201000000003', '+201000000004'],
+    })
+
+
+def test_duplicates_are_clustered():
+    clusters = find_duplicate_customers(customers(), workers=1)
+    assert [positions.tolist() for positions, _ in clusters] == [[0, 1]]
+
+
+def test_cancelled_search_returns_none():
+    for cancel_after in range(3):
+        job = StubJob(cancel_after)
+        assert find_duplicate_customers(customers(), workers=1, job=job) is None
+    job = StubJob(cancel_after=100)
+    assert len(find_duplicate_customers(customers(), workers=1, job=job)) == 1
@@ -0,0 +1,46 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import crm
+from crm_core import UnsupportedFileError, iter_import_chunks
+
+CUSTOMERS = pd.DataFrame({'name': ['A', 'B'], 'email': ['a@example.com', 'b@example.com'],
+                          'phone': ['+201000000001', '+201000000002']})
+
+
+def run(tmp_path, *argv):
+    return crm.main(['--data', str(tmp_path / 'crm.db'), *argv])
+
+
+@pytest.mark.parametrize('extension', ['.csv', '.jsonl', '.parquet', '.xlsx'])
+def test_exported_files_import_back(tmp_path, capsys, extension):
+    source = str(tmp_path / 'customers.csv')
+    CUSTOMERS.to_csv(source, index=False)
+    exported = str(tmp_path / ('export' + extension))
+    assert run(tmp_path, 'import', 'customers', source) == 0
+    assert run(tmp_path, 'export', 'customers', exported) == 0
+    os.remove(str(tmp_path / 'crm.db'))
+    assert run(tmp_path, 'import', 'customers', exported) == 0
+    assert f"{exported}: 2 inserted" in capsys.readouterr().out
+
+
+def test_unsupported_file_type_is_rejected(tmp_path, capsys):
+    file_name = str(tmp_path / 'customers.txt')
+    CUSTOMERS.to_csv(file_name, index=False)
+    with pytest.raises(UnsupportedFileError):
+        next(iter_import_chunks(file_name, ['name']))
+    assert run(tmp_path, 'import', 'customers', file_name) == 1
+    assert "Unsupported file type '.txt'" in capsys.readouterr().err
+
+
+def test_unreadable_or_missing_file_is_an_error(tmp_path, capsys):
+    file_name = str(tmp_path / 'customers.csv')
+    with open(file_name, 'wb') as f:
+        f.write(b'name,email,phone\n\xb5\xff\xfe,a@example.com,1\n')
+    assert run(tmp_path, 'import', 'customers', file_name) == 1
+    assert run(tmp_path, 'import', 'customers', str(tmp_path / 'missing.csv')) == 1
+    assert capsys.readouterr().err.count('error: ') == 2
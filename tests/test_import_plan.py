@@ -0,0 +1,62 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from crm_core import CustomerIndex
+
+EXISTING = pd.DataFrame({
+    'customer_id': ['CUS000001', 'CUS000002', 'CUS000003'],
+    'email': ['a@example.com', 'b@example.com', 'c@example.com'],
+    'phone': ['+201000000001', '+201000000002', '+201000000003'],
+})
+
+CHUNK = pd.DataFrame({
+    'customer_id': [None, None, 'CUS000003', None, None, None, None],
+    'email': [' A@Example.com ', 'x@example.com', 'z@example.com', 'new@example.com',
+              'NEW@example.com', 'y@example.com', 'b@example.com'],
+    'phone': ['+201000000099', '201000000002', '+201000000098', '+201000000097',
+              '+201000000096', '+201000000095', '+201000000094'],
+})
+# Row by row: A by email (case and spaces ignored), B by phone digits, C by
+# ID, a new customer, the same new customer again, another new one, and B a
+# second time (by email)
+
+
+def plan(mode):
+    index = CustomerIndex()
+    index.rebuild(EXISTING)
+    insert_mask, targets, rows = index.plan(CHUNK, mode, len(EXISTING))
+    return insert_mask.tolist(), targets, rows
+
+
+def test_upsert_updates_each_match_once_and_inserts_the_rest():
+    insert_mask, targets, rows = plan('upsert')
+    assert insert_mask == [False, False, False, True, False, True, False]
+    assert targets == [0, 1, 2]
+    assert rows == [0, 1, 2]
+
+
+def test_skip_leaves_matches_alone():
+    insert_mask, targets, rows = plan('skip')
+    assert insert_mask == [False, False, False, True, False, True, False]
+    assert targets == [] and rows == []
+
+
+def test_append_inserts_every_row():
+    insert_mask, targets, rows = plan('append')
+    assert insert_mask == [True] * len(CHUNK)
+    assert targets == [] and rows == []
+
+
+@pytest.mark.parametrize('mode', ['upsert', 'skip'])
+def test_rows_without_any_key_are_inserted(mode):
+    index = CustomerIndex()
+    index.rebuild(EXISTING)
+    chunk = pd.DataFrame({'customer_id': [None, None], 'email': [None, None],
+                          'phone': [None, None]})
+    insert_mask, targets, _ = index.plan(chunk, mode, len(EXISTING))
+    assert insert_mask.tolist() == [True, True]
+    assert targets == []
@@ -0,0 +1,31 @@
+import os
+import random
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from crm_core import ProductIndex
+
+
+def brute_force_low_stock(units, threshold, limit=None):
+    rows = sorted((level, product_id) for product_id, level in units.items()
+                  if level <= threshold)
+    return [(product_id, level) for level, product_id in rows][:limit]
+
+
+def test_low_stock_follows_stock_changes():
+    rng = random.Random(7)
+    ids = [f"P{number:04d}" for number in range(500)]
+    products = pd.DataFrame({'product_id': ids,
+                             'stock': [rng.randint(0, 40) for _ in ids],
+                             'price': 1.0})
+    index = ProductIndex()
+    index.rebuild(products.iloc[:300])
+    index.add_rows(products.iloc[300:], 300)
+    for _ in range(2000):
+        index.set_units(rng.choice(ids), rng.randint(-5, 40))
+    assert index.levels == sorted(index.by_units)
+    for threshold, limit in [(10, None), (0, None), (-1, None), (15, 7), (100, None)]:
+        assert (index.low_stock(threshold, limit)
+                == brute_force_low_stock(index.units, threshold, limit))
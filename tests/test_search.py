@@ -0,0 +1,65 @@
+import os
+import random
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from crm_core import SEARCH_FIELDS, SearchIndex, normalize_phones, search_tokens
+
+WORDS = ['ahmed', 'ahmad', 'sara', 'omar', 'mona', 'cairo', 'giza', 'alex', 'retail',
+         'أحمد', 'احمد', 'سارة', 'القاهرة', 'Ali', 'ALIA', 'o\'neil']
+
+
+def random_customers(rng, count):
+    def text():
+        return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(0, 3))) or None
+    return pd.DataFrame({
+        'name': [text() for _ in range(count)],
+        'email': [f"{rng.choice(WORDS[:9])}{n}@example.com" for n in range(count)],
+        'phone': [f"+20 100 {rng.randint(0, 9999999):07d}" for _ in range(count)],
+        'city': [text() for _ in range(count)],
+        'notes': [text() for _ in range(count)],
+    })
+
+
+def row_tokens(frame):
+    # Tokens of each row, from the searched fields one cell at a time
+    frame = frame.assign(phone=normalize_phones(frame['phone'].to_numpy()).to_numpy())
+    fields = [field for field in SEARCH_FIELDS if field in frame.columns]
+    return [search_tokens(' '.join(str(value) for value in row if pd.notna(value)))
+            for row in frame[fields].itertuples(index=False)]
+
+
+def brute_force(tokens_by_row, query):
+    terms = set(search_tokens(query))
+    return [position for position, tokens in enumerate(tokens_by_row)
+            if all(any(token.startswith(term) for token in tokens) for term in terms)]
+
+
+def test_search_matches_a_full_scan():
+    rng = random.Random(11)
+    frame = random_customers(rng, 1500)
+    index = SearchIndex()
+    index.build(frame)
+
+    # A small chunk goes to the delta index, a large one becomes a segment
+    for extra in (random_customers(rng, 20), random_customers(rng, 1200)):
+        index.add_rows(extra, len(frame))
+        frame = pd.concat([frame, extra], ignore_index=True)
+
+    # Edited rows must drop their old tokens
+    positions = rng.sample(range(len(frame)), 50)
+    edits = random_customers(rng, len(positions))
+    for column in edits.columns:
+        frame.loc[positions, column] = edits[column].to_numpy()
+    index.update_rows(frame.iloc[positions], positions)
+
+    queries = ['ahm', 'sara cairo', 'احمد', 'أحمد القاه', 'al giz', 'o neil', 'RETAIL',
+               '201001', 'ahmed3', 'nomatch', 'a s']
+    queries += [' '.join(word[:rng.randint(1, len(word))] for word in rng.sample(WORDS, 2))
+                for _ in range(20)]
+    tokens_by_row = row_tokens(frame)
+    for query in queries:
+        assert index.search(query).tolist() == brute_force(tokens_by_row, query), query
+    assert index.search('  ') is None
@@ -0,0 +1,90 @@
+import json
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from crm_core import LEGACY_DATA_FILE, apply_schema, open_store
+
+
+def write_legacy_store(directory):
+    with open(os.path.join(directory, LEGACY_DATA_FILE), 'w', encoding='utf-8') as f:
+        json.dump({'customers': [{'customer_id': 'CUS000001', 'name': 'A'}],
+                   'products': [{'product_id': 'P1', 'name': 'Pen'}],
+                   'meta': {'customer_id_seq': 1}}, f)
+
+
+def test_new_sqlite_store_is_seeded_on_load(tmp_path):
+    write_legacy_store(str(tmp_path))
+    store = open_store(str(tmp_path / 'crm.db'))
+    # Opening the store must not read the JSON file yet
+    assert store.columns['customers'] == []
+    customers, products = store.load()
+    assert customers['name'].tolist() == ['A']
+    assert products['product_id'].tolist() == ['P1']
+    assert store.meta['customer_id_seq'] == 1
+    store.close()
+
+    store = open_store(str(tmp_path / 'crm.db'))
+    customers, _ = store.load()
+    assert customers['name'].tolist() == ['A']
+    store.close()
+
+
+def customers(*rows):
+    return apply_schema(pd.DataFrame([dict(zip(['customer_id', 'name', 'city'], row))
+                                      for row in rows]), 'customers')
+
+
+def reopen(store):
+    store.close()
+    store = open_store(store.data_file, seed=False)
+    customers, products = store.load()
+    return store, customers, products
+
+
+def rows(frame):
+    frame = frame[['customer_id', 'name', 'city']].astype(object)
+    return [tuple(None if pd.isna(value) else value for value in row)
+            for row in frame.itertuples(index=False)]
+
+
+@pytest.mark.parametrize('extension', ['.json', '.arrow', '.db'])
+def test_updates_and_deletes_replay_across_compaction(tmp_path, extension):
+    store = open_store(str(tmp_path / ('crm' + extension)), seed=False)
+    store.load()
+    store.record_insert('customers', customers(('CUS1', 'A', 'Cairo'), ('CUS2', 'B', 'Giza'),
+                                               ('CUS3', 'C', None)))
+    store.record_insert('products', apply_schema(pd.DataFrame({'product_id': ['P1'],
+                                                               'stock': [5]}), 'products'))
+    store.record_update('customers', 'customer_id', customers(('CUS2', 'B2', 'Giza')))
+    store.record_delete('customers', 'customer_id', ['CUS1'])
+    store.record_insert('customers', customers(('CUS4', 'D', None)))
+    store.record_update_records('customers', 'customer_id',
+                                [{'customer_id': 'CUS4', 'city': 'Alexandria'}])
+    store.record_update_records('products', 'product_id', [{'product_id': 'P1', 'stock': 3}])
+    store.record_meta('customer_id_seq', 4)
+    store.flush()
+
+    expected = [('CUS2', 'B2', 'Giza'), ('CUS3', 'C', None), ('CUS4', 'D', 'Alexandria')]
+    store, loaded, products = reopen(store)
+    assert rows(loaded) == expected
+    assert products['stock'].tolist() == [3]
+    assert store.meta['customer_id_seq'] == 4
+
+    # The snapshot holds everything so far; later changes replay on top of it
+    store.compact(loaded, products)
+    store, loaded, products = reopen(store)
+    assert rows(loaded) == expected
+    store.record_update('customers', 'customer_id', customers(('CUS3', 'C2', 'Luxor')))
+    store.record_delete('customers', 'customer_id', ['CUS4'])
+    store.record_meta('customer_id_seq', 5)
+    store.flush()
+
+    store, loaded, products = reopen(store)
+    assert rows(loaded) == [('CUS2', 'B2', 'Giza'), ('CUS3', 'C2', 'Luxor')]
+    assert products['stock'].tolist() == [3]
+    assert store.meta['customer_id_seq'] == 5
+    store.close()
@@ -0,0 +1,59 @@
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from crm_core import CRMData, normalize_phone_numbers, validate_customers
+
+
+def test_phone_numbers_are_normalized_to_e164():
+    values = ['+20 100 123 4567', '0020-100-123-4567', '201001234567', '+20 (100) 123.4567']
+    normalized, invalid = normalize_phone_numbers(values, country_code=None)
+    assert normalized.tolist() == ['+201001234567'] * 4
+    assert not invalid.any()
+
+
+def test_national_phone_numbers_need_a_country_code():
+    values = ['01001234567', '0123 456 789']
+    normalized, invalid = normalize_phone_numbers(values, country_code=None)
+    assert invalid.tolist() == [True, True]
+    normalized, invalid = normalize_phone_numbers(values, country_code='20')
+    assert normalized.tolist() == ['+201001234567', '+20123456789']
+    assert not invalid.any()
+
+
+def test_invalid_phone_numbers_are_rejected():
+    _, invalid = normalize_phone_numbers(['12345', '+2010012345678901', 'call me', None],
+                                         country_code=None)
+    assert invalid.tolist() == [True, True, True, False]
+
+
+def test_validate_customers_reports_each_bad_row():
+    frame = pd.DataFrame({
+        'name': ['A', None, 'C', 'D'],
+        'email': ['a@example.com', 'b@example.com', 'not an email', 'd@example.com'],
+        'phone': ['+201000000001', '+201000000002', '+201000000003', '+201000000004'],
+        'category': ['retail', 'Retail', 'Retail', 'Farming'],
+    })
+    rows, rejected = validate_customers(frame, first_row=2)
+    assert rows['name'].tolist() == ['A']
+    assert rows['category'].tolist() == ['Retail']
+    assert rejected['row'].tolist() == [3, 4, 5]
+    assert rejected['errors'].tolist() == ['name is required', 'invalid email format',
+                                           'unknown category']
+
+
+def test_csv_import_keeps_leading_zeros(tmp_path):
+    file_name = str(tmp_path / 'customers.csv')
+    with open(file_name, 'w') as f:
+        f.write('name,email,phone\n'
+                'A,a@example.com,+201001234567\n'
+                'B,b@example.com,01001234568\n')
+    data = CRMData(str(tmp_path / 'crm.db'))
+    data.load()
+    summary, rejected = data.import_file('customers', file_name, 'upsert')
+    assert summary['inserted'] == 1
+    assert rejected['phone'].tolist() == ['01001234568']
+    assert data.customers['phone'].tolist() == ['+201001234567']
+    data.close()